@@ -1,27 +1,31 @@
 import os
+import asyncio
 import logging
 import json
 import random
+import httpx
 import requests
-from config import MISTRAL_API_KEY
-from rag_engine import generate_context_for_query
+from config import MISTRAL_API_KEY, MISTRAL_READ_TIMEOUT, CONTEXT_TOKEN_BUDGET, CASE_TOPICS
+from rag_engine import generate_context_for_query, INDEX_LOADING_MESSAGE
+from mistral_client import get_mistral_client, get_async_mistral_client, iter_stream_deltas, run_concurrently
+from rate_limiter import RateLimitTimeout, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from llm_cache import get_response_cache, response_cache_key
+from corpus_registry import get_corpus_version
 
 logger = logging.getLogger(__name__)
 
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+class AIStreamError(Exception):
+    """A streamed response failed before it was complete; the message is fit to show to users."""
 
-def generate_ai_response(messages, temperature=0.7, max_tokens=1000):
-    """Generate a response from Mistral AI."""
-    # Check if API key is set to a valid value
-    if MISTRAL_API_KEY in ["YOUR_MISTRAL_API_KEY", "", None]:
-        logger.warning("Mistral API key not configured. Using fallback response.")
-        return "API key not configured. Please provide a valid Mistral API key in the environment variables."
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {MISTRAL_API_KEY}"
-    }
-    
+RATE_LIMIT_MESSAGE = "API rate limit exceeded. The system is currently handling too many requests. Please try again in a few minutes."
+
+def prepare_ai_request(messages, temperature, max_tokens, cache):
+    """
+    Build the request body of a chat completion and look it up in the LLM response cache.
+
+    Returns:
+        tuple: (payload, response cache or None, cache key, cached response or None)
+    """
     payload = {
         "model": "mistral-medium",
         "messages": messages,
@@ -29,50 +33,97 @@ def generate_ai_response(messages, temperature=0.7, max_tokens=1000):
         "max_tokens": max_tokens
     }
     
+    # Identical prompts against the same guidelines get the cached answer
+    response_cache = get_response_cache() if cache else None
+    cache_key = None
+    cached_response = None
+    if response_cache is not None:
+        cache_key = response_cache_key(payload["model"], messages, temperature, max_tokens, get_corpus_version())
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("Serving Mistral AI response from the LLM response cache")
+    
     # Log entire request for debugging (without API key)
     debug_payload = payload.copy()
     logger.debug(f"Payload: {json.dumps(debug_payload)}")
+    return payload, response_cache, cache_key, cached_response
+
+def read_ai_response(response, response_cache=None, cache_key=None):
+    """
+    Get the completion text out of a Mistral API response (requests or httpx).
+
+    Returns:
+        str: the completion, or a fallback message describing what went wrong
+    """
+    # Check for HTTP errors
+    if response.status_code != 200:
+        error_message = "Error connecting to AI service. Please try again later."
+        
+        # Add specific handling for rate limiting errors
+        if response.status_code == 429:
+            logger.error(f"Mistral API rate limit exceeded: {response.text}")
+            error_message = RATE_LIMIT_MESSAGE
+        else:
+            logger.error(f"Mistral API error: Status {response.status_code}, Response: {response.text}")
+        
+        # Return a more specific fallback message
+        return error_message
     
+    # Parse the response
     try:
-        # Log request for debugging
-        logger.info(f"Making API request to Mistral AI with {len(messages)} messages")
-        
-        # Direct API call to Mistral AI with shorter timeout
-        response = requests.post(MISTRAL_API_URL, headers=headers, json=payload, timeout=30)
+        response_json = response.json()
         
-        # Check for HTTP errors
-        if response.status_code != 200:
-            error_message = "Error connecting to AI service. Please try again later."
-            
-            # Add specific handling for rate limiting errors
-            if response.status_code == 429:
-                logger.error(f"Mistral API rate limit exceeded: {response.text}")
-                error_message = "API rate limit exceeded. The system is currently handling too many requests. Please try again in a few minutes."
-            else:
-                logger.error(f"Mistral API error: Status {response.status_code}, Response: {response.text}")
-            
-            # Return a more specific fallback message
-            return error_message
+        # Log response for debugging (useful for understanding API structure)
+        logger.debug(f"Mistral API raw response: {json.dumps(response_json)}")
         
-        # Parse the response
-        try:
-            response_json = response.json()
-            
-            # Log response for debugging (useful for understanding API structure)
-            logger.debug(f"Mistral API raw response: {json.dumps(response_json)}")
-            
-            if not response_json.get("choices") or len(response_json["choices"]) == 0:
-                logger.error(f"Mistral API returned no choices: {response_json}")
-                # Return a fallback message instead of None
-                return "AI service returned an incomplete response. Please try again later."
-                
-            return response_json["choices"][0]["message"]["content"]
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}. Raw response: {response.text}")
+        if not response_json.get("choices") or len(response_json["choices"]) == 0:
+            logger.error(f"Mistral API returned no choices: {response_json}")
             # Return a fallback message instead of None
-            return "Error processing AI response. Please try again later."
+            return "AI service returned an incomplete response. Please try again later."
+        
+        content = response_json["choices"][0]["message"]["content"]
+        # Only real completions are cached, never the fallback messages
+        if response_cache is not None and content:
+            response_cache.set(cache_key, content)
+        return content
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse JSON response: {e}. Raw response: {response.text}")
+        # Return a fallback message instead of None
+        return "Error processing AI response. Please try again later."
+
+def generate_ai_response(messages, temperature=0.7, max_tokens=1000, timeout=MISTRAL_READ_TIMEOUT, cache=True,
+                         priority=PRIORITY_INTERACTIVE):
+    """
+    Generate a response from Mistral AI.
+
+    Args:
+        timeout (float): seconds to wait for the completion
+        cache (bool): serve and store the response in the LLM response cache;
+            pass False for generations that should differ on every call
+        priority (int): rate limiter priority; pass PRIORITY_BACKGROUND for
+            work no user is waiting on, so it yields to chat and simulations
+    """
+    # Check if API key is set to a valid value
+    if MISTRAL_API_KEY in ["YOUR_MISTRAL_API_KEY", "", None]:
+        logger.warning("Mistral API key not configured. Using fallback response.")
+        return "API key not configured. Please provide a valid Mistral API key in the environment variables."
+    
+    payload, response_cache, cache_key, cached_response = prepare_ai_request(messages, temperature, max_tokens, cache)
+    if cached_response is not None:
+        return cached_response
+    
+    try:
+        # Log request for debugging
+        logger.info(f"Making API request to Mistral AI with {len(messages)} messages")
+        
+        # Pooled keep-alive connection; 429/5xx answers are retried with backoff
+        response = get_mistral_client().post_chat(payload, timeout=timeout, priority=priority)
+        return read_ai_response(response, response_cache, cache_key)
+    except RateLimitTimeout:
+        logger.error("No Mistral API rate limit slot became free in time")
+        return RATE_LIMIT_MESSAGE
     except requests.exceptions.Timeout:
-        logger.error("Mistral API request timed out after 30 seconds")
+        logger.error(f"Mistral API request timed out after {timeout} seconds")
         # Return a fallback message instead of None
         return "AI service request timed out. Please try again later."
     except requests.exceptions.RequestException as e:
@@ -84,16 +135,122 @@ def generate_ai_response(messages, temperature=0.7, max_tokens=1000):
         # Return a fallback message instead of None
         return "Unexpected error with AI service. Please try again later."
 
-def get_diagnosis_response(user_query):
-    """Get an AI diagnosis response based on the user query."""
+def stream_ai_response(messages, temperature=0.7, max_tokens=1000, timeout=MISTRAL_READ_TIMEOUT, cache=True,
+                       priority=PRIORITY_INTERACTIVE):
+    """
+    Generate a response from Mistral AI, yielding the text as the API streams it.
+
+    A cached response comes back as a single piece, and a completed stream
+    is stored in the cache.
+
+    Yields:
+        str: pieces of the response text
+
+    Raises:
+        AIStreamError: if the call fails, possibly after some pieces were
+            yielded, with the fallback message generate_ai_response would return
+    """
+    if MISTRAL_API_KEY in ["YOUR_MISTRAL_API_KEY", "", None]:
+        logger.warning("Mistral API key not configured. Using fallback response.")
+        yield "API key not configured. Please provide a valid Mistral API key in the environment variables."
+        return
+    
+    payload, response_cache, cache_key, cached_response = prepare_ai_request(messages, temperature, max_tokens, cache)
+    if cached_response is not None:
+        yield cached_response
+        return
+    payload["stream"] = True
+    
+    pieces = []
+    error_message = None
+    try:
+        logger.info(f"Making streaming API request to Mistral AI with {len(messages)} messages")
+        response = get_mistral_client().post_chat(payload, timeout=timeout, stream=True, priority=priority)
+        try:
+            if response.status_code != 200:
+                error_message = read_ai_response(response)
+            else:
+                for piece in iter_stream_deltas(response):
+                    pieces.append(piece)
+                    yield piece
+        finally:
+            response.close()
+    except RateLimitTimeout:
+        logger.error("No Mistral API rate limit slot became free in time")
+        error_message = RATE_LIMIT_MESSAGE
+    except requests.exceptions.Timeout:
+        logger.error(f"Mistral API stream timed out after {timeout} seconds")
+        error_message = "AI service request timed out. Please try again later."
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error streaming from Mistral API: {e}")
+        error_message = "Network error connecting to AI service. Please try again later."
+    except Exception as e:
+        logger.error(f"Error streaming AI response: {e}")
+        error_message = "Unexpected error with AI service. Please try again later."
+    
+    if error_message:
+        # Reported apart from the text, so a partial answer is never passed
+        # off as a complete one
+        raise AIStreamError(error_message)
+    if response_cache is not None and pieces:
+        response_cache.set(cache_key, "".join(pieces))
+
+async def generate_ai_response_async(messages, temperature=0.7, max_tokens=1000, timeout=MISTRAL_READ_TIMEOUT, cache=True,
+                                     priority=PRIORITY_INTERACTIVE):
+    """
+    Generate a response from Mistral AI on the background event loop; see generate_ai_response.
+
+    Run it through run_concurrently() to issue several calls at once.
+    """
+    if MISTRAL_API_KEY in ["YOUR_MISTRAL_API_KEY", "", None]:
+        logger.warning("Mistral API key not configured. Using fallback response.")
+        return "API key not configured. Please provide a valid Mistral API key in the environment variables."
+    
+    # The response cache reads and writes SQLite, so it runs in a thread to keep
+    # a slow or locked cache from stalling every call on the event loop
+    payload, response_cache, cache_key, cached_response = await asyncio.to_thread(
+        prepare_ai_request, messages, temperature, max_tokens, cache
+    )
+    if cached_response is not None:
+        return cached_response
+    
+    try:
+        logger.info(f"Making async API request to Mistral AI with {len(messages)} messages")
+        response = await get_async_mistral_client().post_chat(payload, timeout=timeout, priority=priority)
+        return await asyncio.to_thread(read_ai_response, response, response_cache, cache_key)
+    except RateLimitTimeout:
+        logger.error("No Mistral API rate limit slot became free in time")
+        return RATE_LIMIT_MESSAGE
+    except httpx.TimeoutException:
+        logger.error(f"Mistral API request timed out after {timeout} seconds")
+        return "AI service request timed out. Please try again later."
+    except httpx.HTTPError as e:
+        logger.error(f"Error making request to Mistral API: {e}")
+        return "Network error connecting to AI service. Please try again later."
+    except Exception as e:
+        logger.error(f"Error generating AI response: {e}")
+        return "Unexpected error with AI service. Please try again later."
+
+def build_diagnosis_messages(user_query, context_token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Build the LLM messages that answer a user query from the guidelines.
+
+    Returns:
+        tuple: (messages, None), or (None, response) when the query is
+            answered without an LLM call, e.g. while the guidelines are loading
+    """
     # Generate context from document
-    context = generate_context_for_query(user_query)
+    context = generate_context_for_query(user_query, context_token_budget)
+    
+    # Don't spend an LLM call on an empty context while the guidelines are loading
+    if context == INDEX_LOADING_MESSAGE:
+        return None, context
     
     # Check for specific document loading error messages
     if "could not be loaded in this deployment environment" in context or "could not be accessed" in context:
         logger.error("Document access issue detected in AI response")
-        return ("I'm unable to access the medical knowledge base in this deployment environment. "
-                "This is a limitation of the current serverless setup. Please try the application in its original environment.")
+        return None, ("I'm unable to access the medical knowledge base in this deployment environment. "
+                      "This is a limitation of the current serverless setup. Please try the application in its original environment.")
     
     # Check if it's a treatment or diagnosis query to customize prompt
     query_lower = user_query.lower()
@@ -198,35 +355,50 @@ def get_diagnosis_response(user_query):
         {"role": "system", "content": system_content},
         {"role": "user", "content": user_query}
     ]
+    return messages, None
+
+def get_diagnosis_response(user_query, context_token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Get an AI diagnosis response based on the user query.
+
+    Args:
+        user_query (str): the question to answer from the guidelines
+        context_token_budget (int): maximum estimated tokens of guideline context
+            pasted into the system prompt
+    """
+    messages, response = build_diagnosis_messages(user_query, context_token_budget)
+    if messages is None:
+        return response
     
     # Generate response
     response = generate_ai_response(messages)
     return response
 
+def stream_diagnosis_response(user_query, context_token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Get an AI diagnosis response based on the user query, yielding the text as it arrives.
+
+    Yields:
+        str: pieces of the response text; see stream_ai_response
+    """
+    messages, response = build_diagnosis_messages(user_query, context_token_budget)
+    if messages is None:
+        yield response
+        return
+    yield from stream_ai_response(messages)
+
+async def get_diagnosis_response_async(user_query, context_token_budget=CONTEXT_TOKEN_BUDGET):
+    """Get an AI diagnosis response on the background event loop; see get_diagnosis_response."""
+    # Retrieval is CPU work, so keep it off the event loop
+    messages, response = await asyncio.to_thread(build_diagnosis_messages, user_query, context_token_budget)
+    if messages is None:
+        return response
+    return await generate_ai_response_async(messages)
+
 def generate_case_simulation():
     """Generate a simulated patient case with sequential questions."""
     # Get a random topic from the curated list
-    curated_topics = [
-        "Diarrhoea", "Rotavirus Disease and Diarrhoea", "Constipation", "Peptic Ulcer Disease",
-        "Gastro-oesophageal Reflux Disease", "Haemorrhoids", "Vomiting", "Anaemia", "Measles",
-        "Pertussis", "Common cold", "Pneumonia", "Headache", "Boils", "Impetigo", "Buruli ulcer",
-        "Yaws", "Superficial Fungal Skin infections", "Pityriasis Versicolor", "Herpes Simplex Infections",
-        "Herpes Zoster Infections", "Chicken pox", "Large Chronic Ulcers", "Pruritus", "Urticaria",
-        "Reactive Erythema and Bullous Reaction", "Acne Vulgaris", "Eczema", "Intertrigo", "Diabetes Mellitus",
-        "Diabetic Ketoacidosis", "Diabetes in Pregnancy", "Treatment-Induced Hypoglycemia", "Dyslipidaemia",
-        "Goitre", "Hypothyroidism", "Hyperthyroidism", "Overweight and Obesity", "Dysmenorrhoea",
-        "Abortion", "Abnormal Vaginal Bleeding", "Abnormal Vaginal Discharge", "Acute Lower Abdominal Pain",
-        "Menopause", "Erectile Dysfunction", "Urinary Tract Infection", "Sexually Transmitted Infections in Adults",
-        "Fever", "Tuberculosis", "Typhoid fever", "Malaria", "Uncomplicated Malaria", "Severe Malaria",
-        "Malaria in Pregnancy", "Worm Infestation", "Xerophthalmia", "Foreign body in the eye",
-        "Neonatal conjunctivitis", "Red eye", "Stridor", "Acute Epiglottitis", "Retropharyngeal Abscess",
-        "Pharyngitis and Tonsillitis", "Acute Sinusitis", "Acute otitis Media", "Chronic Otitis Media",
-        "Epistaxis", "Dental Caries", "Oral Candidiasis", "Acute Necrotizing Ulcerative Gingivitis",
-        "Acute Bacterial Sialoadenitis", "Chronic Periodontal Infections", "Mouth Ulcers", "Odontogenic Infections",
-        "Osteoarthritis", "Rheumatoid arthritis", "Juvenile Idiopathic Arthritis", "Back pain", "Gout",
-        "Dislocations", "Open Fractures", "Cellulitis", "Burns", "Wounds", "Bites and Stings",
-        "Shock", "Acute Allergic Reaction"
-    ]
+    curated_topics = CASE_TOPICS
     selected_topic = random.choice(curated_topics)
     logger.info(f"Selected topic for case simulation: {selected_topic}")
     
@@ -276,7 +448,7 @@ def create_medical_case_from_topic(topic, topic_info):
     ]
     
     try:
-        response = generate_ai_response(messages, temperature=0.7)
+        response = generate_ai_response(messages, temperature=0.7, cache=False)
         # Try to parse the JSON from the response
         import json
         
@@ -499,7 +671,7 @@ def create_medical_case():
             {"role": "user", "content": "Generate a realistic medical case with brief patient info, symptoms, and diagnosis."}
         ]
         
-        enriched_case = generate_ai_response(messages, max_tokens=500)
+        enriched_case = generate_ai_response(messages, max_tokens=500, cache=False)
         if enriched_case and len(enriched_case) > 100 and not enriched_case.startswith("Error"):
             # Try to parse and use it if possible
             logger.info("Successfully generated enriched case through AI")
@@ -789,7 +961,7 @@ def generate_daily_challenge():
         {"role": "user", "content": "Create a short daily diagnostic challenge for medical professionals."}
     ]
     
-    response = generate_ai_response(messages)
+    response = generate_ai_response(messages, cache=False, priority=PRIORITY_BACKGROUND)
     
     # Check if the response is a string but not JSON (likely an error message from generate_ai_response)
     if isinstance(response, str) and (response.startswith("Error") or response.startswith("AI service")):
@@ -944,7 +1116,7 @@ def generate_multiple_daily_challenges(count=3):
             {"role": "user", "content": f"Create {count - len(challenges)} different daily diagnostic challenges."}
         ]
         
-        response = generate_ai_response(messages)
+        response = generate_ai_response(messages, cache=False, priority=PRIORITY_BACKGROUND)
         
         if response:
             try:
@@ -1035,7 +1207,7 @@ def generate_flashcards(topic):
             {"role": "user", "content": f"Generate 5 medical flashcards about {topic}."}
         ]
         
-        response = generate_ai_response(messages)
+        response = generate_ai_response(messages, priority=PRIORITY_BACKGROUND)
         
         # Try to parse the JSON response
         if '```json' in response and '```' in response:
@@ -9,6 +9,7 @@ import logging
 import requests
 import json
 from config import MISTRAL_API_KEY
+from mistral_client import get_mistral_client
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +28,6 @@ def validate_mistral_api():
         return False, "API key not configured. Please provide a valid Mistral API key."
     
     # Test endpoint with minimal payload
-    url = "https://api.mistral.ai/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {MISTRAL_API_KEY}"
-    }
-    
     payload = {
         "model": "mistral-medium",
         "messages": [
@@ -44,9 +39,9 @@ def validate_mistral_api():
     }
     
     try:
-        # Make a test request with short timeout
+        # Make a test request with short timeout over the shared connection pool
         logger.info("Testing Mistral API connection")
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        response = get_mistral_client().post_chat(payload, timeout=10)
         
         # Check response status
         if response.status_code == 200:
@@ -73,7 +73,10 @@ import routes  # noqa: F401
 # We'll move document processing initialization to a separate function that can be called
 # from main.py to avoid blocking the app startup
 def initialize_document_and_rag():
+    from readiness import mark_loading, mark_ready, mark_failed
+    
     with app.app_context():
+        mark_loading()
         try:
             from document_processor import initialize_document_processor
             from rag_engine import initialize_rag_engine
@@ -83,13 +86,25 @@ def initialize_document_and_rag():
                 rag_init_success = initialize_rag_engine()
                 if rag_init_success:
                     logger.info("Document processor and RAG engine initialized successfully")
+                    mark_ready()
+                    
+                    # Build the contexts case simulations ask for in one batch
+                    from rag_engine import warm_context_cache
+                    warm_context_cache()
+                    
+                    # Pick up edits to the guideline documents without a restart
+                    from document_reloader import start_document_watcher
+                    start_document_watcher()
                     return True
                 else:
                     logger.warning("RAG engine initialization failed, some features may be limited")
+                    mark_failed("RAG engine initialization failed")
             else:
                 logger.warning("Document processor initialization failed, proceeding with limited functionality")
+                mark_failed("Document processor initialization failed")
         except Exception as e:
             logger.error(f"Error during initialization: {e}")
             logger.info("Application will continue with limited functionality")
+            mark_failed(e)
         
         return False
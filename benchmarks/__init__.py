@@ -0,0 +1,8 @@
+"""
+Retrieval Benchmarks
+
+This package measures how retrieval scales with the size of the guideline
+corpus. Run it with:
+
+    python -m benchmarks.run --scales 1 10 100 1000 --output bench.json
+"""
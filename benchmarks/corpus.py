@@ -0,0 +1,116 @@
+"""
+Benchmark Corpus
+
+This module builds benchmark corpora from the structure of the guide: the
+document lines are replicated as extra chapter volumes, and the result is
+installed into the document processor and RAG engine in place of the loaded
+document.
+"""
+
+import logging
+import os
+import random
+import rag_engine
+from document_processor import extract_text_from_docx, parse_document_structure, classify_line
+from corpus_registry import GuidelineDocument, build_document_index, set_corpus_documents
+from config import DOCUMENT_PATH, PRIMARY_DOCUMENT_ID, CASE_TOPICS
+
+logger = logging.getLogger(__name__)
+
+# Topics per chapter of the seed corpus used when the guide is not available
+SEED_TOPICS_PER_CHAPTER = 8
+
+SEED_WORDS = (
+    "patient treatment therapy dose regimen symptoms diagnosis signs fever pain abdominal "
+    "chronic acute oral tablets daily paracetamol amoxicillin metronidazole omeprazole "
+    "artemether lumefantrine children adults weight hours days refer hospital clinical "
+    "history examination infection bacterial viral management fluids hydration rash skin wound"
+).split()
+
+def build_seed_content(seed=0):
+    """
+    Build a guide-shaped document from the curated case topics.
+
+    Every chapter holds a group of topics, and every topic section has
+    description, symptom and first/second line treatment paragraphs.
+    """
+    rng = random.Random(seed)
+    content = ["Table of Contents"]
+
+    def sentence(length):
+        return " ".join(rng.choice(SEED_WORDS) for _ in range(length))
+
+    for chapter_number, start in enumerate(range(0, len(CASE_TOPICS), SEED_TOPICS_PER_CHAPTER), start=1):
+        content.append(f"Chapter {chapter_number}. Disorders {chapter_number}")
+        content.append(sentence(40).capitalize() + ".")
+        for topic in CASE_TOPICS[start:start + SEED_TOPICS_PER_CHAPTER]:
+            content.append(topic)
+            for _ in range(4):
+                content.append(f"{topic} {sentence(rng.randint(20, 60))}. Symptoms of {topic.lower()}: {sentence(12)}.")
+            content.append(f"1st line: {rng.choice(SEED_WORDS)} 500 mg orally 8 hourly for 5 days for {topic.lower()}.")
+            content.append(f"2nd line: {rng.choice(SEED_WORDS)} 250 mg orally 12 hourly for 7 days, refer if no improvement.")
+    return content
+
+def load_guide_content(document_path=DOCUMENT_PATH):
+    """
+    Load the guide lines to scale, falling back to the seed corpus.
+
+    Returns:
+        tuple: (content, source) where source names where the lines came from
+    """
+    if os.path.exists(document_path):
+        content = extract_text_from_docx(document_path)
+        if content:
+            return content, document_path
+    logger.warning(f"Guide not found at {document_path}, using the seed corpus built from the case topics")
+    return build_seed_content(), "seed"
+
+def scale_content(content, factor):
+    """
+    Replicate the chapters of the document factor times.
+
+    Lines before the first chapter are kept once. Each copy renumbers its
+    chapters and marks their names with the volume, so the scaled document
+    parses into factor times as many chapters and sections.
+    """
+    preamble = []
+    body = []
+    for line in content:
+        if not body and classify_line(line, False)[0] != "chapter":
+            preamble.append(line)
+        else:
+            body.append(line)
+
+    scaled = list(preamble)
+    chapter_number = 0
+    for volume in range(1, factor + 1):
+        for line in body:
+            kind, value = classify_line(line, True)
+            if kind == "chapter":
+                chapter_number += 1
+                name = value if volume == 1 else f"{value} (Volume {volume})"
+                scaled.append(f"Chapter {chapter_number}. {name}")
+            else:
+                scaled.append(line)
+    return scaled
+
+def install_corpus(content):
+    """
+    Replace the loaded corpus with the given lines as the main guide and rebuild the RAG index.
+
+    The corpus has no fingerprint, so no index snapshot is read or written.
+    """
+    sections = parse_document_structure(content)
+    document = GuidelineDocument(
+        PRIMARY_DOCUMENT_ID, None, content, sections, build_document_index(PRIMARY_DOCUMENT_ID, content)
+    )
+    state = set_corpus_documents({PRIMARY_DOCUMENT_ID: document})
+    if not rag_engine.initialize_rag_engine():
+        raise RuntimeError("Could not build the RAG index for the benchmark corpus")
+    return {
+        "lines": len(content),
+        "characters": sum(len(line) for line in content),
+        "chapters": len(sections),
+        "sections": sum(len(chapter["sections"]) for chapter in sections.values()),
+        "chunks": len(state.chunks)
+    }
@@ -0,0 +1,74 @@
+"""
+Benchmark Queries
+
+This module builds the query workload replayed by the benchmark: the curated
+case topics, the retrieval queries that api_new_simulation sends for them, and
+misspelled and paraphrased chat queries for the dense retrieval modes.
+"""
+
+import random
+from config import CASE_TOPICS
+
+# Misspelled chat queries and the section that should answer them
+MISSPELLED_QUERIES = [
+    ("tuberculosys", "Tuberculosis"),
+    ("hemorroids", "Haemorrhoids"),
+    ("diarhoea in childern", "Diarrhoea"),
+    ("urticara rash", "Urticaria"),
+    ("malria treatmnt", "Malaria"),
+    ("paracetmol fevr", None),
+]
+
+# Symptom descriptions that share no keyword with the section names
+PARAPHRASED_QUERIES = [
+    "burning chest after meals",
+    "loose watery stools",
+    "itchy skin bumps",
+    "high temperature and shivering",
+    "painful swollen big toe",
+]
+
+def clarify_treatment_topic(topic):
+    """Apply the ulcer disambiguation used for the simulation treatment query."""
+    if topic == "Large Chronic Ulcers":
+        return "Large Chronic Skin Ulcers (NOT peptic ulcer disease)"
+    if topic == "Peptic Ulcer Disease":
+        return "Peptic Ulcer Disease (gastrointestinal condition, NOT skin ulcers)"
+    if "ulcer" in topic.lower():
+        return f"{topic} (be specific about the exact condition)"
+    return topic
+
+def clarify_topic(topic):
+    """Apply the ulcer disambiguation used for the simulation differential query."""
+    if topic == "Large Chronic Ulcers":
+        return "Large Chronic Skin Ulcers (a dermatological condition)"
+    if topic == "Peptic Ulcer Disease":
+        return "Peptic Ulcer Disease (a gastrointestinal condition)"
+    return topic
+
+def simulation_queries(topic, differential_topic):
+    """Get the retrieval queries api_new_simulation sends for a case topic."""
+    return [
+        topic,
+        f"What are the symptoms, diagnosis criteria, and treatment for {topic}?",
+        f"What is the exact treatment for {clarify_treatment_topic(topic)}?",
+        f"How do you differentiate {clarify_topic(topic)} from {clarify_topic(differential_topic)}?"
+    ]
+
+def build_workload(seed=0):
+    """
+    Build the benchmark workload.
+
+    Returns:
+        dict: "rag" holds the simulation queries for every topic, with a
+            deterministic differential topic, and "search" holds the plain
+            topic names used for section search, "fuzzy" the misspelled and
+            paraphrased chat queries
+    """
+    rng = random.Random(seed)
+    rag_queries = []
+    for topic in CASE_TOPICS:
+        alternatives = [t for t in CASE_TOPICS if t != topic][:10]
+        rag_queries.extend(simulation_queries(topic, rng.choice(alternatives)))
+    fuzzy_queries = [query for query, _ in MISSPELLED_QUERIES] + PARAPHRASED_QUERIES
+    return {"rag": rag_queries, "search": list(CASE_TOPICS), "fuzzy": fuzzy_queries}
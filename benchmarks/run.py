@@ -0,0 +1,148 @@
+"""
+Benchmark Runner
+
+This module replays the benchmark workload against search_similar_chunks,
+generate_context_for_query and search_document on corpora of increasing size,
+against the TF-IDF backend one query at a time (search_tfidf_chunks) and in
+batches of SEARCH_MANY_BATCH queries (search_many, whose calls and latencies
+count batches), and the misspelled and paraphrased queries against the dense
+and hybrid backends, and reports latency percentiles, throughput and peak
+memory as JSON.
+
+Each scale runs in a fresh process so its peak RSS is not inflated by the
+corpora built before it.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+
+# Queries per search_many call
+SEARCH_MANY_BATCH = 8
+
+def peak_rss_mb():
+    """Get the peak resident set size of this process in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(function, queries, repeat):
+    """
+    Call function once per query, repeat times over the query list.
+
+    Returns:
+        dict: call count, latency percentiles in milliseconds and queries per second
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            call_started = time.perf_counter()
+            function(query)
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "max_ms": round(float(latencies_ms.max()), 4),
+        "qps": round(len(latencies) / elapsed, 2) if elapsed else None
+    }
+
+def run_scale(factor, document_path, repeat):
+    """Build the corpus at one scale and benchmark every retrieval entry point."""
+    logging.basicConfig(level=logging.WARNING)
+    import rag_engine
+    from document_processor import search_document
+    from benchmarks.corpus import load_guide_content, scale_content, install_corpus
+    from benchmarks.queries import build_workload
+
+    content, source = load_guide_content(document_path)
+    content = scale_content(content, factor)
+
+    started = time.perf_counter()
+    corpus = install_corpus(content)
+    build_seconds = time.perf_counter() - started
+    workload = build_workload()
+
+    def uncached_context(query):
+        rag_engine.context_cache.clear()
+        return rag_engine.generate_context_for_query(query)
+
+    results = {
+        "search_similar_chunks": measure(rag_engine.search_similar_chunks, workload["rag"], repeat),
+        "generate_context_for_query": measure(uncached_context, workload["rag"], repeat)
+    }
+
+    # Warm the context cache so the cached run measures hits only
+    for query in workload["rag"]:
+        rag_engine.generate_context_for_query(query)
+    results["generate_context_for_query_cached"] = measure(rag_engine.generate_context_for_query, workload["rag"], repeat)
+    results["search_document"] = measure(search_document, workload["search"], repeat)
+    results["search_tfidf_chunks"] = measure(rag_engine.search_tfidf_chunks, workload["rag"], repeat)
+    batches = [workload["rag"][i:i + SEARCH_MANY_BATCH] for i in range(0, len(workload["rag"]), SEARCH_MANY_BATCH)]
+    results["search_many"] = measure(rag_engine.search_many, batches, repeat)
+    results["search_many"]["batch_size"] = SEARCH_MANY_BATCH
+    results["search_dense_chunks"] = measure(rag_engine.search_dense_chunks, workload["fuzzy"], repeat)
+    results["search_hybrid_chunks"] = measure(rag_engine.search_hybrid_chunks, workload["fuzzy"], repeat)
+
+    return {
+        "scale": factor,
+        "source": source,
+        "corpus": corpus,
+        "index_build_seconds": round(build_seconds, 4),
+        "results": results,
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency on scaled guideline corpora.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="corpus size multipliers (default: 1 10 100 1000)")
+    parser.add_argument("--document", default=None,
+                        help="guide to scale (default: DOCUMENT_PATH, or the seed corpus if it is missing)")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the query workload per scale")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    from config import DOCUMENT_PATH, RETRIEVAL_MODE
+    document_path = args.document or DOCUMENT_PATH
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "retrieval_mode": RETRIEVAL_MODE,
+        "repeat": args.repeat,
+        "scales": []
+    }
+    for factor in args.scales:
+        print(f"Benchmarking {factor}x corpus...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            report["scales"].append(executor.submit(run_scale, factor, document_path, args.repeat).result())
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Wrote benchmark report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
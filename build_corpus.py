@@ -0,0 +1,54 @@
+"""
+Build Corpus
+
+This script parses, chunks and indexes every available guideline document and
+writes them to one prebuilt corpus artifact. Deployments that ship the
+artifact memory-map it at startup instead of reading the .docx files.
+
+Usage: python build_corpus.py [--document PATH] [--output PATH]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+def main(argv=None):
+    from config import DOCUMENT_PATH, CORPUS_ARTIFACT_PATH
+
+    parser = argparse.ArgumentParser(description="Build the prebuilt guideline corpus artifact.")
+    parser.add_argument("--document", default=DOCUMENT_PATH, help="main guide to build from (default: DOCUMENT_PATH)")
+    parser.add_argument("--output", default=CORPUS_ARTIFACT_PATH, help="artifact to write (default: CORPUS_ARTIFACT_PATH)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.exists(args.document):
+        logger.error(f"Document not found at {args.document}")
+        return 1
+
+    from corpus_registry import build_corpus_artifact, open_corpus_artifact
+
+    started = time.perf_counter()
+    try:
+        documents = build_corpus_artifact(args.output, args.document)
+    except Exception as e:
+        logger.error(f"Error building corpus artifact: {e}")
+        return 1
+
+    # Check that the artifact opens and matches what was just built
+    reopened = open_corpus_artifact(args.output, verify_sources=False)
+    if not reopened or [len(document.index) for document in reopened.values()] != [len(document.index) for document in documents.values()]:
+        logger.error(f"Corpus artifact at {args.output} could not be read back")
+        return 1
+
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(args.output) / (1024 * 1024)
+    logger.info(f"Built corpus artifact {args.output} ({size_mb:.1f} MB, {len(documents)} documents) in {elapsed:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+"""
+Chunk Index
+
+This module builds an inverted index over the document chunks so that
+keyword retrieval only touches the chunks that actually contain the query terms.
+"""
+
+import logging
+import math
+import re
+import numpy as np
+from embeddings import term_vector, term_vectors, normalize_rows
+from corpus_file import StringTable, pack_strings, pack_chunk_metadata
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+PHRASE_PART_PATTERN = re.compile(r'\w+|\s+')
+
+# Query words that add noise to keyword scoring
+STOP_WORDS = {'and', 'the', 'for', 'with', 'what', 'this', 'that'}
+
+# Words that mark a chunk as carrying treatment or diagnosis information
+TREATMENT_TERMS = ['treatment', 'therapy', 'drug', 'medication', 'dose', 'regimen', 'management']
+DIAGNOSIS_TERMS = ['symptom', 'diagnosis', 'sign', 'diagnostic', 'indication', 'criterion', 'criteria']
+
+# Empty chunk id array returned by lookups without matches
+NO_CHUNKS = np.zeros(0, dtype=np.int32)
+NO_CHUNKS.flags.writeable = False
+
+# Upper bound on the number of cached vocabulary lookups
+MAX_CACHED_LOOKUPS = 4096
+
+# Names of the arrays that make up an index, in the order they are persisted
+INDEX_ARRAYS = (
+    'postings_indptr',     # term id -> range of postings entries
+    'postings_chunk_ids',  # postings entry -> chunk id
+    'positions_indptr',    # postings entry -> range of positions
+    'positions',           # absolute token positions of each postings entry
+    'tokens_indptr',       # chunk id -> range of token positions
+    'token_ids',           # token position -> term id
+    'gap_ids',             # token position -> id of the separator text after it
+    'idf',                 # term id -> inverse document frequency
+    'tfidf_weights',       # postings entry -> unit-normalised TF-IDF weight
+    'treatment_flags',     # chunk id -> mentions treatment terms
+    'diagnosis_flags',     # chunk id -> mentions diagnosis terms
+    'chunk_vectors'        # chunk id -> unit-length dense embedding (float32)
+)
+
+def tokenize(text):
+    """Split lowercase text into the word tokens used by the index."""
+    return TOKEN_PATTERN.findall(text)
+
+def is_scoring_term(token):
+    """Check whether a query token is meaningful enough to score on."""
+    return len(token) > 3 and token not in STOP_WORDS
+
+def expand_ranges(starts, ends):
+    """Concatenate the integer ranges [start, end) into one array."""
+    lengths = ends - starts
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+class ChunkRecord:
+    """
+    One chunk of an index: its id, document, chapter, the section it starts in,
+    every section it covers, and the span of its text in the chunk string table
+    (start and end byte offsets).
+    """
+
+    __slots__ = ("chunk_id", "document", "chapter", "section", "sections", "start", "end")
+
+    def __init__(self, chunk_id, document, chapter, section, start, end, sections=None):
+        self.chunk_id = chunk_id
+        self.document = document
+        self.chapter = chapter
+        self.section = section
+        self.sections = sections if sections is not None else ([section] if section is not None else [])
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"ChunkRecord({self.chunk_id}, {self.document!r}, {self.chapter!r}, {self.section!r})"
+
+class ChunkIndex:
+    """
+    Positional inverted index over the document chunks.
+
+    The index is a set of flat arrays: CSR postings (term -> chunks -> token
+    positions), every chunk's token id sequence with the id of the separator text
+    after each token, a TF-IDF weight per postings entry and a dense embedding
+    per chunk. Flat arrays can be saved to disk and memory-mapped back without
+    rebuilding anything.
+    """
+
+    def __init__(self, chunks, chunk_metadata, terms, gaps, arrays):
+        self.chunks = chunks
+        self.chunk_metadata = chunk_metadata
+        self.terms = terms
+        self.gaps = gaps
+        self.vocabulary = {token: term_id for term_id, token in enumerate(terms)}
+        self.gap_vocabulary = {gap: gap_id for gap_id, gap in enumerate(gaps)}
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+        self._lookup_cache = {}
+
+    @classmethod
+    def build(cls, chunks, chunk_metadata=None, previous=None):
+        """
+        Tokenize the chunks and build a new index over them.
+
+        chunk_metadata is an optional list of {"chapter", "section", "sections"} dicts, one per chunk.
+        When previous is given, chunks whose text also appears in that index reuse
+        its tokenization, so rebuilding after a small edit only tokenizes the
+        chunks that changed.
+        """
+        chunks = list(chunks)
+        if chunk_metadata is None:
+            chunk_metadata = [{"chapter": None, "section": None, "sections": []} for _ in chunks]
+        chunk_count = len(chunks)
+
+        # Working vocabularies; ids are renumbered by first occurrence below
+        vocabulary = {}
+        gap_vocabulary = {'': 0}
+        previous_chunk_ids = previous.chunk_ids_by_text() if previous is not None else {}
+        previous_term_map = None
+        previous_gap_map = None
+
+        token_pieces = []
+        gap_pieces = []
+        treatment_flags = np.zeros(chunk_count, dtype=np.bool_)
+        diagnosis_flags = np.zeros(chunk_count, dtype=np.bool_)
+        reused = 0
+
+        for chunk_id, chunk in enumerate(chunks):
+            previous_id = previous_chunk_ids.get(chunk)
+            if previous_id is not None:
+                if previous_term_map is None:
+                    previous_term_map = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in previous.terms], dtype=np.int64)
+                    previous_gap_map = np.array([gap_vocabulary.setdefault(gap, len(gap_vocabulary)) for gap in previous.gaps], dtype=np.int64)
+                tokens = slice(previous.tokens_indptr[previous_id], previous.tokens_indptr[previous_id + 1])
+                token_pieces.append(previous_term_map[previous.token_ids[tokens]])
+                gap_pieces.append(previous_gap_map[previous.gap_ids[tokens]])
+                treatment_flags[chunk_id] = previous.treatment_flags[previous_id]
+                diagnosis_flags[chunk_id] = previous.diagnosis_flags[previous_id]
+                reused += 1
+                continue
+
+            chunk_lower = chunk.lower()
+            matches = list(TOKEN_PATTERN.finditer(chunk_lower))
+            chunk_tokens = []
+            chunk_gaps = []
+            for offset, match in enumerate(matches):
+                chunk_tokens.append(vocabulary.setdefault(match.group(), len(vocabulary)))
+                gap = chunk_lower[match.end():matches[offset + 1].start()] if offset + 1 < len(matches) else ''
+                chunk_gaps.append(gap_vocabulary.setdefault(gap, len(gap_vocabulary)))
+            token_pieces.append(np.array(chunk_tokens, dtype=np.int64))
+            gap_pieces.append(np.array(chunk_gaps, dtype=np.int64))
+            treatment_flags[chunk_id] = any(word in chunk_lower for word in TREATMENT_TERMS)
+            diagnosis_flags[chunk_id] = any(word in chunk_lower for word in DIAGNOSIS_TERMS)
+
+        lengths = np.array([len(piece) for piece in token_pieces], dtype=np.int64)
+        token_ids = np.concatenate(token_pieces) if token_pieces else np.zeros(0, dtype=np.int64)
+        gap_ids = np.concatenate(gap_pieces) if gap_pieces else np.zeros(0, dtype=np.int64)
+        tokens_indptr = np.concatenate(([0], np.cumsum(lengths)))
+
+        # Number terms and gaps by first occurrence, dropping entries that only
+        # previous chunks used; the empty gap always keeps id 0
+        token_ids, terms = cls._renumber(token_ids, list(vocabulary))
+        gap_ids, gaps = cls._renumber(np.concatenate(([0], gap_ids)), list(gap_vocabulary))
+        gap_ids = gap_ids[1:]
+        term_count = len(terms)
+
+        # Group the token positions by term (positions stay ascending within a
+        # term) to get the CSR postings with one entry per (term, chunk) pair
+        positions = np.argsort(token_ids, kind='stable')
+        sorted_terms = token_ids[positions]
+        sorted_chunks = np.repeat(np.arange(chunk_count, dtype=np.int64), lengths)[positions]
+        entry_starts = np.flatnonzero(np.concatenate((
+            [True], (sorted_terms[1:] != sorted_terms[:-1]) | (sorted_chunks[1:] != sorted_chunks[:-1])
+        ))) if len(positions) else np.zeros(0, dtype=np.int64)
+        entry_terms = sorted_terms[entry_starts]
+        positions_indptr = np.concatenate((entry_starts, [len(positions)]))
+        postings_indptr = np.concatenate(([0], np.cumsum(np.bincount(entry_terms, minlength=term_count))))
+
+        document_frequency = np.bincount(entry_terms, minlength=term_count)
+        idf = np.log((1 + chunk_count) / (1 + document_frequency)) + 1
+        term_frequency = np.diff(positions_indptr)
+        weights = (1 + np.log(term_frequency)) * idf[entry_terms]
+
+        arrays = {
+            'postings_indptr': postings_indptr.astype(np.int64),
+            'postings_chunk_ids': sorted_chunks[entry_starts].astype(np.int32),
+            'positions_indptr': positions_indptr.astype(np.int64),
+            'positions': positions.astype(np.int64),
+            'tokens_indptr': tokens_indptr.astype(np.int64),
+            'token_ids': token_ids.astype(np.int32),
+            'gap_ids': gap_ids.astype(np.int32),
+            'idf': idf.astype(np.float32),
+            'tfidf_weights': weights.astype(np.float32),
+            'treatment_flags': treatment_flags,
+            'diagnosis_flags': diagnosis_flags
+        }
+
+        # Scale the weights so every chunk vector has unit length
+        norms = np.sqrt(np.bincount(arrays['postings_chunk_ids'], weights=arrays['tfidf_weights'] ** 2, minlength=chunk_count))
+        norms[norms == 0] = 1
+        arrays['tfidf_weights'] /= norms[arrays['postings_chunk_ids']].astype(np.float32)
+
+        arrays['chunk_vectors'] = cls._embed_chunks(terms, arrays, chunk_count)
+
+        # Keep the chunk texts in one UTF-8 blob and the metadata as name ids,
+        # the same compact form a snapshot is loaded in
+        index = cls(pack_strings(chunks), pack_chunk_metadata(chunk_metadata), terms, gaps, arrays)
+        if previous is not None:
+            logger.info(f"Indexed {len(chunks)} chunks with {term_count} distinct tokens, reusing {reused} unchanged chunks")
+        else:
+            logger.info(f"Indexed {len(chunks)} chunks with {term_count} distinct tokens")
+        return index
+
+    @staticmethod
+    def _renumber(ids, names):
+        """
+        Renumber ids in order of first occurrence.
+
+        Returns:
+            tuple: (renumbered ids, names of the ids that occur, in their new order)
+        """
+        if not len(ids):
+            return ids, []
+        unique_ids, first_positions = np.unique(ids, return_index=True)
+        occurring = unique_ids[np.argsort(first_positions, kind='stable')]
+        new_ids = np.empty(len(names), dtype=np.int64)
+        new_ids[occurring] = np.arange(len(occurring))
+        return new_ids[ids], [names[old_id] for old_id in occurring]
+
+    def chunk_ids_by_text(self):
+        """Map each chunk text to the id of its first occurrence."""
+        chunk_ids = {}
+        for chunk_id, chunk in enumerate(self.chunks):
+            chunk_ids.setdefault(chunk, chunk_id)
+        return chunk_ids
+
+    @staticmethod
+    def _embed_chunks(terms, arrays, chunk_count):
+        """Embed every chunk as the TF-IDF weighted sum of its term embeddings."""
+        vectors = term_vectors(terms)
+        chunk_vectors = np.zeros((chunk_count, vectors.shape[1]), dtype=np.float32)
+        postings_indptr = arrays['postings_indptr']
+        for term_id in range(len(terms)):
+            entries = slice(postings_indptr[term_id], postings_indptr[term_id + 1])
+            chunk_ids = arrays['postings_chunk_ids'][entries]
+            chunk_vectors[chunk_ids] += arrays['tfidf_weights'][entries, None] * vectors[term_id]
+        return normalize_rows(chunk_vectors).astype(np.float32)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def record(self, chunk_id):
+        """Get the ChunkRecord of a chunk."""
+        metadata = self.chunk_metadata[chunk_id]
+        if isinstance(self.chunks, StringTable):
+            start, end = int(self.chunks.offsets[chunk_id]), int(self.chunks.offsets[chunk_id + 1])
+        else:
+            start, end = None, None
+        return ChunkRecord(
+            chunk_id, metadata.get("document"), metadata["chapter"], metadata["section"], start, end,
+            metadata.get("sections")
+        )
+
+    def keyword_matches(self, keyword):
+        """
+        Find the chunks matching a keyword.
+
+        Returns:
+            tuple: (exact, partial) arrays of distinct chunk ids
+                exact: chunks containing the keyword as a whole word
+                partial: chunks where the keyword only appears inside a longer word
+        """
+        term_id = self.vocabulary.get(keyword)
+        exact = self._term_chunk_ids([term_id] if term_id is not None else [])
+
+        # A keyword is made of word characters only, so any substring hit lies
+        # inside a single token and the vocabulary is enough to find it
+        partial_terms = [other_id for other_id in self._vocabulary_matches('contains', keyword) if other_id != term_id]
+        partial = self._term_chunk_ids(partial_terms)
+        if len(exact) and len(partial):
+            is_exact = np.zeros(len(self.chunks), dtype=np.bool_)
+            is_exact[exact] = True
+            partial = partial[~is_exact[partial]]
+
+        return exact, partial
+
+    def phrase_matches(self, phrase):
+        """
+        Find the ids of chunks whose lowercase text contains the phrase, as an array of distinct ids.
+
+        The result is the same as a substring test against each chunk: the first
+        phrase word may end a longer token, the last may start one, the words in
+        between must be whole tokens, and the separators must match exactly.
+        """
+        parts = PHRASE_PART_PATTERN.findall(phrase)
+        words = parts[0::2]
+        separators = parts[1::2]
+        if len(words) < 2 or len(separators) != len(words) - 1:
+            return NO_CHUNKS
+
+        separator_ids = [self.gap_vocabulary.get(separator) for separator in separators]
+        if None in separator_ids:
+            return NO_CHUNKS
+
+        # Term ids each phrase word may take at its position
+        word_terms = [self._vocabulary_matches('suffix', words[0])]
+        for word in words[1:-1]:
+            word_terms.append([self.vocabulary[word]] if word in self.vocabulary else [])
+        word_terms.append(self._vocabulary_matches('prefix', words[-1]))
+        if not all(word_terms):
+            return NO_CHUNKS
+
+        # Anchor on the word with the fewest occurrences and derive the phrase starts
+        anchor = min(range(len(words)), key=lambda offset: self._occurrence_count(word_terms[offset]))
+        entries = self._term_entries(word_terms[anchor])
+        occurrence_counts = self.positions_indptr[entries + 1] - self.positions_indptr[entries]
+        chunk_ids = np.repeat(self.postings_chunk_ids[entries], occurrence_counts)
+        starts = self.positions[expand_ranges(self.positions_indptr[entries], self.positions_indptr[entries + 1])] - anchor
+
+        # Keep the starts where the whole phrase fits inside the chunk
+        fits = (starts >= self.tokens_indptr[chunk_ids]) & (starts + len(words) <= self.tokens_indptr[chunk_ids + 1])
+        chunk_ids, starts = chunk_ids[fits], starts[fits]
+
+        for offset, terms in enumerate(word_terms):
+            if offset == anchor or not len(starts):
+                continue
+            matches = np.isin(self.token_ids[starts + offset], terms)
+            chunk_ids, starts = chunk_ids[matches], starts[matches]
+
+        for offset, separator_id in enumerate(separator_ids):
+            if not len(starts):
+                break
+            matches = self.gap_ids[starts + offset] == separator_id
+            chunk_ids, starts = chunk_ids[matches], starts[matches]
+
+        return np.unique(chunk_ids)
+
+    def tfidf_scores(self, queries):
+        """
+        Score every chunk against a batch of queries with one sparse product.
+
+        Returns:
+            numpy.ndarray: (len(queries), chunk count) matrix of cosine scores
+        """
+        chunk_count = len(self.chunks)
+
+        # Build the sparse query matrix as parallel (row, term, weight) arrays
+        query_rows = []
+        query_terms = []
+        query_weights = []
+        for row, query in enumerate(queries):
+            counts = {}
+            for token in tokenize(query.lower()):
+                term_id = self.vocabulary.get(token)
+                if term_id is not None and is_scoring_term(token):
+                    counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id, count in counts.items():
+                query_rows.append(row)
+                query_terms.append(term_id)
+                query_weights.append((1 + math.log(count)) * self.idf[term_id])
+
+        if not query_terms:
+            return np.zeros((len(queries), chunk_count), dtype=np.float64)
+
+        query_rows = np.array(query_rows, dtype=np.int64)
+        query_terms = np.array(query_terms, dtype=np.int64)
+        query_weights = np.array(query_weights, dtype=np.float64)
+        query_norms = np.sqrt(np.bincount(query_rows, weights=query_weights ** 2, minlength=len(queries)))
+        query_weights /= query_norms[query_rows]
+
+        # Expand each query term into the postings slice of its matrix row
+        starts = self.postings_indptr[query_terms]
+        lengths = self.postings_indptr[query_terms + 1] - starts
+        entries = expand_ranges(starts, starts + lengths)
+
+        # Accumulate query weight * chunk weight into a flattened (query, chunk) grid
+        cells = np.repeat(query_rows, lengths) * chunk_count + self.postings_chunk_ids[entries]
+        products = np.repeat(query_weights, lengths) * self.tfidf_weights[entries]
+        scores = np.bincount(cells, weights=products, minlength=len(queries) * chunk_count)
+        return scores.reshape(len(queries), chunk_count)
+
+    def dense_scores(self, queries):
+        """
+        Score every chunk against a batch of queries by embedding cosine similarity.
+
+        Query words missing from the vocabulary still contribute through their
+        character trigrams, which is what lets paraphrases and word-form variants match.
+
+        Returns:
+            numpy.ndarray: (len(queries), chunk count) matrix of cosine scores
+        """
+        max_idf = float(self.idf.max()) if len(self.idf) else 1.0
+        query_vectors = np.zeros((len(queries), self.chunk_vectors.shape[1]), dtype=np.float32)
+        for row, query in enumerate(queries):
+            counts = {}
+            for token in tokenize(query.lower()):
+                if is_scoring_term(token):
+                    counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_id = self.vocabulary.get(token)
+                idf = self.idf[term_id] if term_id is not None else max_idf
+                query_vectors[row] += (1 + math.log(count)) * idf * term_vector(token)
+        return normalize_rows(query_vectors) @ self.chunk_vectors.T
+
+    def _term_entries(self, term_ids):
+        """Get the postings entry numbers of the given terms."""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        return expand_ranges(self.postings_indptr[term_ids], self.postings_indptr[term_ids + 1])
+
+    def _term_chunk_ids(self, term_ids):
+        """Get the ids of chunks containing any of the given terms."""
+        if len(term_ids) == 1:
+            # The postings of one term list each chunk once, in ascending order
+            term_id = term_ids[0]
+            return self.postings_chunk_ids[self.postings_indptr[term_id]:self.postings_indptr[term_id + 1]]
+        return np.unique(self.postings_chunk_ids[self._term_entries(term_ids)])
+
+    def _occurrence_count(self, term_ids):
+        """Count the token positions of the given terms across all chunks."""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        return int((self.positions_indptr[self.postings_indptr[term_ids + 1]] - self.positions_indptr[self.postings_indptr[term_ids]]).sum())
+
+    def _vocabulary_matches(self, kind, word):
+        """Find the ids of vocabulary tokens that contain, start with or end with a word."""
+        key = (kind, word)
+        cached = self._lookup_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if kind == 'prefix':
+            term_ids = [term_id for term_id, token in enumerate(self.terms) if token.startswith(word)]
+        elif kind == 'suffix':
+            term_ids = [term_id for term_id, token in enumerate(self.terms) if token.endswith(word)]
+        else:
+            term_ids = [term_id for term_id, token in enumerate(self.terms) if word in token]
+
+        if len(self._lookup_cache) >= MAX_CACHED_LOOKUPS:
+            self._lookup_cache.clear()
+        self._lookup_cache[key] = term_ids
+        return term_ids
+
+def top_k_chunks(scores, k):
+    """Return the (chunk id, score) pairs of the k best positive scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return [(int(chunk_id), float(scores[chunk_id])) for chunk_id in candidates if scores[chunk_id] > 0]
@@ -0,0 +1,185 @@
+"""
+Chunker
+
+This module splits the document lines into retrieval chunks that follow the
+chapter and section structure found by the document processor. Every chunk
+starts with a heading line, records every section it covers in its metadata,
+and chunks cut from a long section overlap by CHUNK_OVERLAP characters.
+"""
+
+import logging
+from document_processor import classify_line
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+logger = logging.getLogger(__name__)
+
+def split_long_line(line, chunk_size):
+    """Split a line longer than chunk_size into word-aligned pieces."""
+    pieces = []
+    current = []
+    current_length = 0
+    for word in line.split():
+        if current and current_length + len(word) + 1 > chunk_size:
+            pieces.append(" ".join(current))
+            current = []
+            current_length = 0
+        current.append(word)
+        current_length += len(word) + 1
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def overlap_tail(lines, chunk_overlap):
+    """Get roughly the last chunk_overlap characters of the lines, starting at a word."""
+    if chunk_overlap <= 0 or not lines:
+        return ""
+    text = " ".join(lines)
+    if len(text) <= chunk_overlap:
+        return text
+    tail = text[-chunk_overlap:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+def iter_document_blocks(content):
+    """
+    Group document lines into heading blocks.
+
+    content can be any iterable of lines, including iter_docx_paragraphs().
+
+    Yields:
+        tuple: (chapter, section, heading, lines) for the preamble, each chapter
+            introduction and each section, in document order
+    """
+    chapter = None
+    section = None
+    heading = None
+    lines = []
+
+    for line in content:
+        kind, value = classify_line(line, bool(chapter))
+        if kind in ("chapter", "section"):
+            if heading or lines:
+                yield chapter, section, heading, lines
+            if kind == "chapter":
+                chapter = value
+                section = None
+            else:
+                section = value
+            heading = line
+            lines = []
+        else:
+            lines.append(line)
+
+    if heading or lines:
+        yield chapter, section, heading, lines
+
+def split_chapter_runs(content):
+    """
+    Split document lines into runs that chunk independently of each other.
+
+    Chunks never cross a change of chapter name, so each run starts at a chapter
+    heading whose name differs from the previous chapter (or at the start of
+    the document) and chunk_document over the whole document equals
+    chunk_document over every run, concatenated.
+
+    Returns:
+        list: (chapter name or None, lines) tuples in document order
+    """
+    runs = []
+    chapter = None
+    lines = []
+    for line in content:
+        kind, value = classify_line(line, bool(chapter))
+        if kind == "chapter" and value != chapter:
+            if lines:
+                runs.append((chapter, lines))
+            lines = []
+        if kind == "chapter":
+            chapter = value
+        lines.append(line)
+    if lines:
+        runs.append((chapter, lines))
+    return runs
+
+def chunk_document(content, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Split the document into structure-aware chunks.
+
+    Consecutive short sections of the same chapter are packed together up to
+    chunk_size characters; a chapter boundary always starts a new chunk. A
+    section too long for one chunk is split on line boundaries, and each
+    continuation chunk repeats the section heading followed by the last
+    chunk_overlap characters of the previous chunk.
+
+    Returns:
+        list: chunk dicts with "text", "chapter", "section" (the section the
+            chunk starts in) and "sections" (every section it covers, in order)
+    """
+    chunks = []
+    pending = {"lines": [], "length": 0, "chapter": None, "section": None, "sections": []}
+
+    def add(line, chapter, section):
+        if not pending["lines"]:
+            pending["chapter"] = chapter
+            pending["section"] = section
+        if section is not None and section not in pending["sections"]:
+            pending["sections"].append(section)
+        pending["lines"].append(line)
+        pending["length"] += len(line) + 1
+
+    def flush():
+        if pending["lines"]:
+            chunks.append({
+                "text": "\n".join(pending["lines"]),
+                "chapter": pending["chapter"],
+                "section": pending["section"],
+                "sections": pending["sections"]
+            })
+        pending["lines"] = []
+        pending["length"] = 0
+        pending["sections"] = []
+
+    for chapter, section, heading, lines in iter_document_blocks(content):
+        block_lines = ([heading] if heading else []) + lines
+        block_length = sum(len(line) + 1 for line in block_lines)
+
+        # A chapter boundary always starts a new chunk, a section boundary only when full
+        if pending["lines"] and chapter != pending["chapter"]:
+            flush()
+        if pending["length"] + block_length <= chunk_size:
+            for line in block_lines:
+                add(line, chapter, section)
+            continue
+        if block_length <= chunk_size:
+            flush()
+            for line in block_lines:
+                add(line, chapter, section)
+            continue
+
+        # Split an oversized block on line boundaries, repeating its heading and
+        # the tail of the previous piece at the start of every continuation
+        body = []
+        for line in lines:
+            body.extend(split_long_line(line, chunk_size // 2) if len(line) > chunk_size // 2 else [line])
+        heading_lines = [heading] if heading else []
+        heading_length = sum(len(line) + 1 for line in heading_lines)
+
+        if body and pending["length"] + heading_length + len(body[0]) + 1 > chunk_size:
+            flush()
+        for line in heading_lines:
+            add(line, chapter, section)
+
+        piece = []
+        for line in body:
+            if piece and pending["length"] + len(line) + 1 > chunk_size:
+                flush()
+                for part in heading_lines + [overlap_tail(piece, chunk_overlap)]:
+                    if part:
+                        add(part, chapter, section)
+                piece = []
+            add(line, chapter, section)
+            piece.append(line)
+
+    flush()
+    logger.info(f"Split document into {len(chunks)} structure-aware chunks")
+    return chunks
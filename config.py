@@ -14,12 +14,91 @@ PGHOST = os.environ.get("PGHOST")
 
 # Document configuration
 DOCUMENT_PATH = "attached_assets/pharmacy_guide.docx"
+PRIMARY_DOCUMENT_ID = "pharmacy_guide"  # Document id of the guide at DOCUMENT_PATH
+
+# Further guideline volumes served next to the main guide, by document id.
+# Volumes whose file is missing are skipped at startup.
+GUIDELINE_DOCUMENTS = {
+    "essential_medicines": "attached_assets/essential_medicines_list.docx",
+    "paediatric_guidelines": "attached_assets/paediatric_guidelines.docx",
+}
+CORPUS_MAX_WORKERS = int(os.environ.get("CORPUS_MAX_WORKERS", "0")) or None  # None uses one process per CPU
+DOCUMENT_WATCH_INTERVAL = int(os.environ.get("DOCUMENT_WATCH_INTERVAL", "0"))  # Seconds between checks for changed documents; 0 disables
+CORPUS_ARTIFACT_PATH = os.environ.get("CORPUS_ARTIFACT_PATH", "attached_assets/guideline_corpus.corpus")  # Prebuilt corpus written by build_corpus.py
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # Required in the X-Admin-Token header of admin endpoints; unset disables them
 
 # RAG configuration
 VECTOR_DB_PATH = "vector_db"
+CORPUS_GENERATION_PATH = os.environ.get("CORPUS_GENERATION_PATH", os.path.join(VECTOR_DB_PATH, "corpus_generation"))  # Marker file a reload touches so the other workers reload too
 CHUNK_SIZE = 1500  # Increased for faster processing
 CHUNK_OVERLAP = 100  # Decreased for faster processing
 
+# Retrieval backend: "keyword", "tfidf" (scores batches of queries with one sparse
+# product), "dense" or "hybrid" (dense + keyword score fusion)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "keyword")
+EMBEDDING_DIMENSIONS = 256  # Size of the hashed chunk embeddings
+# Hashed embeddings give misspelled and paraphrased queries low absolute
+# cosines (0.08-0.3), so dense matches are cut relative to the best match and
+# the absolute floor only drops noise
+DENSE_MIN_SCORE = 0.05  # Minimum cosine similarity for a dense match
+DENSE_RELATIVE_MIN_SCORE = 0.6  # Minimum dense score as a share of the best match of the query
+HYBRID_DENSE_WEIGHT = 0.5  # Share of the dense score in hybrid mode
+CONTEXT_CACHE_SIZE = 512  # Number of generated contexts kept in memory
+CONTEXT_CACHE_TTL = 3600  # Seconds before a cached context is regenerated
+SEARCH_TIME_BUDGET_MS = 250  # Default time budget of an /api/search page
+SEARCH_MAX_TIME_BUDGET_MS = 2000  # Largest time budget a search request may ask for
+READINESS_WAIT_MS = int(os.environ.get("READINESS_WAIT_MS", "2000"))  # How long retrieval waits for a corpus load in progress before degrading
+
+# Mistral API client
+MISTRAL_POOL_SIZE = int(os.environ.get("MISTRAL_POOL_SIZE", "10"))  # Keep-alive connections per worker; match the worker's thread count
+MISTRAL_CONNECT_TIMEOUT = 5  # Seconds to open a connection to the API
+MISTRAL_READ_TIMEOUT = 30  # Default seconds to wait for a completion
+MISTRAL_MAX_RETRIES = 3  # Retries of a call answered with 429/5xx or a connection error
+MISTRAL_BACKOFF_BASE = 0.5  # Seconds of the first retry delay, doubled on each retry (with jitter)
+MISTRAL_BACKOFF_MAX = 8  # Longest delay between two retries
+SIMULATION_LLM_DEADLINE = 40  # Seconds the concurrent LLM calls of one new case simulation may take together
+
+# Mistral API rate limit, shared by every worker on the machine
+MISTRAL_RATE_LIMIT = float(os.environ.get("MISTRAL_RATE_LIMIT", "0"))  # Requests per second of the account's Mistral plan; 0 (the default) turns the limiter off
+MISTRAL_RATE_BURST = int(os.environ.get("MISTRAL_RATE_BURST", "5"))  # Requests that may be sent at once after a quiet spell
+MISTRAL_RATE_LIMIT_PATH = os.environ.get("MISTRAL_RATE_LIMIT_PATH", os.path.join(VECTOR_DB_PATH, "rate_limit.sqlite3"))  # SQLite file holding the shared token bucket
+RATE_LIMIT_INTERACTIVE_WAIT = 20  # Seconds a chat or simulation call may wait for a slot
+RATE_LIMIT_BACKGROUND_WAIT = 120  # Seconds flashcard and challenge generation may wait for a slot
+
+# LLM response cache
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(VECTOR_DB_PATH, "llm_cache.sqlite3"))  # SQLite file shared by the workers; empty keeps the cache in memory only
+LLM_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached response is asked for again
+LLM_CACHE_MEMORY_SIZE = 256  # Responses kept in each worker's memory
+LLM_CACHE_MAX_ENTRIES = 5000  # Responses kept in the SQLite file; the least recently used go first
+
+# Token budgets for the guideline context pasted into LLM prompts
+CONTEXT_TOKEN_BUDGET = 2000  # Chat answers and other default call sites
+SIMULATION_CONTEXT_TOKEN_BUDGET = 600  # Treatment and differential lookups for case simulations
+
+# Curated guideline topics used to generate case simulations
+CASE_TOPICS = [
+    "Diarrhoea", "Rotavirus Disease and Diarrhoea", "Constipation", "Peptic Ulcer Disease",
+    "Gastro-oesophageal Reflux Disease", "Haemorrhoids", "Vomiting", "Anaemia", "Measles",
+    "Pertussis", "Common cold", "Pneumonia", "Headache", "Boils", "Impetigo", "Buruli ulcer",
+    "Yaws", "Superficial Fungal Skin infections", "Pityriasis Versicolor", "Herpes Simplex Infections",
+    "Herpes Zoster Infections", "Chicken pox", "Large Chronic Ulcers", "Pruritus", "Urticaria",
+    "Reactive Erythema and Bullous Reaction", "Acne Vulgaris", "Eczema", "Intertrigo", "Diabetes Mellitus",
+    "Diabetic Ketoacidosis", "Diabetes in Pregnancy", "Treatment-Induced Hypoglycemia", "Dyslipidaemia",
+    "Goitre", "Hypothyroidism", "Hyperthyroidism", "Overweight and Obesity", "Dysmenorrhoea",
+    "Abortion", "Abnormal Vaginal Bleeding", "Abnormal Vaginal Discharge", "Acute Lower Abdominal Pain",
+    "Menopause", "Erectile Dysfunction", "Urinary Tract Infection", "Sexually Transmitted Infections in Adults",
+    "Fever", "Tuberculosis", "Typhoid fever", "Malaria", "Uncomplicated Malaria", "Severe Malaria",
+    "Malaria in Pregnancy", "Worm Infestation", "Xerophthalmia", "Foreign body in the eye",
+    "Neonatal conjunctivitis", "Red eye", "Stridor", "Acute Epiglottitis", "Retropharyngeal Abscess",
+    "Pharyngitis and Tonsillitis", "Acute Sinusitis", "Acute otitis Media", "Chronic Otitis Media",
+    "Epistaxis", "Dental Caries", "Oral Candidiasis", "Acute Necrotizing Ulcerative Gingivitis",
+    "Acute Bacterial Sialoadenitis", "Chronic Periodontal Infections", "Mouth Ulcers", "Odontogenic Infections",
+    "Osteoarthritis", "Rheumatoid arthritis", "Juvenile Idiopathic Arthritis", "Back pain", "Gout",
+    "Dislocations", "Open Fractures", "Cellulitis", "Burns", "Wounds", "Bites and Stings",
+    "Shock", "Acute Allergic Reaction"
+]
+
 # Gamification settings
 DAILY_STREAK_POINTS = 10
 CASE_COMPLETION_POINTS = {
@@ -0,0 +1,141 @@
+"""
+Context Packer
+
+This module fits retrieved guideline text into a token budget before it is
+pasted into an LLM prompt: near-duplicate passages are dropped, each passage is
+trimmed to the sentences that mention the query terms, and packing stops when
+the budget runs out.
+"""
+
+import math
+import re
+from chunk_index import tokenize, is_scoring_term
+
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?;])\s+')
+HEADING_PATTERN = re.compile(r'^## .* ##$')
+
+# Average characters per token for English text with the Mistral tokenizer
+CHARS_PER_TOKEN = 4
+
+# Share of word trigrams two passages must have in common to count as duplicates
+DUPLICATE_THRESHOLD = 0.7
+
+def estimate_tokens(text):
+    """Estimate the number of LLM tokens in a piece of text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _shingles(text):
+    words = tokenize(text.lower())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+def _is_near_duplicate(shingles, packed_shingles):
+    for other in packed_shingles:
+        shared = len(shingles & other)
+        if shared and shared / min(len(shingles), len(other)) >= DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+def trim_to_matching_sentences(passage, query_terms):
+    """
+    Keep the heading, the sentences that mention a query term and the sentence
+    right after each of them (which often carries the dose or duration). The
+    heading of a later section is kept when it or a line under it is kept.
+
+    Passages without any matching sentence are returned unchanged, since the
+    retriever already judged them relevant as a whole.
+    """
+    lines = passage.split('\n')
+    heading = []
+    if lines and HEADING_PATTERN.match(lines[0]):
+        heading = [lines[0]]
+        lines = lines[1:]
+
+    kept_lines = []
+    matched = False
+    section_heading = None
+    for line in lines:
+        if HEADING_PATTERN.match(line):
+            section_heading = line
+            if any(term in line.lower() for term in query_terms):
+                matched = True
+                kept_lines.append(line)
+                section_heading = None
+            continue
+        sentences = SENTENCE_SPLIT_PATTERN.split(line)
+        keep = [False] * len(sentences)
+        for i, sentence in enumerate(sentences):
+            sentence_lower = sentence.lower()
+            if any(term in sentence_lower for term in query_terms):
+                keep[i] = True
+                if i + 1 < len(sentences):
+                    keep[i + 1] = True
+        if any(keep):
+            matched = True
+            if section_heading:
+                kept_lines.append(section_heading)
+                section_heading = None
+            kept_lines.append(" ".join(sentence for sentence, kept in zip(sentences, keep) if kept))
+
+    if not matched:
+        return passage
+    return "\n".join(heading + kept_lines)
+
+def _truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens, ending on a word boundary."""
+    if max_tokens <= 0:
+        return ""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut
+
+def pack_context(passages, query, token_budget):
+    """
+    Pack ranked passages into a context of at most token_budget tokens.
+
+    Args:
+        passages (list): passage strings, most relevant first
+        query (str): the query the passages were retrieved for
+        token_budget (int): maximum estimated tokens of the packed context,
+            or None to keep every passage untrimmed
+
+    Returns:
+        str: the packed passages separated by blank lines
+    """
+    if token_budget is None:
+        return "\n\n".join(passages)
+
+    query_terms = {token for token in tokenize(query.lower()) if is_scoring_term(token)}
+    separator_tokens = estimate_tokens("\n\n")
+    packed = []
+    packed_shingles = []
+    remaining = token_budget
+
+    for passage in passages:
+        shingles = _shingles(passage)
+        if _is_near_duplicate(shingles, packed_shingles):
+            continue
+
+        if query_terms:
+            passage = trim_to_matching_sentences(passage, query_terms)
+        cost = estimate_tokens(passage) + (separator_tokens if packed else 0)
+
+        if cost > remaining:
+            # Fill what is left of the budget with the start of the passage
+            available = remaining - (separator_tokens if packed else 0)
+            if available <= 0:
+                break
+            passage = _truncate_to_tokens(passage, available)
+            if passage:
+                packed.append(passage)
+            break
+
+        packed.append(passage)
+        packed_shingles.append(shingles)
+        remaining -= cost
+
+    return "\n\n".join(packed)
@@ -0,0 +1,323 @@
+"""
+Corpus File
+
+This module reads and writes the compact binary corpus format: one file with a
+JSON header followed by aligned arrays. Text is stored as string tables (an
+offsets array plus one UTF-8 blob), so a memory-mapped corpus is shared by
+every process that opens it and is read through lightweight views instead of
+private Python string lists.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping, Sequence
+import numpy as np
+
+CORPUS_MAGIC = b"MQCORPUS"
+HEADER_LENGTH = struct.Struct("<Q")
+ARRAY_ALIGNMENT = 64
+
+def _aligned(offset):
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+def write_corpus_file(path, header, arrays):
+    """
+    Write a header dict and named NumPy arrays to a corpus file.
+
+    The file is written next to its destination and renamed into place, so
+    readers only ever see complete files.
+    """
+    array_entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _aligned(offset)
+        array_entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header_bytes = json.dumps(dict(header, arrays=array_entries), ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(len(CORPUS_MAGIC) + HEADER_LENGTH.size + len(header_bytes))
+
+    directory = os.path.dirname(path) or "."
+    file_descriptor, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(CORPUS_MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + array_entries[name]["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _read_header(f):
+    if f.read(len(CORPUS_MAGIC)) != CORPUS_MAGIC:
+        raise ValueError("Not a corpus file")
+    (header_length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+    header = json.loads(f.read(header_length).decode("utf-8"))
+    return header, _aligned(len(CORPUS_MAGIC) + HEADER_LENGTH.size + header_length)
+
+def read_corpus_header(path):
+    """Read only the header of a corpus file."""
+    with open(path, "rb") as f:
+        return _read_header(f)[0]
+
+def open_corpus_file(path):
+    """
+    Memory-map a corpus file.
+
+    Returns:
+        tuple: (header, arrays) where arrays maps names to read-only NumPy views
+            of the mapped file
+    """
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        array = np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + entry["offset"])
+        arrays[name] = array.reshape(entry["shape"])
+    return header, arrays
+
+def encode_strings(strings):
+    """
+    Encode strings as a string table.
+
+    Returns:
+        tuple: (offsets, blob) where string i is blob[offsets[i]:offsets[i + 1]]
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def add_string_table(arrays, name, strings):
+    """Add the offsets and blob arrays of a string table to an array dict."""
+    if isinstance(strings, StringTable):
+        # Already encoded, so store its arrays as they are
+        arrays[f"{name}.offsets"], arrays[f"{name}.blob"] = strings.offsets, strings.blob
+    else:
+        arrays[f"{name}.offsets"], arrays[f"{name}.blob"] = encode_strings(strings)
+
+def pack_strings(strings):
+    """Encode strings into an in-memory StringTable."""
+    return StringTable(*encode_strings(strings))
+
+def pack_chunk_metadata(chunk_metadata):
+    """
+    Pack a list of {document, chapter, section, sections} dicts into a ChunkMetadataList.
+
+    Every chapter and section name is stored once and referenced by id, so the
+    metadata costs two int32 per chunk, plus one per covered section, instead
+    of a dict. Metadata of chunks
+    from more than one document is returned as a list, unchanged.
+    """
+    chunk_metadata = list(chunk_metadata)
+    document_ids = {metadata.get("document") for metadata in chunk_metadata}
+    if len(document_ids) > 1:
+        return chunk_metadata
+
+    names = []
+    name_ids = {}
+
+    def name_id(name):
+        if name is None:
+            return -1
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    chapter_ids = np.array([name_id(metadata["chapter"]) for metadata in chunk_metadata], dtype=np.int32)
+    section_ids = np.array([name_id(metadata["section"]) for metadata in chunk_metadata], dtype=np.int32)
+    covered = [[name_id(name) for name in chunk_sections(metadata)] for metadata in chunk_metadata]
+    sections_indptr = np.concatenate(([0], np.cumsum([len(ids) for ids in covered]))).astype(np.int64)
+    section_list = np.array([name_id for ids in covered for name_id in ids], dtype=np.int32)
+    document_id = document_ids.pop() if document_ids else None
+    return ChunkMetadataList(document_id, names, names, chapter_ids, section_ids, sections_indptr, section_list)
+
+def chunk_sections(metadata):
+    """Get every section a chunk covers, falling back to its first section for metadata without a list."""
+    sections = metadata.get("sections")
+    if sections is None:
+        sections = [metadata["section"]] if metadata["section"] is not None else []
+    return sections
+
+def get_string_table(arrays, name):
+    """Get a StringTable view over a string table in an array dict."""
+    return StringTable(arrays[f"{name}.offsets"], arrays[f"{name}.blob"])
+
+class SequenceView(Sequence):
+    """Read-only sequence that compares equal to lists and tuples with the same items."""
+
+    def __eq__(self, other):
+        if isinstance(other, (Sequence, list, tuple)) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} items)"
+
+class StringTable(SequenceView):
+    """Sequence of strings decoded on access from an offsets array and a UTF-8 blob."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("string table index out of range")
+        return self.blob[self.offsets[item]:self.offsets[item + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        blob = self.blob
+        for start, end in zip(offsets, offsets[1:]):
+            yield blob[start:end].tobytes().decode("utf-8")
+
+class IndexedStrings(SequenceView):
+    """Sequence of the strings of a StringTable at the given ids."""
+
+    def __init__(self, table, ids):
+        self.table = table
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.table[int(i)] for i in self.ids[item]]
+        return self.table[int(self.ids[item])]
+
+    def __iter__(self):
+        for string_id in self.ids.tolist():
+            yield self.table[string_id]
+
+class ChainedSequence(SequenceView):
+    """Sequence view over several sequences laid end to end."""
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.starts = np.cumsum([0] + [len(part) for part in self.parts])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("sequence index out of range")
+        part = int(np.searchsorted(self.starts, item, side="right")) - 1
+        return self.parts[part][item - int(self.starts[part])]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+class ChunkMetadataList(SequenceView):
+    """
+    Sequence of {document, chapter, section, sections} dicts built on access
+    from name id arrays; the sections of chunk i are the ids in
+    section_list[sections_indptr[i]:sections_indptr[i + 1]].
+    """
+
+    def __init__(self, document_id, chapter_names, section_names, chapter_ids, section_ids, sections_indptr, section_list):
+        self.document_id = document_id
+        self.chapter_names = chapter_names
+        self.section_names = section_names
+        self.chapter_ids = chapter_ids
+        self.section_ids = section_ids
+        self.sections_indptr = sections_indptr
+        self.section_list = section_list
+
+    def __len__(self):
+        return len(self.chapter_ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        chapter_id = int(self.chapter_ids[item])
+        section_id = int(self.section_ids[item])
+        if item < 0:
+            item += len(self)
+        covered = self.section_list[self.sections_indptr[item]:self.sections_indptr[item + 1]]
+        return {
+            "document": self.document_id,
+            "chapter": self.chapter_names[chapter_id] if chapter_id >= 0 else None,
+            "section": self.section_names[section_id] if section_id >= 0 else None,
+            "sections": [self.section_names[int(covered_id)] for covered_id in covered]
+        }
+
+class ChapterView(Mapping):
+    """Read-only {"sections", "content"} view of one chapter of a SectionMap."""
+
+    def __init__(self, content, sections):
+        self._data = {"content": content, "sections": sections}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+class SectionMap(Mapping):
+    """
+    Read-only view with the shape of parse_document_structure() output.
+
+    Chapter and section names are kept in small dicts; the section lines are
+    IndexedStrings views into the document content table.
+    """
+
+    def __init__(self, content, chapter_names, section_names, entry_chapter_ids, entry_section_ids,
+                 entry_lines_indptr, entry_line_ids):
+        self._chapters = {}
+        for entry_id in range(len(entry_chapter_ids)):
+            chapter_name = chapter_names[int(entry_chapter_ids[entry_id])]
+            section_id = int(entry_section_ids[entry_id])
+            lines = IndexedStrings(content, entry_line_ids[entry_lines_indptr[entry_id]:entry_lines_indptr[entry_id + 1]])
+            if section_id < 0:
+                self._chapters[chapter_name] = ChapterView(lines, {})
+            else:
+                self._chapters[chapter_name]["sections"][section_names[section_id]] = lines
+
+    def __getitem__(self, chapter_name):
+        return self._chapters[chapter_name]
+
+    def __iter__(self):
+        return iter(self._chapters)
+
+    def __len__(self):
+        return len(self._chapters)
@@ -0,0 +1,293 @@
+"""
+Corpus Registry
+
+This module loads the guideline documents of the corpus: the main guide plus
+any further volumes listed in GUIDELINE_DOCUMENTS. Documents are parsed,
+chunked and indexed in parallel worker processes, one index shard per
+document, and every chunk records the document it came from.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from document_processor import extract_docx_content, parse_document_structure
+from chunker import chunk_document
+from chunk_index import ChunkIndex
+from section_index import SectionTitleIndex, SectionTextIndex
+from treatment_index import TreatmentIndex
+from corpus_file import ChainedSequence
+from index_store import (
+    compute_document_fingerprint, has_snapshot, save_snapshot, load_snapshot,
+    save_corpus_artifact, load_corpus_artifact
+)
+from config import DOCUMENT_PATH, PRIMARY_DOCUMENT_ID, GUIDELINE_DOCUMENTS, CORPUS_MAX_WORKERS, CORPUS_ARTIFACT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Publications of the corpus in this process, counted by set_corpus_documents()
+corpus_generation = 0
+
+class GuidelineDocument:
+    """A loaded guideline document with its section indexes, treatment index and chunk index shard."""
+
+    def __init__(self, document_id, fingerprint, content, sections, index, section_texts=None, treatment_index=None):
+        self.document_id = document_id
+        self.fingerprint = fingerprint
+        self.content = content
+        self.sections = sections
+        self.index = index
+        self.title_index = SectionTitleIndex(sections)
+        self.text_index = SectionTextIndex(sections, section_texts)
+        # Without the tables of the .docx, only the treatment lines of the text are indexed
+        self.treatment_index = treatment_index if treatment_index is not None else TreatmentIndex.build(content)
+
+class CorpusState:
+    """
+    One published version of the corpus: the documents and everything served from them.
+
+    A state is never changed after it is built. Readers take the current state
+    once and use only it, so a reload that publishes a new state in between is
+    never seen half done.
+    """
+
+    def __init__(self, documents, generation=0):
+        self.documents = documents
+        self.generation = generation
+        # Hash of the documents' fingerprints; see get_corpus_version()
+        self.version = compute_corpus_version(documents) if documents else None
+        self.primary = documents.get(PRIMARY_DOCUMENT_ID)
+        # One chunk index shard per document that has chunks, the main guide first
+        self.shards = [document.index for document in documents.values() if len(document.index)]
+        self.chunks = ChainedSequence([index.chunks for index in self.shards])
+
+# The published corpus, replaced as a whole by set_corpus_documents()
+corpus_state = CorpusState({})
+
+def build_document_index(document_id, content):
+    """Chunk the document lines and build their index shard, tagging every chunk with the document id."""
+    chunk_records = chunk_document(content)
+    chunks = [record["text"] for record in chunk_records]
+    chunk_metadata = [
+        {"document": document_id, "chapter": record["chapter"], "section": record["section"], "sections": record["sections"]}
+        for record in chunk_records
+    ]
+    return ChunkIndex.build(chunks, chunk_metadata)
+
+def parse_guideline_document(document_id, document_source, use_snapshot=True):
+    """
+    Parse and index one document. Runs in a worker process.
+
+    Documents with a saved snapshot are left for the parent process to
+    memory-map, and so are documents whose new snapshot could be saved, so
+    that every process serves the shared file. Only when no snapshot can be
+    used is the parsed document sent back.
+
+    Returns:
+        tuple: (document id, fingerprint, (content, sections, index, treatment_index) or None)
+    """
+    fingerprint = compute_document_fingerprint(document_source)
+    if use_snapshot and has_snapshot(fingerprint, document_id):
+        return document_id, fingerprint, None
+
+    content, tables = extract_docx_content(document_source)
+    if not content:
+        raise ValueError(f"No text could be extracted from document {document_id}")
+    sections = parse_document_structure(content)
+    index = build_document_index(document_id, content)
+    treatment_index = TreatmentIndex.build(content, tables)
+    if use_snapshot and fingerprint and save_snapshot(fingerprint, content, sections, index, document_id, treatment_index):
+        return document_id, fingerprint, None
+    return document_id, fingerprint, (content, sections, index, treatment_index)
+
+def open_guideline_document(document_id, document_source, fingerprint, parsed):
+    """Turn the result of parse_guideline_document into a GuidelineDocument."""
+    section_texts = None
+    if parsed is None:
+        snapshot = load_snapshot(fingerprint, document_id)
+        if snapshot is None:
+            # The snapshot disappeared or is unreadable, so parse in this process
+            _, fingerprint, parsed = parse_guideline_document(document_id, document_source, use_snapshot=False)
+        else:
+            # Memory-mapped views: the text stays in the shared snapshot file
+            content, sections, index, section_texts, treatment_index = snapshot
+            parsed = (content, sections, index, treatment_index)
+    content, sections, index, treatment_index = parsed
+    logger.info(f"Loaded document {document_id} with {len(content)} lines, {len(sections)} chapters and {len(index)} chunks")
+    return GuidelineDocument(document_id, fingerprint, content, sections, index, section_texts, treatment_index)
+
+def get_document_sources(primary_source):
+    """
+    Get the sources of every document in the corpus.
+
+    Returns:
+        dict: document id -> path or BytesIO, the main guide first; volumes
+            whose file is missing are left out
+    """
+    document_sources = {PRIMARY_DOCUMENT_ID: primary_source}
+    for document_id, document_path in GUIDELINE_DOCUMENTS.items():
+        if document_id == PRIMARY_DOCUMENT_ID:
+            continue
+        if os.path.exists(document_path):
+            document_sources[document_id] = document_path
+        else:
+            logger.info(f"Skipping guideline document {document_id}: {document_path} not found")
+    return document_sources
+
+def load_corpus(document_sources, max_workers=CORPUS_MAX_WORKERS, use_snapshots=True):
+    """
+    Load several documents in parallel, one worker process per document up to max_workers.
+
+    A single document is loaded in this process. Documents that fail to load
+    are logged and left out. With use_snapshots=False every document is
+    parsed and nothing is read from or written to VECTOR_DB_PATH.
+
+    Returns:
+        dict: document id -> GuidelineDocument, in the order of document_sources
+    """
+    results = {}
+    pending = dict(document_sources)
+    workers = min(max_workers or os.cpu_count() or 1, len(document_sources))
+
+    if workers > 1:
+        try:
+            # Spawned workers do not inherit locks held by other threads of the parent
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {
+                    document_id: executor.submit(parse_guideline_document, document_id, document_source, use_snapshots)
+                    for document_id, document_source in document_sources.items()
+                }
+                for document_id, future in futures.items():
+                    try:
+                        results[document_id] = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Error loading document {document_id}: {e}")
+                    del pending[document_id]
+        except Exception as e:
+            logger.warning(f"Could not load documents in worker processes, loading the rest one by one: {e}")
+
+    for document_id, document_source in pending.items():
+        try:
+            results[document_id] = parse_guideline_document(document_id, document_source, use_snapshots)
+        except Exception as e:
+            logger.error(f"Error loading document {document_id}: {e}")
+
+    documents = {}
+    for document_id, document_source in document_sources.items():
+        if document_id not in results:
+            continue
+        _, fingerprint, parsed = results[document_id]
+        try:
+            documents[document_id] = open_guideline_document(document_id, document_source, fingerprint, parsed)
+        except Exception as e:
+            logger.error(f"Error opening document {document_id}: {e}")
+    return documents
+
+def build_corpus_artifact(artifact_path=CORPUS_ARTIFACT_PATH, primary_source=DOCUMENT_PATH):
+    """
+    Parse, chunk and index every available guideline document into one corpus artifact.
+
+    Returns:
+        dict: document id -> GuidelineDocument of the documents written
+    """
+    documents = load_corpus(get_document_sources(primary_source), use_snapshots=False)
+    if PRIMARY_DOCUMENT_ID not in documents:
+        raise ValueError(f"Could not load the main guide from {primary_source}")
+    save_corpus_artifact(artifact_path, documents)
+    return documents
+
+def open_corpus_artifact(artifact_path=CORPUS_ARTIFACT_PATH, verify_sources=True):
+    """
+    Open the documents of a prebuilt corpus artifact.
+
+    With verify_sources, the artifact is only used if every document file
+    that exists locally still has the fingerprint it was built from, so a
+    stale artifact never hides an edited guide.
+
+    Returns:
+        dict: document id -> GuidelineDocument, or None if the artifact is
+            missing, unreadable or stale
+    """
+    artifact = load_corpus_artifact(artifact_path)
+    if not artifact or PRIMARY_DOCUMENT_ID not in artifact:
+        return None
+
+    if verify_sources:
+        document_paths = dict(GUIDELINE_DOCUMENTS, **{PRIMARY_DOCUMENT_ID: DOCUMENT_PATH})
+        for document_id, (fingerprint, *_) in artifact.items():
+            document_path = document_paths.get(document_id)
+            if document_path and os.path.exists(document_path) and compute_document_fingerprint(document_path) != fingerprint:
+                logger.info(f"Ignoring stale corpus artifact at {artifact_path}: document {document_id} has changed")
+                return None
+
+    return {
+        document_id: GuidelineDocument(document_id, fingerprint, content, sections, index, section_texts, treatment_index)
+        for document_id, (fingerprint, content, sections, index, section_texts, treatment_index) in artifact.items()
+    }
+
+def compute_corpus_version(documents):
+    """Hash the ids and fingerprints of a set of documents."""
+    digest = hashlib.sha256()
+    for document_id, document in documents.items():
+        digest.update(f"{document_id}:{document.fingerprint}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def set_corpus_documents(documents):
+    """
+    Publish a new set of loaded documents.
+
+    The new state is built completely first and then swapped in with a single
+    assignment.
+
+    Returns:
+        CorpusState: the published state
+    """
+    global corpus_state, corpus_generation
+    corpus_generation += 1
+    state = CorpusState(documents, corpus_generation)
+    corpus_state = state
+    return state
+
+def get_corpus_state():
+    """Get the published corpus state."""
+    return corpus_state
+
+def get_corpus_version():
+    """
+    Get the version of the loaded corpus.
+
+    Unlike the state's generation, which counts publications in one
+    process, this depends only on the document files, so every worker
+    serving the same files reports the same version. None before loading.
+    """
+    return corpus_state.version
+
+def get_corpus_documents():
+    """Get the loaded documents by document id, the main guide first."""
+    return corpus_state.documents
+
+def get_corpus_document(document_id):
+    """Get one loaded document, or None if it is not in the corpus."""
+    return corpus_state.documents.get(document_id)
+
+def lookup_treatment(condition):
+    """
+    Look up the guideline treatment lines and dosing tables of a condition.
+
+    Documents are checked in corpus order, so the main guide wins over
+    further volumes.
+
+    Returns:
+        dict: the treatment entry (see TreatmentIndex) with the id of its
+            "document", or None if no document has treatment data for it
+    """
+    for document_id, document in corpus_state.documents.items():
+        entry = document.treatment_index.lookup(condition)
+        if entry is not None:
+            return dict(entry, document=document_id)
+    return None
@@ -1,72 +1,230 @@
 import os
 import logging
-import docx
+import posixpath
+import time
+import zipfile
+import xml.etree.ElementTree as ET
 import requests
 from io import BytesIO
-from config import DOCUMENT_PATH
+from config import DOCUMENT_PATH, PRIMARY_DOCUMENT_ID
+from section_index import SectionTitleIndex, SectionTextIndex, highlight_snippet
 
 logger = logging.getLogger(__name__)
 
-# Global variables to store document content
-document_content = []
-document_sections = {}
+# Upper bound on the occurrence offsets returned per search hit
+MAX_MATCH_OFFSETS = 50
 
-def extract_text_from_docx(docx_path_or_bytes):
-    """Extract text from a .docx file or BytesIO object."""
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+PACKAGE_RELATIONSHIPS_NAMESPACE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_DOCUMENT_RELATIONSHIP = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+DEFAULT_DOCUMENT_PART = "word/document.xml"
+
+BODY_TAG = WORD_NAMESPACE + "body"
+PARAGRAPH_TAG = WORD_NAMESPACE + "p"
+RUN_TAG = WORD_NAMESPACE + "r"
+HYPERLINK_TAG = WORD_NAMESPACE + "hyperlink"
+BREAK_TAG = WORD_NAMESPACE + "br"
+TABLE_TAG = WORD_NAMESPACE + "tbl"
+TABLE_ROW_TAG = WORD_NAMESPACE + "tr"
+TABLE_CELL_TAG = WORD_NAMESPACE + "tc"
+BREAK_TYPE_ATTRIBUTE = WORD_NAMESPACE + "type"
+
+# Text equivalents of run content elements, as python-docx renders them
+RUN_CONTENT_TEXT = {
+    WORD_NAMESPACE + "tab": "\t",
+    WORD_NAMESPACE + "ptab": "\t",
+    WORD_NAMESPACE + "cr": "\n",
+    WORD_NAMESPACE + "noBreakHyphen": "-"
+}
+
+def find_main_document_part(package):
+    """Find the name of the main document part of an open .docx zip package."""
     try:
-        # Check if we received a BytesIO object directly (for Vercel environment)
-        if isinstance(docx_path_or_bytes, BytesIO):
-            doc = docx.Document(docx_path_or_bytes)
+        relationships = ET.fromstring(package.read("_rels/.rels"))
+        for relationship in relationships.iter(PACKAGE_RELATIONSHIPS_NAMESPACE + "Relationship"):
+            if relationship.get("Type") == OFFICE_DOCUMENT_RELATIONSHIP:
+                return posixpath.normpath(relationship.get("Target").lstrip("/"))
+    except KeyError:
+        pass
+    return DEFAULT_DOCUMENT_PART
+
+def run_text(run):
+    """Get the text of a w:r element the way python-docx renders it."""
+    parts = []
+    for child in run:
+        if child.tag == WORD_NAMESPACE + "t":
+            parts.append(child.text or "")
+        elif child.tag == BREAK_TAG:
+            # Only line breaks become text; page and column breaks are dropped
+            if child.get(BREAK_TYPE_ATTRIBUTE, "textWrapping") == "textWrapping":
+                parts.append("\n")
         else:
-            # Traditional file path approach
-            doc = docx.Document(docx_path_or_bytes)
-            
-        text = []
-        
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text.append(paragraph.text.strip())
-        
-        return text
+            parts.append(RUN_CONTENT_TEXT.get(child.tag, ""))
+    return "".join(parts)
+
+def paragraph_text(paragraph):
+    """Get the text of a w:p element from its runs and hyperlinks."""
+    parts = []
+    for child in paragraph:
+        if child.tag == RUN_TAG:
+            parts.append(run_text(child))
+        elif child.tag == HYPERLINK_TAG:
+            parts.extend(run_text(run) for run in child if run.tag == RUN_TAG)
+    return "".join(parts)
+
+def table_rows(table):
+    """Get the rows of a w:tbl element as lists of cell texts, skipping empty rows."""
+    rows = []
+    for row in table.findall(TABLE_ROW_TAG):
+        cells = [
+            " ".join(text for text in (paragraph_text(paragraph).strip() for paragraph in cell.iter(PARAGRAPH_TAG)) if text)
+            for cell in row.findall(TABLE_CELL_TAG)
+        ]
+        if any(cells):
+            rows.append(cells)
+    return rows
+
+def iter_docx_blocks(docx_path_or_bytes):
+    """
+    Stream the top-level paragraphs and tables of a .docx file or BytesIO object.
+    
+    The main document XML is read straight from the zip package with an
+    incremental parser, and every top-level body element is discarded once it
+    has been read, so memory stays flat regardless of document size.
+    
+    Yields:
+        tuple: ("paragraph", stripped non-empty text) or ("table", rows) in
+            document order, where rows are lists of cell texts
+    """
+    with zipfile.ZipFile(docx_path_or_bytes) as package:
+        with package.open(find_main_document_part(package)) as document_xml:
+            body = None
+            depth = 0
+            for event, element in ET.iterparse(document_xml, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if element.tag == BODY_TAG and body is None:
+                        body = element
+                    continue
+                
+                depth -= 1
+                # Direct children of w:body sit at depth 2 (w:document > w:body > child)
+                if body is not None and depth == 2:
+                    if element.tag == PARAGRAPH_TAG:
+                        text = paragraph_text(element).strip()
+                        if text:
+                            yield "paragraph", text
+                    elif element.tag == TABLE_TAG:
+                        rows = table_rows(element)
+                        if rows:
+                            yield "table", rows
+                    body.clear()
+
+def iter_docx_paragraphs(docx_path_or_bytes):
+    """
+    Stream the stripped, non-empty paragraph texts of a .docx file or BytesIO object.
+    
+    As with python-docx's Document.paragraphs, only paragraphs directly in the
+    body are yielded; table cell paragraphs are skipped.
+    
+    Yields:
+        str: paragraph text in document order
+    """
+    for kind, value in iter_docx_blocks(docx_path_or_bytes):
+        if kind == "paragraph":
+            yield value
+
+def extract_text_from_docx(docx_path_or_bytes):
+    """Extract the paragraph text of a .docx file or BytesIO object."""
+    try:
+        return list(iter_docx_paragraphs(docx_path_or_bytes))
     except Exception as e:
         logger.error(f"Error extracting text from document: {e}")
         return []
 
-def parse_document_structure(content):
-    """Parse the document to identify chapters and sections."""
+def extract_docx_content(docx_path_or_bytes):
+    """
+    Extract the paragraph text and the tables of a .docx file or BytesIO object in one pass.
+    
+    Returns:
+        tuple: (content, tables) where content is the list of paragraph texts
+            and tables a list of (number of paragraphs before the table, rows)
+            pairs
+    """
+    try:
+        content = []
+        tables = []
+        for kind, value in iter_docx_blocks(docx_path_or_bytes):
+            if kind == "paragraph":
+                content.append(value)
+            else:
+                tables.append((len(content), value))
+        return content, tables
+    except Exception as e:
+        logger.error(f"Error extracting text from document: {e}")
+        return [], []
+
+def classify_line(line, in_chapter):
+    """
+    Classify a document line as a chapter heading, section heading or body text.
+    
+    Returns:
+        tuple: (kind, value)
+            kind (str): "chapter", "section", "text", or None for chapter-like
+                lines that cannot be parsed (the structure parser skips these)
+            value (str): the chapter name for chapter headings, otherwise the line
+    """
+    # Check for chapter headings
+    if line.startswith("Chapter "):
+        parts = line.split(".")
+        if len(parts) >= 2:
+            return "chapter", parts[1].strip()
+        return None, line
+    # Check for section headings (non-chapter lines that aren't too long)
+    if in_chapter and len(line) < 100 and not line.startswith("Table of Contents") and not line.isdigit():
+        return "section", line
+    return "text", line
+
+def parse_document_structure(content, line_ids=False):
+    """
+    Parse the document to identify chapters and sections.
+    
+    content can be any iterable of lines, including iter_docx_paragraphs().
+    With line_ids=True the chapters and sections hold the positions of their
+    lines in content instead of the lines themselves.
+    """
     sections = {}
     current_chapter = None
     current_section = None
     
-    for line in content:
-        # Check for chapter headings
-        if line.startswith("Chapter "):
-            parts = line.split(".")
-            if len(parts) >= 2:
-                current_chapter = parts[1].strip()
-                current_section = None
-                sections[current_chapter] = {"sections": {}, "content": []}
-        # Check for section headings (non-chapter lines that aren't too long)
-        elif current_chapter and len(line) < 100 and not line.startswith("Table of Contents") and not line.isdigit():
-            current_section = line
+    for line_id, line in enumerate(content):
+        kind, value = classify_line(line, bool(current_chapter))
+        if kind == "chapter":
+            current_chapter = value
+            current_section = None
+            sections[current_chapter] = {"sections": {}, "content": []}
+        elif kind == "section":
+            current_section = value
             if current_section not in sections[current_chapter]["sections"]:
                 sections[current_chapter]["sections"][current_section] = []
         # Add content to current section or chapter
-        elif current_chapter:
+        elif kind == "text" and current_chapter:
+            entry = line_id if line_ids else line
             if current_section:
-                sections[current_chapter]["sections"][current_section].append(line)
+                sections[current_chapter]["sections"][current_section].append(entry)
             else:
-                sections[current_chapter]["content"].append(line)
+                sections[current_chapter]["content"].append(entry)
     
     return sections
 
+def is_vercel_environment():
+    """Check whether the app is running on Vercel."""
+    return os.environ.get('VERCEL') == '1' or 'VERCEL_URL' in os.environ
+
 def try_vercel_document_loading():
     """Try to load document in a Vercel-compatible way via various methods."""
     try:
-        # Check if we're running on Vercel
-        is_vercel = os.environ.get('VERCEL') == '1'
-        
-        if is_vercel or 'VERCEL_URL' in os.environ:
+        if is_vercel_environment():
             logger.info("Detected Vercel environment, attempting to load document using various methods")
             
             # Method 1: Try to load from the local filesystem first (our build script should have placed it there)
@@ -156,58 +314,95 @@ def try_vercel_document_loading():
 
 def initialize_document_processor():
     """Initialize the document processor by loading and parsing the document."""
-    global document_content, document_sections
+    from corpus_registry import get_document_sources, load_corpus, open_corpus_artifact
     
-    # First try Vercel-specific loading
+    # A prebuilt corpus artifact is memory-mapped as is, without the .docx or
+    # the network. On Vercel it was built from the same deployment, so the
+    # fingerprint check against the .docx files is skipped
+    documents = open_corpus_artifact(verify_sources=not is_vercel_environment())
+    if documents:
+        return publish_corpus_documents(documents)
+    
+    # Then try Vercel-specific loading
     document_source = try_vercel_document_loading()
+    from_vercel_handler = bool(document_source)
     
-    if document_source:
-        # Check if we got a path or BytesIO object
-        if isinstance(document_source, str):
-            # We got a file path
-            logger.info(f"Loading document from path provided by Vercel handler: {document_source}")
-            document_content = extract_text_from_docx(document_source)
-        else:
-            # We got a BytesIO object
-            logger.info("Loading document from BytesIO object provided by Vercel handler")
-            document_content = extract_text_from_docx(document_source)
-    else:
+    if not from_vercel_handler:
         # Traditional path - load from file
         if not os.path.exists(DOCUMENT_PATH):
             logger.error(f"Document not found at {DOCUMENT_PATH}")
             
             # Check if we're on Vercel and need to leave a message for debugging
-            if os.environ.get('VERCEL') == '1' or 'VERCEL_URL' in os.environ:
+            if is_vercel_environment():
                 logger.warning("Running on Vercel without access to document file.")
                 logger.warning("Please check that the document is properly deployed.")
             
             return False
         
+        document_source = DOCUMENT_PATH
+    
+    if not from_vercel_handler:
         logger.info(f"Loading document from {DOCUMENT_PATH}")
-        document_content = extract_text_from_docx(DOCUMENT_PATH)
+    elif isinstance(document_source, str):
+        # We got a file path
+        logger.info(f"Loading document from path provided by Vercel handler: {document_source}")
+    else:
+        # We got a BytesIO object
+        logger.info("Loading document from BytesIO object provided by Vercel handler")
+    
+    # Load the main guide and any further guideline volumes in parallel; each
+    # document reuses its saved index snapshot when the file is unchanged
+    documents = load_corpus(get_document_sources(document_source))
+    return publish_corpus_documents(documents)
+
+def publish_corpus_documents(documents):
+    """Publish loaded documents to the corpus registry, which serves their main guide through this module."""
+    from corpus_registry import set_corpus_documents
     
-    if not document_content:
+    primary_document = documents.get(PRIMARY_DOCUMENT_ID)
+    if primary_document is None:
         logger.error("Failed to extract content from document")
         return False
     
-    logger.info(f"Successfully loaded document with {len(document_content)} lines")
-    
-    # Parse document structure
-    document_sections = parse_document_structure(document_content)
-    logger.info(f"Parsed document into {len(document_sections)} chapters")
+    set_corpus_documents(documents)
+    logger.info(f"Parsed document into {len(primary_document.sections)} chapters")
+    logger.info(f"Loaded {len(documents)} guideline documents: {', '.join(documents)}")
     
     return True
 
+def get_primary_document():
+    """Get the main guide of the published corpus, or None before it is loaded."""
+    from corpus_registry import get_corpus_state
+    return get_corpus_state().primary
+
 def get_document_content():
     """Get the full document content."""
-    return document_content
+    document = get_primary_document()
+    return document.content if document is not None else []
 
 def get_document_sections():
     """Get the parsed document sections."""
-    return document_sections
+    document = get_primary_document()
+    return document.sections if document is not None else {}
+
+def get_section_title_index():
+    """Get the index over chapter and section titles."""
+    document = get_primary_document()
+    return document.title_index if document is not None else None
+
+def get_section_text_index():
+    """Get the lowercase text index over chapter and section bodies."""
+    document = get_primary_document()
+    return document.text_index if document is not None else None
+
+def get_document_fingerprint():
+    """Get the content hash of the loaded document."""
+    document = get_primary_document()
+    return document.fingerprint if document is not None else None
 
 def get_section_content(chapter, section=None):
     """Get content for a specific chapter and section."""
+    document_sections = get_document_sections()
     if chapter in document_sections:
         if section and section in document_sections[chapter]["sections"]:
             return document_sections[chapter]["sections"][section]
@@ -215,34 +410,59 @@ def get_section_content(chapter, section=None):
             return document_sections[chapter]["content"]
     return []
 
+def search_document_page(query, offset=0, limit=5, snippets=False, deadline=None):
+    """
+    Find the chapters and sections that contain the query, one page at a time.
+    
+    With snippets=True every hit also carries the character offsets of its
+    occurrences in the section text (" ".join of its lines) and a snippet
+    around the first one, plain and with <mark> highlights. Snippets come from
+    the position index of the section text index.
+    
+    deadline is an optional time.monotonic() value: once it passes, the page
+    is cut short after the current hit and "partial" is set, so callers can
+    fetch the rest from offset + len(results).
+    
+    Returns:
+        dict: "results" holds the page of {chapter, section, relevance} dicts,
+            most occurrences first, "total" the number of matching sections and
+            "partial" whether the page was cut short
+    """
+    text_index = get_section_text_index()
+    if text_index is None:
+        text_index = SectionTextIndex({})
+    
+    matches, total = text_index.search(query, offset, limit)
+    results = []
+    partial = False
+    for chapter_name, section_name, count in matches:
+        if results and deadline is not None and time.monotonic() > deadline:
+            partial = True
+            break
+        result = {"chapter": chapter_name, "section": section_name, "relevance": count}
+        if snippets:
+            result.update(build_search_snippet(text_index, chapter_name, section_name, query.lower()))
+        results.append(result)
+    return {"results": results, "total": total, "partial": partial}
+
+def build_search_snippet(text_index, chapter_name, section_name, query_lower):
+    """Build the match offsets and highlighted snippet of one search hit."""
+    entry_id = text_index.entry_ids[(chapter_name, section_name)]
+    offsets = text_index.match_offsets(entry_id, query_lower)
+    if not offsets:
+        return {"matches": [], "snippet": "", "snippet_offset": 0, "highlights": [], "snippet_html": ""}
+    snippet_start, snippet_end = text_index.snippet_bounds(entry_id, *offsets[0])
+    snippet, snippet_offset, highlights, snippet_html = highlight_snippet(
+        text_index.display_text(entry_id), snippet_start, snippet_end, offsets
+    )
+    return {
+        "matches": [list(match) for match in offsets[:MAX_MATCH_OFFSETS]],
+        "snippet": snippet,
+        "snippet_offset": snippet_offset,
+        "highlights": [list(highlight) for highlight in highlights],
+        "snippet_html": snippet_html
+    }
+
 def search_document(query, max_results=5):
     """Simple search function to find relevant sections for a query."""
-    results = []
-    
-    # Convert query to lowercase for case-insensitive search
-    query_lower = query.lower()
-    
-    # Search through chapters and sections
-    for chapter_name, chapter_data in document_sections.items():
-        # Search in chapter content
-        chapter_text = " ".join(chapter_data["content"])
-        if query_lower in chapter_text.lower():
-            results.append({
-                "chapter": chapter_name,
-                "section": None,
-                "relevance": chapter_text.lower().count(query_lower)
-            })
-        
-        # Search in sections
-        for section_name, section_content in chapter_data["sections"].items():
-            section_text = " ".join(section_content)
-            if query_lower in section_text.lower():
-                results.append({
-                    "chapter": chapter_name,
-                    "section": section_name,
-                    "relevance": section_text.lower().count(query_lower)
-                })
-    
-    # Sort by relevance and limit results
-    results.sort(key=lambda x: x["relevance"], reverse=True)
-    return results[:max_results]
+    return search_document_page(query, 0, max_results)["results"]
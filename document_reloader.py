@@ -0,0 +1,303 @@
+"""
+Document Reloader
+
+This module reloads guideline documents while the app is running, when the
+document watcher sees a file change or when an admin asks for it. The new
+version is diffed against the loaded one section by section, only the chapters
+that changed are re-chunked, unchanged chunks keep their tokenization, and the
+new index replaces the old one in a single swap.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from document_processor import extract_docx_content, parse_document_structure
+from chunker import chunk_document, split_chapter_runs
+from chunk_index import ChunkIndex
+from treatment_index import TreatmentIndex
+from corpus_registry import (
+    GuidelineDocument, build_document_index, get_corpus_document, get_corpus_documents, set_corpus_documents,
+    open_guideline_document
+)
+from index_store import compute_document_fingerprint, has_snapshot, save_snapshot
+from readiness import is_ready, mark_ready
+from config import DOCUMENT_PATH, PRIMARY_DOCUMENT_ID, GUIDELINE_DOCUMENTS, DOCUMENT_WATCH_INTERVAL, CORPUS_GENERATION_PATH
+
+logger = logging.getLogger(__name__)
+
+# Serializes reloads so the watcher and admin requests never build over each other
+reload_lock = threading.Lock()
+
+watcher_thread = None
+watcher_stop = threading.Event()
+
+def get_document_paths():
+    """Get the file path of every configured guideline document, the main guide first."""
+    document_paths = {PRIMARY_DOCUMENT_ID: DOCUMENT_PATH}
+    for document_id, document_path in GUIDELINE_DOCUMENTS.items():
+        document_paths.setdefault(document_id, document_path)
+    return document_paths
+
+def diff_sections(old_sections, new_sections):
+    """
+    Compare two parsed section maps.
+
+    Returns:
+        dict: "added", "removed" and "changed" lists of {chapter, section} dicts,
+            where section is None for a chapter's introduction text
+    """
+    def flatten(sections):
+        entries = {}
+        for chapter_name, chapter_data in sections.items():
+            entries[(chapter_name, None)] = chapter_data["content"]
+            for section_name, section_content in chapter_data["sections"].items():
+                entries[(chapter_name, section_name)] = section_content
+        return entries
+
+    old_entries = flatten(old_sections)
+    new_entries = flatten(new_sections)
+
+    def label(key):
+        return {"chapter": key[0], "section": key[1]}
+
+    return {
+        "added": [label(key) for key in new_entries if key not in old_entries],
+        "removed": [label(key) for key in old_entries if key not in new_entries],
+        "changed": [label(key) for key, lines in new_entries.items() if key in old_entries and old_entries[key] != lines]
+    }
+
+def rechunk_document(document_id, old_document, content):
+    """
+    Chunk new document lines, reusing the chunks of chapters whose lines did not change.
+
+    Returns:
+        tuple: (chunks, chunk_metadata, number of chapter runs re-chunked)
+    """
+    old_index = old_document.index
+
+    # Chunks never cross a chapter change, so the old chunks group into one
+    # run of equal chapter names per chapter run of the old document
+    chunk_groups = []
+    for chunk_id, metadata in enumerate(old_index.chunk_metadata):
+        if chunk_groups and chunk_groups[-1][0] == metadata["chapter"]:
+            chunk_groups[-1][1].append(chunk_id)
+        else:
+            chunk_groups.append((metadata["chapter"], [chunk_id]))
+
+    old_runs = split_chapter_runs(old_document.content)
+    reusable_runs = {}
+    if [chapter for chapter, _ in old_runs] == [chapter for chapter, _ in chunk_groups]:
+        for (_, lines), (_, chunk_ids) in zip(old_runs, chunk_groups):
+            reusable_runs[tuple(lines)] = chunk_ids
+    else:
+        logger.warning(f"Chunks of document {document_id} do not line up with its chapters, re-chunking everything")
+
+    chunks = []
+    chunk_metadata = []
+    rechunked_runs = 0
+    for _, lines in split_chapter_runs(content):
+        chunk_ids = reusable_runs.get(tuple(lines))
+        if chunk_ids is not None:
+            chunks.extend(old_index.chunks[chunk_id] for chunk_id in chunk_ids)
+            chunk_metadata.extend(dict(old_index.chunk_metadata[chunk_id]) for chunk_id in chunk_ids)
+            continue
+        rechunked_runs += 1
+        for record in chunk_document(lines):
+            chunks.append(record["text"])
+            chunk_metadata.append({
+                "document": document_id, "chapter": record["chapter"],
+                "section": record["section"], "sections": record["sections"]
+            })
+    return chunks, chunk_metadata, rechunked_runs
+
+def reload_document(document_id=PRIMARY_DOCUMENT_ID, force=False, notify=True):
+    """
+    Reload one guideline document from its file and swap in the new index.
+
+    Args:
+        document_id (str): id of the document to reload
+        force (bool): reload even if the file content has not changed
+        notify (bool): tell the other workers to reload as well
+
+    Returns:
+        dict: summary with a "status" of "unchanged", "reloaded" or "failed"
+    """
+    from rag_engine import initialize_rag_engine
+
+    document_path = get_document_paths().get(document_id)
+    if document_path is None:
+        return {"document": document_id, "status": "failed", "error": "Unknown document"}
+
+    with reload_lock:
+        try:
+            if not os.path.exists(document_path):
+                return {"document": document_id, "status": "failed", "error": f"{document_path} not found"}
+
+            old_document = get_corpus_document(document_id)
+            fingerprint = compute_document_fingerprint(document_path)
+            if old_document is not None and old_document.fingerprint == fingerprint and not force:
+                return {"document": document_id, "status": "unchanged"}
+
+            started = time.perf_counter()
+            if (old_document is not None and fingerprint and old_document.fingerprint != fingerprint
+                    and has_snapshot(fingerprint, document_id)):
+                # Another worker already indexed this version, so map its snapshot
+                document = open_guideline_document(document_id, document_path, fingerprint, None)
+                changes = diff_sections(old_document.sections, document.sections)
+                rechunked_runs = 0
+                saved = True
+            else:
+                content, tables = extract_docx_content(document_path)
+                if not content:
+                    return {"document": document_id, "status": "failed", "error": "No text could be extracted"}
+                sections = parse_document_structure(content)
+
+                if old_document is not None:
+                    changes = diff_sections(old_document.sections, sections)
+                    chunks, chunk_metadata, rechunked_runs = rechunk_document(document_id, old_document, content)
+                    index = ChunkIndex.build(chunks, chunk_metadata, previous=old_document.index)
+                else:
+                    changes = diff_sections({}, sections)
+                    index = build_document_index(document_id, content)
+                    rechunked_runs = None
+
+                treatment_index = TreatmentIndex.build(content, tables)
+                document = GuidelineDocument(document_id, fingerprint, content, sections, index, treatment_index=treatment_index)
+                saved = False
+
+            # Everything is built; publishing is the single swap of the corpus
+            # state, so readers see either the old corpus or the new one
+            documents = dict(get_corpus_documents())
+            documents[document_id] = document
+            set_corpus_documents(documents)
+            if not initialize_rag_engine():
+                return {"document": document_id, "status": "failed", "error": "Could not publish the new index"}
+            # A reload can bring up a corpus that failed to load at startup
+            mark_ready()
+
+            if fingerprint and not saved:
+                save_snapshot(fingerprint, document.content, document.sections, document.index, document_id, document.treatment_index)
+            if notify:
+                announce_reload()
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Reloaded document {document_id} in {elapsed:.2f}s: {len(changes['added'])} sections added, "
+                f"{len(changes['removed'])} removed, {len(changes['changed'])} changed"
+            )
+            return {
+                "document": document_id,
+                "status": "reloaded",
+                "changes": changes,
+                "chunks": len(document.index),
+                "rechunked_chapters": rechunked_runs,
+                "seconds": round(elapsed, 3)
+            }
+        except Exception as e:
+            logger.error(f"Error reloading document {document_id}: {e}")
+            return {"document": document_id, "status": "failed", "error": str(e)}
+
+def reload_documents(force=False, notify=True):
+    """Reload every configured guideline document whose file exists."""
+    results = [
+        reload_document(document_id, force, notify=False)
+        for document_id, document_path in get_document_paths().items()
+        if os.path.exists(document_path)
+    ]
+    if notify and any(result["status"] == "reloaded" for result in results):
+        announce_reload()
+    return results
+
+def _file_signature(document_path):
+    try:
+        stat = os.stat(document_path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+def announce_reload():
+    """Touch the shared marker file so every other worker reloads the documents."""
+    global seen_generation
+    try:
+        directory = os.path.dirname(CORPUS_GENERATION_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{CORPUS_GENERATION_PATH}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as marker:
+            marker.write(uuid.uuid4().hex)
+        os.replace(temporary_path, CORPUS_GENERATION_PATH)
+        # This worker is already up to date
+        with generation_lock:
+            seen_generation = _file_signature(CORPUS_GENERATION_PATH)
+    except OSError as e:
+        logger.error(f"Error announcing the document reload to the other workers: {e}")
+
+# Marker file signature this worker has caught up with; taken at import,
+# before the corpus is loaded, so a load always includes earlier reloads
+seen_generation = _file_signature(CORPUS_GENERATION_PATH)
+generation_lock = threading.Lock()
+
+def check_corpus_generation():
+    """
+    Start a background reload if another worker has reloaded the documents since this one last looked.
+
+    Cheap enough to run before every request: one stat of the marker file.
+    The request is served from the current corpus while the reload runs.
+
+    Returns:
+        bool: True if a reload was started
+    """
+    global seen_generation
+    # A load in progress reads the files anyway; look again once it is done
+    if not is_ready():
+        return False
+    signature = _file_signature(CORPUS_GENERATION_PATH)
+    if signature == seen_generation:
+        return False
+    with generation_lock:
+        if signature == seen_generation:
+            return False
+        seen_generation = signature
+    logger.info("Another worker reloaded the guideline documents, reloading them here")
+    threading.Thread(target=reload_documents, kwargs={"notify": False}, daemon=True, name="document-reload").start()
+    return True
+
+def watch_documents(interval):
+    """Poll the document files every interval seconds and reload the ones that change."""
+    signatures = {document_id: _file_signature(path) for document_id, path in get_document_paths().items()}
+    while not watcher_stop.wait(interval):
+        for document_id, document_path in get_document_paths().items():
+            signature = _file_signature(document_path)
+            if signature == signatures.get(document_id):
+                continue
+            signatures[document_id] = signature
+            if signature is None:
+                logger.warning(f"Document {document_id} disappeared from {document_path}, keeping the loaded version")
+                continue
+            logger.info(f"Detected a change to {document_path}, reloading document {document_id}")
+            reload_document(document_id)
+
+def start_document_watcher(interval=DOCUMENT_WATCH_INTERVAL):
+    """
+    Start the background document watcher.
+
+    Returns:
+        bool: True if a watcher is running, False when watching is disabled
+    """
+    global watcher_thread
+    if not interval or interval <= 0:
+        return False
+    if watcher_thread is not None and watcher_thread.is_alive():
+        return True
+
+    watcher_stop.clear()
+    watcher_thread = threading.Thread(target=watch_documents, args=(interval,), daemon=True, name="document-watcher")
+    watcher_thread.start()
+    logger.info(f"Watching guideline documents for changes every {interval}s")
+    return True
+
+def stop_document_watcher():
+    """Stop the background document watcher."""
+    watcher_stop.set()
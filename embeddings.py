@@ -0,0 +1,50 @@
+"""
+Embeddings
+
+This module provides a CPU-only text embedder that needs no network access or
+model files. Words are mapped into a fixed-size vector space by feature hashing
+of the whole word and its character trigrams, so related word forms
+("vomit", "vomiting") and spelling variants land close together.
+"""
+
+import zlib
+from functools import lru_cache
+import numpy as np
+from config import EMBEDDING_DIMENSIONS
+
+# Relative weight of the whole-word feature against the trigram features
+WORD_FEATURE_WEIGHT = 1.0
+TRIGRAM_FEATURE_WEIGHT = 0.5
+
+def _hashed_features(term):
+    """Yield (feature, weight) pairs for a lowercase term."""
+    yield f"w:{term}", WORD_FEATURE_WEIGHT
+    padded = f"<{term}>"
+    for i in range(len(padded) - 2):
+        yield f"t:{padded[i:i + 3]}", TRIGRAM_FEATURE_WEIGHT
+
+@lru_cache(maxsize=65536)
+def term_vector(term, dimensions=EMBEDDING_DIMENSIONS):
+    """Get the unit-length hashed embedding of a single term."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in _hashed_features(term):
+        feature_hash = zlib.crc32(feature.encode('utf-8'))
+        sign = 1.0 if feature_hash & 0x80000000 else -1.0
+        vector[feature_hash % dimensions] += sign * weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    vector.setflags(write=False)
+    return vector
+
+def term_vectors(terms, dimensions=EMBEDDING_DIMENSIONS):
+    """Stack the embeddings of several terms into a (len(terms), dimensions) matrix."""
+    if not terms:
+        return np.zeros((0, dimensions), dtype=np.float32)
+    return np.stack([term_vector(term, dimensions) for term in terms])
+
+def normalize_rows(matrix):
+    """Scale every row of a matrix to unit length, leaving zero rows alone."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
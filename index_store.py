@@ -0,0 +1,300 @@
+"""
+Index Store
+
+This module persists each parsed guideline document and its retrieval index to
+VECTOR_DB_PATH so that later process starts can memory-map them instead of
+re-parsing the .docx. Each snapshot is a single corpus file (see corpus_file)
+in one directory per document id, keyed by a content hash of the document.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from io import BytesIO
+import numpy as np
+from chunk_index import ChunkIndex, INDEX_ARRAYS
+from corpus_file import (
+    write_corpus_file, read_corpus_header, open_corpus_file, add_string_table, get_string_table,
+    SectionMap, ChunkMetadataList, chunk_sections
+)
+from document_processor import parse_document_structure
+from section_index import section_entry_text
+from treatment_index import TreatmentIndex
+from config import VECTOR_DB_PATH, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_DIMENSIONS, PRIMARY_DOCUMENT_ID
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the snapshot layout or the chunking/indexing logic changes
+SNAPSHOT_VERSION = 7
+
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".corpus"
+
+def compute_document_fingerprint(document_source):
+    """Compute the SHA-256 content hash of a document path or BytesIO object."""
+    try:
+        digest = hashlib.sha256()
+        if isinstance(document_source, BytesIO):
+            digest.update(document_source.getbuffer())
+        else:
+            with open(document_source, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+    except Exception as e:
+        logger.error(f"Error computing document fingerprint: {e}")
+        return None
+
+def get_document_store_path(document_id):
+    """Get the directory holding the snapshots of a document."""
+    return os.path.join(VECTOR_DB_PATH, document_id)
+
+def get_snapshot_path(fingerprint, document_id=PRIMARY_DOCUMENT_ID):
+    """Get the snapshot file for a document fingerprint."""
+    return os.path.join(get_document_store_path(document_id), f"{SNAPSHOT_PREFIX}v{SNAPSHOT_VERSION}-{fingerprint[:32]}{SNAPSHOT_SUFFIX}")
+
+def _build_parameters():
+    """Parameters that must match for a snapshot to be reused."""
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "embedding_dimensions": EMBEDDING_DIMENSIONS}
+
+def _is_compatible(header, fingerprint, document_id):
+    return (header.get("version") == SNAPSHOT_VERSION
+            and header.get("fingerprint") == fingerprint
+            and header.get("document_id") == document_id
+            and header.get("parameters") == _build_parameters())
+
+def has_snapshot(fingerprint, document_id=PRIMARY_DOCUMENT_ID):
+    """Check whether a usable snapshot exists for the fingerprint."""
+    try:
+        if not fingerprint:
+            return False
+        snapshot_path = get_snapshot_path(fingerprint, document_id)
+        if not os.path.exists(snapshot_path):
+            return False
+        if not _is_compatible(read_corpus_header(snapshot_path), fingerprint, document_id):
+            logger.info(f"Ignoring incompatible index snapshot at {snapshot_path}")
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Error checking index snapshot: {e}")
+        return False
+
+def has_document_snapshot(document_path, document_id=PRIMARY_DOCUMENT_ID):
+    """Check whether a usable snapshot exists for the document at the given path."""
+    if not os.path.exists(document_path):
+        return False
+    return has_snapshot(compute_document_fingerprint(document_path), document_id)
+
+def encode_snapshot(fingerprint, content, index, document_id=PRIMARY_DOCUMENT_ID, treatment_index=None):
+    """
+    Encode a parsed document, its chunk index and its treatment index as corpus file arrays.
+
+    The section map is stored as line ids into the content table, so every
+    line of the document is stored once.
+
+    Returns:
+        tuple: (header, arrays) for write_corpus_file
+    """
+    names = []
+    name_ids = {}
+
+    def name_id(name):
+        if name is None:
+            return -1
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    # One entry per chapter introduction and section, in SectionTextIndex order
+    entry_chapter_ids = []
+    entry_section_ids = []
+    entry_lines = []
+    for chapter_name, chapter_data in parse_document_structure(content, line_ids=True).items():
+        entry_chapter_ids.append(name_id(chapter_name))
+        entry_section_ids.append(-1)
+        entry_lines.append(chapter_data["content"])
+        for section_name, line_ids in chapter_data["sections"].items():
+            entry_chapter_ids.append(name_id(chapter_name))
+            entry_section_ids.append(name_id(section_name))
+            entry_lines.append(line_ids)
+
+    chunk_chapter_ids = [name_id(metadata["chapter"]) for metadata in index.chunk_metadata]
+    chunk_section_ids = [name_id(metadata["section"]) for metadata in index.chunk_metadata]
+    chunk_covered_ids = [[name_id(name) for name in chunk_sections(metadata)] for metadata in index.chunk_metadata]
+
+    arrays = {}
+    add_string_table(arrays, "content", content)
+    add_string_table(arrays, "names", names)
+    add_string_table(arrays, "section_texts", [
+        section_entry_text(content[line_id] for line_id in line_ids) for line_ids in entry_lines
+    ])
+    add_string_table(arrays, "chunks", index.chunks)
+    add_string_table(arrays, "terms", index.terms)
+    add_string_table(arrays, "gaps", index.gaps)
+    arrays["entry_chapter_ids"] = np.array(entry_chapter_ids, dtype=np.int32)
+    arrays["entry_section_ids"] = np.array(entry_section_ids, dtype=np.int32)
+    arrays["entry_lines_indptr"] = np.concatenate(([0], np.cumsum([len(line_ids) for line_ids in entry_lines]))).astype(np.int64)
+    arrays["entry_line_ids"] = np.array([line_id for line_ids in entry_lines for line_id in line_ids], dtype=np.int32)
+    arrays["chunk_chapter_ids"] = np.array(chunk_chapter_ids, dtype=np.int32)
+    arrays["chunk_section_ids"] = np.array(chunk_section_ids, dtype=np.int32)
+    arrays["chunk_sections_indptr"] = np.concatenate(([0], np.cumsum([len(ids) for ids in chunk_covered_ids]))).astype(np.int64)
+    arrays["chunk_section_list"] = np.array([name_id for ids in chunk_covered_ids for name_id in ids], dtype=np.int32)
+    for name in INDEX_ARRAYS:
+        arrays[f"index.{name}"] = getattr(index, name)
+    treatment_entries = treatment_index.entries if treatment_index is not None else []
+    arrays["treatments.json"] = np.frombuffer(json.dumps(treatment_entries, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "document_id": document_id,
+        "parameters": _build_parameters(),
+        "chunk_count": len(index.chunks),
+        "term_count": len(index.terms)
+    }
+    return header, arrays
+
+def decode_snapshot(header, arrays):
+    """
+    Build views over the arrays of a corpus file.
+
+    Returns:
+        tuple: (content, sections, index, section_texts, treatment_index) where
+            the strings are decoded from the arrays on access
+    """
+    content = get_string_table(arrays, "content")
+    names = get_string_table(arrays, "names")
+    sections = SectionMap(
+        content, names, names,
+        arrays["entry_chapter_ids"], arrays["entry_section_ids"],
+        arrays["entry_lines_indptr"], arrays["entry_line_ids"]
+    )
+    chunk_metadata = ChunkMetadataList(
+        header["document_id"], names, names, arrays["chunk_chapter_ids"], arrays["chunk_section_ids"],
+        arrays["chunk_sections_indptr"], arrays["chunk_section_list"]
+    )
+    index = ChunkIndex(
+        get_string_table(arrays, "chunks"),
+        chunk_metadata,
+        get_string_table(arrays, "terms"),
+        get_string_table(arrays, "gaps"),
+        {name: arrays[f"index.{name}"] for name in INDEX_ARRAYS}
+    )
+    treatment_index = TreatmentIndex(json.loads(arrays["treatments.json"].tobytes().decode("utf-8")))
+    return content, sections, index, get_string_table(arrays, "section_texts"), treatment_index
+
+def save_snapshot(fingerprint, content, sections, index, document_id=PRIMARY_DOCUMENT_ID, treatment_index=None):
+    """
+    Write the document content, section map and chunk index to a new snapshot file.
+
+    The file is written under a temporary name and renamed into place, so
+    concurrent workers only ever see complete snapshots. sections is not
+    stored separately: it is re-derived from content as line ids.
+    """
+    snapshot_path = get_snapshot_path(fingerprint, document_id)
+    store_path = get_document_store_path(document_id)
+    try:
+        os.makedirs(store_path, exist_ok=True)
+        if has_snapshot(fingerprint, document_id):
+            # Another worker got there first
+            return True
+
+        header, arrays = encode_snapshot(fingerprint, content, index, document_id, treatment_index)
+        write_corpus_file(snapshot_path, header, arrays)
+        logger.info(f"Saved index snapshot to {snapshot_path}")
+
+        _remove_old_snapshots(store_path, snapshot_path)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not save index snapshot to {store_path}: {e}")
+        return False
+
+def _remove_old_snapshots(store_path, current_path):
+    """Delete snapshots of other versions of the same document, including old snapshot directories."""
+    for name in os.listdir(store_path):
+        path = os.path.join(store_path, name)
+        if name.startswith(SNAPSHOT_PREFIX) and path != current_path:
+            logger.info(f"Removing outdated index snapshot {path}")
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def load_snapshot(fingerprint, document_id=PRIMARY_DOCUMENT_ID):
+    """
+    Memory-map the parsed document and its chunk index from a snapshot.
+
+    The document lines, chunks and index arrays stay in the mapped file, which
+    the OS page cache shares between every worker process that opens it.
+
+    Returns:
+        tuple: (content, sections, index, section_texts, treatment_index), or
+            None if there is no usable snapshot
+    """
+    try:
+        if not has_snapshot(fingerprint, document_id):
+            return None
+        snapshot_path = get_snapshot_path(fingerprint, document_id)
+        header, arrays = open_corpus_file(snapshot_path)
+        snapshot = decode_snapshot(header, arrays)
+        logger.info(f"Loaded index snapshot with {header['chunk_count']} chunks from {snapshot_path}")
+        return snapshot
+    except Exception as e:
+        logger.error(f"Error loading index snapshot: {e}")
+        return None
+
+def save_corpus_artifact(artifact_path, documents):
+    """
+    Write several loaded documents to one prebuilt corpus file.
+
+    Each document is encoded as in its snapshot, with its array names
+    prefixed by its document id.
+    """
+    header = {"version": SNAPSHOT_VERSION, "parameters": _build_parameters(), "documents": {}}
+    arrays = {}
+    for document_id, document in documents.items():
+        document_header, document_arrays = encode_snapshot(
+            document.fingerprint, document.content, document.index, document_id, document.treatment_index
+        )
+        header["documents"][document_id] = document_header
+        for name, array in document_arrays.items():
+            arrays[f"{document_id}/{name}"] = array
+
+    os.makedirs(os.path.dirname(artifact_path) or ".", exist_ok=True)
+    write_corpus_file(artifact_path, header, arrays)
+    logger.info(f"Saved corpus artifact with {len(documents)} documents to {artifact_path}")
+
+def load_corpus_artifact(artifact_path):
+    """
+    Memory-map every document of a prebuilt corpus file.
+
+    Returns:
+        dict: document id -> (fingerprint, content, sections, index, section_texts,
+            treatment_index)
+            in the order the documents were written, or None if the file is
+            missing or was built with other parameters
+    """
+    try:
+        if not os.path.exists(artifact_path):
+            return None
+        header, arrays = open_corpus_file(artifact_path)
+        if header.get("version") != SNAPSHOT_VERSION or header.get("parameters") != _build_parameters():
+            logger.warning(f"Ignoring incompatible corpus artifact at {artifact_path}")
+            return None
+
+        documents = {}
+        for document_id, document_header in header["documents"].items():
+            prefix = f"{document_id}/"
+            document_arrays = {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+            documents[document_id] = (document_header["fingerprint"],) + decode_snapshot(document_header, document_arrays)
+        logger.info(f"Loaded corpus artifact with {len(documents)} documents from {artifact_path}")
+        return documents
+    except Exception as e:
+        logger.error(f"Error loading corpus artifact: {e}")
+        return None
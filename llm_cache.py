@@ -0,0 +1,177 @@
+"""
+LLM Cache
+
+This module caches LLM responses by a hash of everything that determines them:
+the model, the messages, the sampling parameters and the version of the loaded
+guideline corpus. Responses are kept in a small in-process LRU and in a SQLite
+file that every worker on the machine shares, so a prompt answered once is
+served from the cache instead of a round trip to the API. Entries expire after
+a TTL and the file is trimmed to a maximum number of entries, least recently
+used first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from cache_utils import TTLCache
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MEMORY_SIZE, LLM_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Trim the SQLite file once every this many writes
+TRIM_INTERVAL = 100
+
+def response_cache_key(model, messages, temperature, max_tokens, document_version):
+    """Hash the inputs of an LLM call into a cache key."""
+    key_data = json.dumps(
+        [model, messages, temperature, max_tokens, document_version],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """Two-tier response cache: an in-process LRU in front of a shared SQLite file."""
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, memory_size=LLM_CACHE_MEMORY_SIZE,
+                 max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self.disk_hits = 0
+        self.writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._disk_enabled = bool(path)
+        if self._disk_enabled:
+            try:
+                self._create_table()
+            except Exception as e:
+                logger.warning(f"LLM response cache at {path} is not available, caching in memory only: {e}")
+                self._disk_enabled = False
+
+    def _connection(self):
+        """Get this thread's connection to the SQLite file, opening a new one in a forked process."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_table(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        # WAL lets workers read while another one writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        connection.commit()
+
+    def get(self, key):
+        """Get a cached response, or None."""
+        response = self.memory.get(key)
+        if response is not None or not self._disk_enabled:
+            return response
+
+        try:
+            now = time.time()
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+        except Exception as e:
+            logger.warning(f"Error reading the LLM response cache: {e}")
+            return None
+
+        self.disk_hits += 1
+        self.memory.set(key, row[0])
+        return row[0]
+
+    def set(self, key, response):
+        """Store a response in both tiers."""
+        self.memory.set(key, response)
+        if not self._disk_enabled:
+            return
+
+        try:
+            now = time.time()
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            connection.commit()
+            with self._lock:
+                self.writes += 1
+                trim = self.writes % TRIM_INTERVAL == 0
+            if trim:
+                self.trim()
+        except Exception as e:
+            logger.warning(f"Error writing the LLM response cache: {e}")
+
+    def trim(self):
+        """Delete expired responses and the least recently used ones beyond max_entries from the SQLite file."""
+        if not self._disk_enabled:
+            return
+        try:
+            connection = self._connection()
+            connection.execute("DELETE FROM responses WHERE created_at <= ?", (time.time() - self.ttl,))
+            connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            connection.commit()
+        except Exception as e:
+            logger.warning(f"Error trimming the LLM response cache: {e}")
+
+    def clear(self):
+        """Drop every cached response."""
+        self.memory.clear()
+        if self._disk_enabled:
+            try:
+                connection = self._connection()
+                connection.execute("DELETE FROM responses")
+                connection.commit()
+            except Exception as e:
+                logger.warning(f"Error clearing the LLM response cache: {e}")
+
+    def stats(self):
+        """Get the counters of both tiers."""
+        stats = {"memory": self.memory.stats(), "disk_hits": self.disk_hits, "disk_enabled": self._disk_enabled}
+        if self._disk_enabled:
+            try:
+                stats["disk_entries"] = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            except Exception as e:
+                logger.warning(f"Error reading the LLM response cache: {e}")
+        return stats
+
+response_cache = None
+response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Get the shared response cache, or None when LLM_CACHE_ENABLED is off."""
+    global response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if response_cache is None:
+        with response_cache_lock:
+            if response_cache is None:
+                response_cache = LLMResponseCache()
+    return response_cache
@@ -3,7 +3,7 @@ import os
 import logging
 import threading
 from pathlib import Path
-from config import DATABASE_URL
+from config import DATABASE_URL, DOCUMENT_PATH, CORPUS_ARTIFACT_PATH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,6 +24,15 @@ def background_initialization():
     else:
         logger.warning("Background initialization completed with issues")
 
+def start_background_initialization():
+    """Start loading the document processor and RAG engine in a daemon thread, once per process"""
+    from readiness import mark_loading
+    
+    # Only the first caller moves the corpus to "loading" and starts the thread
+    if not mark_loading():
+        return
+    threading.Thread(target=background_initialization, daemon=True, name="corpus-loader").start()
+
 def auto_initialize():
     """Performs initial database setup"""
     logger.info("Starting database initialization...")
@@ -69,11 +78,22 @@ try:
         if not Path(INIT_FLAG_FILE).exists():
             auto_initialize()
         
-        # Note: Background initialization won't work in serverless environment
-        # so we'll skip that for Vercel deployments
+        # Background initialization won't work in a serverless environment, so
+        # load the corpus now: vercel-build.sh prebuilt it, and memory-mapping
+        # the artifact takes milliseconds with no .docx parsing or network
+        from app import initialize_document_and_rag
+        initialize_document_and_rag()
 except Exception as e:
     logger.error(f"Error during Vercel initialization: {e}")
 
+# Under a WSGI server (gunicorn main:app) nothing runs the __main__ block below,
+# so start loading the corpus in every worker that imports the app; /readyz
+# answers 503 until it is done. Only an import as "main" counts: the spawn
+# workers of corpus_registry.load_corpus re-import this file as __mp_main__
+# under python main.py and must not load the corpus again
+if __name__ == "main" and not os.environ.get('VERCEL'):
+    start_background_initialization()
+
 # For local development
 if __name__ == "__main__":
     # Only run initialization if the flag file doesn't exist
@@ -82,9 +102,15 @@ if __name__ == "__main__":
         if not success:
             logger.error("Initialization failed. Check the logs for details.")
     
-    # Start background initialization in a separate thread
-    # This allows the app to start while document processing continues
-    threading.Thread(target=background_initialization, daemon=True).start()
+    # A saved index snapshot or prebuilt corpus loads in milliseconds, so use
+    # it before serving instead of leaving early requests without retrieval
+    from index_store import has_document_snapshot
+    if os.path.exists(CORPUS_ARTIFACT_PATH) or has_document_snapshot(DOCUMENT_PATH):
+        background_initialization()
+    else:
+        # Start background initialization in a separate thread
+        # This allows the app to start while document processing continues
+        start_background_initialization()
     
     # Start the application
     debug_mode = os.environ.get("FLASK_ENV") == "development"
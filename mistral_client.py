@@ -0,0 +1,309 @@
+"""
+Mistral Client
+
+This module provides the HTTP clients for the Mistral chat completions API. A
+client keeps one pooled session, so consecutive calls from a worker reuse open
+keep-alive connections instead of paying a new TCP and TLS handshake each
+time. Calls answered with 429 or a 5xx status, or that fail to connect, are
+retried with jittered exponential backoff. Every request, retries included,
+first takes a slot from the rate limiter that the workers share.
+
+MistralClient is the blocking client used by request handlers. The asyncio
+client, AsyncMistralClient, lives on one background event loop per process,
+where run_concurrently() fans independent calls out under a shared deadline.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from rate_limiter import get_rate_limiter, RateLimitTimeout, PRIORITY_INTERACTIVE, DEFAULT_WAITS
+from config import (
+    MISTRAL_API_KEY, MISTRAL_POOL_SIZE, MISTRAL_CONNECT_TIMEOUT, MISTRAL_READ_TIMEOUT,
+    MISTRAL_MAX_RETRIES, MISTRAL_BACKOFF_BASE, MISTRAL_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+
+# Statuses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class BaseMistralClient:
+    """Timeouts and retry policy shared by the blocking and asyncio clients."""
+
+    def __init__(self, api_key=MISTRAL_API_KEY, url=MISTRAL_API_URL, pool_size=MISTRAL_POOL_SIZE,
+                 connect_timeout=MISTRAL_CONNECT_TIMEOUT, read_timeout=MISTRAL_READ_TIMEOUT,
+                 max_retries=MISTRAL_MAX_RETRIES, backoff_base=MISTRAL_BACKOFF_BASE, backoff_max=MISTRAL_BACKOFF_MAX):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+    def backoff_delay(self, attempt, response=None):
+        """
+        Get the delay before retry number attempt (0 for the first retry).
+
+        A Retry-After header from the API is honoured up to backoff_max;
+        otherwise the delay is drawn uniformly from [0, base * 2^attempt] so
+        workers that were throttled together do not retry together.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def slot_deadline(self, priority, max_wait):
+        """Get the time by which a call of this priority must have its rate limiter slot."""
+        if max_wait is None:
+            max_wait = DEFAULT_WAITS.get(priority, DEFAULT_WAITS[PRIORITY_INTERACTIVE])
+        return time.time() + max_wait
+
+    def retry_delay(self, attempt, response):
+        """Get the delay before retrying a call answered with a retry status, pausing every worker on a 429."""
+        delay = self.backoff_delay(attempt, response)
+        if response.status_code == 429:
+            get_rate_limiter().throttle(delay)
+        return delay
+
+class MistralClient(BaseMistralClient):
+    """Pooled, keep-alive client for the Mistral chat completions API."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Retries are handled below, where the backoff and status rules live
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post_chat(self, payload, timeout=None, stream=False, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """
+        Send a chat completions request.
+
+        Args:
+            payload (dict): the request body
+            timeout (float): seconds to wait for the completion; defaults to
+                the client's read timeout
+            stream (bool): return as soon as the headers arrive and leave the
+                body to be read with iter_stream_deltas(); for payloads with
+                "stream": true. Only the request is retried, never a stream
+                that has started.
+            priority (int): rate limiter priority; see rate_limiter
+            max_wait (float): seconds to wait for rate limiter slots, for all
+                attempts together; defaults by priority
+
+        Returns:
+            requests.Response: the first response that is not retried, or the
+                last one once the retries are used up
+
+        Raises:
+            requests.exceptions.RequestException: if the API could not be
+                reached after every retry, or the completion timed out
+            RateLimitTimeout: if no rate limiter slot was free in time
+        """
+        timeouts = (self.connect_timeout, timeout or self.read_timeout)
+        slot_deadline = self.slot_deadline(priority, max_wait)
+        attempt = 0
+        while True:
+            if not get_rate_limiter().acquire(priority, max(0.0, slot_deadline - time.time())):
+                raise RateLimitTimeout("No Mistral API rate limit slot became free in time")
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeouts, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                # Includes connect timeouts and keep-alive connections the server
+                # closed; a read timeout is not retried, the caller's time is up
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Mistral API connection failed ({e}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self.retry_delay(attempt, response)
+                logger.warning(f"Mistral API returned status {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+def iter_stream_deltas(response):
+    """
+    Read a streamed chat completion (server-sent events) from a response.
+
+    Yields:
+        str: the content pieces of the completion as they arrive
+    """
+    # chunk_size=None hands over data as it arrives instead of filling 512-byte reads
+    for line in response.iter_lines(chunk_size=None):
+        if not line.startswith(b"data:"):
+            continue
+        data = line[len(b"data:"):].strip()
+        if data == b"[DONE]":
+            break
+        chunk = json.loads(data)
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+class AsyncMistralClient(BaseMistralClient):
+    """Pooled, keep-alive asyncio client for the Mistral chat completions API."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        )
+
+    async def post_chat(self, payload, timeout=None, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """
+        Send a chat completions request; see MistralClient.post_chat.
+
+        Raises:
+            httpx.HTTPError: if the API could not be reached after every
+                retry, or the completion timed out
+            RateLimitTimeout: if no rate limiter slot was free in time
+        """
+        timeouts = httpx.Timeout(timeout or self.read_timeout, connect=self.connect_timeout)
+        slot_deadline = self.slot_deadline(priority, max_wait)
+        attempt = 0
+        while True:
+            if not await get_rate_limiter().acquire_async(priority, max(0.0, slot_deadline - time.time())):
+                raise RateLimitTimeout("No Mistral API rate limit slot became free in time")
+            try:
+                response = await self.client.post(self.url, json=payload, timeout=timeouts)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Mistral API connection failed ({e}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self.retry_delay(attempt, response)
+                logger.warning(f"Mistral API returned status {response.status_code}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self):
+        """Close the pooled connections."""
+        await self.client.aclose()
+
+mistral_client = None
+mistral_client_pid = None
+mistral_client_lock = threading.Lock()
+
+# Background event loop of this process and the asyncio client that lives on it
+event_loop = None
+event_loop_pid = None
+async_mistral_client = None
+
+def get_mistral_client():
+    """
+    Get the shared client of this process.
+
+    The client is created on first use, and again in a forked worker, so
+    processes never share pooled sockets.
+    """
+    global mistral_client, mistral_client_pid
+    pid = os.getpid()
+    if mistral_client is None or mistral_client_pid != pid:
+        with mistral_client_lock:
+            if mistral_client is None or mistral_client_pid != pid:
+                mistral_client = MistralClient()
+                mistral_client_pid = pid
+    return mistral_client
+
+def get_event_loop():
+    """
+    Get the background event loop of this process, starting it on first use.
+
+    Async LLM calls run on this one long-lived loop, whatever thread they are
+    issued from, so the asyncio client and its pooled connections are reused
+    across requests. A forked worker starts its own loop.
+    """
+    global event_loop, event_loop_pid, async_mistral_client
+    pid = os.getpid()
+    if event_loop is None or event_loop_pid != pid:
+        with mistral_client_lock:
+            if event_loop is None or event_loop_pid != pid:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True, name="llm-event-loop").start()
+                async_mistral_client = None
+                event_loop = loop
+                event_loop_pid = pid
+    return event_loop
+
+def get_async_mistral_client():
+    """Get the shared asyncio client of this process. Only call it from the background event loop."""
+    global async_mistral_client
+    if async_mistral_client is None:
+        async_mistral_client = AsyncMistralClient()
+    return async_mistral_client
+
+async def gather_with_deadline(coroutines, deadline):
+    """
+    Await several coroutines concurrently, giving up on those still running after deadline seconds.
+
+    Returns:
+        dict: name -> result, or None for a coroutine that raised or ran out of time
+    """
+    tasks = {name: asyncio.ensure_future(coroutine) for name, coroutine in coroutines.items()}
+    if not tasks:
+        return {}
+    _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for name, task in tasks.items():
+        if task in pending:
+            logger.warning(f"LLM call {name} did not finish within {deadline}s")
+            results[name] = None
+        elif task.exception() is not None:
+            logger.error(f"LLM call {name} failed: {task.exception()}")
+            results[name] = None
+        else:
+            results[name] = task.result()
+    return results
+
+def run_concurrently(coroutines, deadline):
+    """
+    Run independent LLM coroutines concurrently on the background event loop and wait for them.
+
+    The whole batch shares one deadline, so the wait is about as long as the
+    slowest call, and never longer than deadline seconds.
+
+    Args:
+        coroutines (dict): name -> coroutine
+        deadline (float): seconds the batch may take
+
+    Returns:
+        dict: name -> result, or None for a call that failed or ran out of time
+    """
+    future = asyncio.run_coroutine_threadsafe(gather_with_deadline(coroutines, deadline), get_event_loop())
+    return future.result()
@@ -1,118 +1,383 @@
 import os
+import heapq
 import logging
 import re
-from document_processor import get_document_content, get_document_sections
-from config import CHUNK_SIZE
+import numpy as np
+from corpus_registry import get_corpus_documents, get_corpus_state
+from chunk_index import STOP_WORDS, top_k_chunks
+from cache_utils import TTLCache
+from context_packer import pack_context
+from readiness import is_loading, wait_until_ready
+from config import (
+    RETRIEVAL_MODE, DENSE_MIN_SCORE, DENSE_RELATIVE_MIN_SCORE, HYBRID_DENSE_WEIGHT, CONTEXT_CACHE_SIZE, CONTEXT_CACHE_TTL,
+    CONTEXT_TOKEN_BUDGET, READINESS_WAIT_MS, SIMULATION_CONTEXT_TOKEN_BUDGET, CASE_TOPICS
+)
 
 logger = logging.getLogger(__name__)
 
-# Global variables
-document_chunks = []
+# Generated contexts keyed by (corpus generation, normalized query); the
+# generation changes on every publication so entries never outlive their document
+context_cache = TTLCache(maxsize=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+
+# Context returned while the corpus is still loading; callers check for it to
+# skip LLM calls that would only see an empty context
+INDEX_LOADING_MESSAGE = "The medical guidelines are still loading. Please try again in a few seconds."
 
 def initialize_rag_engine():
-    """Initialize the RAG engine with document content."""
-    global document_chunks
-    
+    """
+    Initialize the RAG engine with the index shards of the loaded guideline documents.
+
+    The corpus registry has already chunked and indexed every document, in
+    parallel worker processes or from their saved snapshots, and published
+    them together with their shards; see set_corpus_documents().
+    """
     try:
-        document_content = get_document_content()
-        if not document_content:
+        state = get_corpus_state()
+        if not state.shards:
             logger.error("Document content is empty, cannot create document chunks")
             return False
         
-        # Combine content into a single text
-        full_text = "\n".join(document_content)
-        
-        # Split text into simple chunks
-        chunks = []
-        words = full_text.split()
-        
-        # Create simple chunks based on word count (approximating character count)
-        for i in range(0, len(words), CHUNK_SIZE // 5):  # Approximating 5 chars per word
-            chunk = " ".join(words[i:i + CHUNK_SIZE // 5])
-            chunks.append(chunk)
-        
-        document_chunks = chunks
-        logger.info(f"Split document into {len(chunks)} chunks")
+        # Contexts of older generations are never served again, so free them
+        context_cache.clear()
+        logger.info(f"Serving {len(state.chunks)} chunks from {len(state.shards)} guideline documents")
         
         return True
     except Exception as e:
         logger.error(f"Error initializing RAG engine: {e}")
         return False
 
+def get_document_chunks():
+    """Get the text of every served chunk, document by document."""
+    return get_corpus_state().chunks
+
+def get_index_shards(wait_ms=READINESS_WAIT_MS):
+    """
+    Get the published index shards.
+
+    While the corpus is still loading, wait up to wait_ms milliseconds for it
+    before giving up, so requests that arrive during startup are answered from
+    the index when it is only moments away.
+    """
+    shards = get_corpus_state().shards
+    if not shards and wait_until_ready(wait_ms):
+        shards = get_corpus_state().shards
+    return shards
+
+def chunk_result(index, chunk_id, score):
+    """Build a search result for a chunk, including its heading metadata."""
+    record = index.record(chunk_id)
+    return {
+        "content": index.chunks[chunk_id],
+        "score": score,
+        "document": record.document,
+        "chapter": record.chapter,
+        "section": record.section,
+        "sections": record.sections
+    }
+
+def merge_shard_results(shards, shard_scores, k):
+    """
+    Merge the scored chunks of every index shard into one ranking.
+    
+    Args:
+        shards (list): the index shards that were searched
+        shard_scores (list): one list of (chunk id, score) pairs per shard
+        k (int): number of results to return
+    
+    Returns:
+        list: the k best chunk results; ties keep document order, then chunk order
+    """
+    candidates = [
+        (-score, shard_number, chunk_id)
+        for shard_number, scored_chunks in enumerate(shard_scores)
+        for chunk_id, score in scored_chunks[:k]
+    ]
+    return [
+        chunk_result(shards[shard_number], chunk_id, -negative_score)
+        for negative_score, shard_number, chunk_id in heapq.nsmallest(k, candidates)
+    ]
+
+def score_keyword_chunks(index, query):
+    """
+    Score chunks against the query with the enhanced keyword weights.
+    
+    Returns:
+        list: (chunk id, score) pairs above the match threshold, best first
+    """
+    # Preprocess query to extract important terms
+    query_lower = query.lower()
+    
+    # Check for common patterns in medical queries
+    treatment_phrases = ['treatment for', 'treatment of', 'how to treat', 'medicine for', 'drug for', 'therapy for', 'exact treatment']
+    diagnosis_phrases = ['diagnosis of', 'symptoms of', 'signs of', 'diagnosing', 'diagnostic criteria', 'what is', 'what diagnosis']
+    
+    is_treatment_query = any(phrase in query_lower for phrase in treatment_phrases)
+    is_diagnosis_query = any(phrase in query_lower for phrase in diagnosis_phrases)
+    
+    # Extract keywords - give more importance to multi-word phrases
+    keywords = re.findall(r'\b\w+\b', query_lower)
+    phrases = re.findall(r'\b\w+(?:\s+\w+){1,3}\b', query_lower)  # Match 2-4 word phrases
+    
+    # Score chunks from the inverted index: every match adds to one score per
+    # chunk id, so the cost grows with the number of matching postings and no
+    # per-chunk objects are created
+    chunk_scores = np.zeros(len(index), dtype=np.float64)
+    
+    # Score individual keywords
+    for keyword in keywords:
+        # Skip common words that add noise
+        if len(keyword) <= 3 or keyword in STOP_WORDS:
+            continue
+        
+        # Higher score for exact matches (with word boundaries)
+        exact_matches, partial_matches = index.keyword_matches(keyword)
+        chunk_scores[exact_matches] += 2
+        chunk_scores[partial_matches] += 1
+    
+    # Score multi-word phrases - these get higher weights
+    for phrase in phrases:
+        # Higher score for longer phrases and key medical terms
+        phrase_len = len(phrase.split())
+        chunk_scores[index.phrase_matches(phrase)] += 3 * phrase_len
+    
+    # Boost score for chunks containing treatment info in treatment queries
+    if is_treatment_query:
+        chunk_scores[index.treatment_flags] *= 1.5
+    
+    # Boost score for chunks containing diagnosis info in diagnosis queries
+    if is_diagnosis_query:
+        chunk_scores[index.diagnosis_flags] *= 1.5
+    
+    # Only include chunks with meaningful score
+    chunk_ids = np.flatnonzero(chunk_scores > 2)  # Threshold to filter out weak matches
+    
+    # Sort by score (document order breaks ties)
+    chunk_ids = chunk_ids[np.lexsort((chunk_ids, -chunk_scores[chunk_ids]))]
+    return list(zip(chunk_ids.tolist(), chunk_scores[chunk_ids].tolist()))
+
 def search_similar_chunks(query, k=5):
     """Search for chunks similar to the query using enhanced keyword matching."""
-    if not document_chunks:
+    shards = get_index_shards()
+    if not shards:
         logger.error("Document chunks not initialized")
         logger.warning("This could be due to document loading issues in the Vercel environment")
         return []
     
     try:
-        # Preprocess query to extract important terms
-        query_lower = query.lower()
-        
-        # Check for common patterns in medical queries
-        treatment_phrases = ['treatment for', 'treatment of', 'how to treat', 'medicine for', 'drug for', 'therapy for', 'exact treatment']
-        diagnosis_phrases = ['diagnosis of', 'symptoms of', 'signs of', 'diagnosing', 'diagnostic criteria', 'what is', 'what diagnosis']
-        
-        is_treatment_query = any(phrase in query_lower for phrase in treatment_phrases)
-        is_diagnosis_query = any(phrase in query_lower for phrase in diagnosis_phrases)
-        
-        # Extract keywords - give more importance to multi-word phrases
-        keywords = re.findall(r'\b\w+\b', query_lower)
-        phrases = re.findall(r'\b\w+(?:\s+\w+){1,3}\b', query_lower)  # Match 2-4 word phrases
-        
-        # Score chunks based on keyword and phrase matches with enhanced weighting
-        chunk_scores = []
-        for chunk in document_chunks:
-            chunk_lower = chunk.lower()
-            score = 0
-            
-            # Score individual keywords
-            for keyword in keywords:
-                if keyword in chunk_lower:
-                    # Skip common words that add noise
-                    if len(keyword) <= 3 or keyword in ['and', 'the', 'for', 'with', 'what', 'this', 'that']:
-                        continue
-                    
-                    # Higher score for exact matches (with word boundaries)
-                    if re.search(r'\b' + re.escape(keyword) + r'\b', chunk_lower):
-                        score += 2
-                    else:
-                        score += 1
-            
-            # Score multi-word phrases - these get higher weights
-            for phrase in phrases:
-                if phrase in chunk_lower:
-                    # Higher score for longer phrases and key medical terms
-                    phrase_len = len(phrase.split())
-                    score += 3 * phrase_len
-            
-            # Boost score for chunks containing treatment info in treatment queries
-            if is_treatment_query and any(word in chunk_lower for word in ['treatment', 'therapy', 'drug', 'medication', 'dose', 'regimen', 'management']):
-                score *= 1.5
-            
-            # Boost score for chunks containing diagnosis info in diagnosis queries
-            if is_diagnosis_query and any(word in chunk_lower for word in ['symptom', 'diagnosis', 'sign', 'diagnostic', 'indication', 'criterion', 'criteria']):
-                score *= 1.5
-            
-            # Only include chunks with meaningful score
-            if score > 2:  # Threshold to filter out weak matches
-                chunk_scores.append({"content": chunk, "score": score})
-        
-        # Sort by score and return top k
-        sorted_chunks = sorted(chunk_scores, key=lambda x: x["score"], reverse=True)
-        return sorted_chunks[:k]
+        return merge_shard_results(shards, [score_keyword_chunks(index, query) for index in shards], k)
     except Exception as e:
         logger.error(f"Error searching document chunks: {e}")
         return []
 
-def generate_context_for_query(query):
-    """Generate a context for the given query by combining relevant chunks and structure the information."""
+def cut_weak_matches(shard_scores, min_score):
+    """
+    Drop scored chunks below min_score or below DENSE_RELATIVE_MIN_SCORE of the best score in any shard.
+    
+    Args:
+        shard_scores (list): one list of (chunk id, score) pairs per shard, best first
+    """
+    best_score = max((scored_chunks[0][1] for scored_chunks in shard_scores if scored_chunks), default=0.0)
+    cutoff = max(min_score, best_score * DENSE_RELATIVE_MIN_SCORE)
+    return [[(chunk_id, score) for chunk_id, score in scored_chunks if score >= cutoff] for scored_chunks in shard_scores]
+
+def search_dense_chunks(query, k=5):
+    """Search for chunks similar to the query by dense embedding similarity."""
+    shards = get_index_shards()
+    if not shards:
+        logger.error("Document chunks not initialized")
+        return []
+    
+    try:
+        shard_scores = [top_k_chunks(index.dense_scores([query])[0], k) for index in shards]
+        return merge_shard_results(shards, cut_weak_matches(shard_scores, DENSE_MIN_SCORE), k)
+    except Exception as e:
+        logger.error(f"Error searching document embeddings: {e}")
+        return []
+
+def search_hybrid_chunks(query, k=5):
+    """
+    Search for chunks by fusing dense embedding similarity with keyword scores.
+    
+    Keyword scores are scaled by the best keyword score across all documents so
+    both signals lie in [0, 1] before they are mixed with HYBRID_DENSE_WEIGHT.
+    """
+    shards = get_index_shards()
+    if not shards:
+        logger.error("Document chunks not initialized")
+        return []
+    
+    try:
+        keyword_scores = [score_keyword_chunks(index, query) for index in shards]
+        best_keyword_score = max((scored_chunks[0][1] for scored_chunks in keyword_scores if scored_chunks), default=None)
+        
+        shard_scores = []
+        for index, scored_chunks in zip(shards, keyword_scores):
+            fused_scores = np.clip(index.dense_scores([query])[0], 0, None) * HYBRID_DENSE_WEIGHT
+            for chunk_id, score in scored_chunks:
+                fused_scores[chunk_id] += (1 - HYBRID_DENSE_WEIGHT) * score / best_keyword_score
+            shard_scores.append(top_k_chunks(fused_scores, k))
+        return merge_shard_results(shards, cut_weak_matches(shard_scores, DENSE_MIN_SCORE * HYBRID_DENSE_WEIGHT), k)
+    except Exception as e:
+        logger.error(f"Error in hybrid document search: {e}")
+        return []
+
+def retrieve_chunks(query, k=5):
+    """Retrieve the chunks for a query with the configured RETRIEVAL_MODE backend."""
+    if RETRIEVAL_MODE == "dense":
+        return search_dense_chunks(query, k)
+    if RETRIEVAL_MODE == "hybrid":
+        return search_hybrid_chunks(query, k)
+    if RETRIEVAL_MODE == "tfidf":
+        return search_tfidf_chunks(query, k)
+    return search_similar_chunks(query, k)
+
+def retrieve_many(queries, k=5):
+    """
+    Retrieve the chunks for a batch of queries with the configured RETRIEVAL_MODE backend.
+
+    The TF-IDF backend scores the whole batch with one sparse product; the
+    other backends score the queries one at a time.
+
+    Returns:
+        list: one list of results per query, as retrieve_chunks returns them
+    """
+    queries = list(queries)
+    if RETRIEVAL_MODE == "tfidf":
+        return search_many(queries, k)
+    return [retrieve_chunks(query, k) for query in queries]
+
+def search_many(queries, k=5):
+    """
+    Score a batch of queries against every chunk with TF-IDF cosine similarity.
+    
+    All queries are scored with a single sparse product against the term-document
+    matrix, which makes this the cheap way to warm up or answer several related
+    queries at once. Each document weights terms with its own idf, so scores
+    from different documents are only roughly comparable.
+    
+    Returns:
+        list: one list of {"content", "score"} dicts (best first) per query
+    """
+    queries = list(queries)
+    shards = get_index_shards()
+    if not shards:
+        logger.error("Document chunks not initialized")
+        return [[] for _ in queries]
+    
+    try:
+        shard_scores = [index.tfidf_scores(queries) for index in shards]
+        return [
+            merge_shard_results(shards, [top_k_chunks(scores[query_number], k) for scores in shard_scores], k)
+            for query_number in range(len(queries))
+        ]
+    except Exception as e:
+        logger.error(f"Error scoring queries against document chunks: {e}")
+        return [[] for _ in queries]
+
+def search_tfidf_chunks(query, k=5):
+    """Search for chunks similar to the query using TF-IDF cosine similarity."""
+    return search_many([query], k)[0]
+
+def get_context_cache_stats():
+    """Get the hit/miss counters of the generated-context cache."""
+    stats = context_cache.stats()
+    stats["corpus_generation"] = get_corpus_state().generation
+    return stats
+
+def generate_context_for_query(query, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Generate a context for the given query, reusing a cached context when available.
+
+    The context is packed into at most token_budget estimated tokens; pass None
+    to get the untrimmed chunks.
+    """
+    # Read the generation before searching: a context built while a reload
+    # swaps the corpus in is stored under the old one and never served again
+    state = get_corpus_state()
+    
+    # Only cache contexts built from a loaded index; the "not loaded" messages
+    # must be recomputed once the document becomes available
+    if not state.shards:
+        return build_context_for_query(query, token_budget)
+    
+    cache_key = (state.generation, token_budget, " ".join(query.split()))
+    context = context_cache.get(cache_key)
+    if context is None:
+        context = build_context_for_query(query, token_budget)
+        context_cache.set(cache_key, context)
+    return context
+
+def generate_contexts_for_queries(queries, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Generate the contexts of several queries at once; see generate_context_for_query.
+
+    The queries whose contexts are not cached yet are retrieved as one batch
+    with retrieve_many(), and their contexts are cached, so later
+    generate_context_for_query() calls for the same queries are cache hits.
+
+    Returns:
+        list: one context per query
+    """
+    queries = list(queries)
+    state = get_corpus_state()
+    if not state.shards:
+        return [build_context_for_query(query, token_budget) for query in queries]
+    
+    cache_keys = [(state.generation, token_budget, " ".join(query.split())) for query in queries]
+    contexts = [context_cache.get(cache_key) for cache_key in cache_keys]
+    
+    # Repeated queries are retrieved once
+    missing = {}
+    for query, cache_key, context in zip(queries, cache_keys, contexts):
+        if context is None:
+            missing.setdefault(cache_key, query)
+    built = {}
+    if missing:
+        for (cache_key, query), chunks in zip(missing.items(), retrieve_many(missing.values(), k=5)):
+            built[cache_key] = build_context_for_query(query, token_budget, chunks)
+            context_cache.set(cache_key, built[cache_key])
+    return [context if context is not None else built[cache_key] for cache_key, context in zip(cache_keys, contexts)]
+
+def warm_context_cache(topics=CASE_TOPICS, token_budget=SIMULATION_CONTEXT_TOKEN_BUDGET):
+    """Build and cache the contexts of the curated case topics in one batch, as the case simulation asks for them."""
+    try:
+        contexts = generate_contexts_for_queries(topics, token_budget)
+        logger.info(f"Warmed the context cache with {len(contexts)} case topics")
+    except Exception as e:
+        logger.error(f"Error warming the context cache: {e}")
+
+def format_chunk_headings(chunk):
+    """
+    Mark the heading lines of a search result with ## ... ##.
+
+    A packed chunk covers several sections, so the heading of every section it
+    records gets its own heading line, not just the first line of the chunk.
+    """
+    content = chunk["content"]
+    lines = content.split('\n')
+    headings = set(chunk.get("sections") or [])
+    if len(lines) > 1 and len(lines[0]) < 100 and any(char.isupper() for char in lines[0]):
+        # Likely a heading - format it more prominently
+        headings.add(lines[0])
+    if len(lines) > 1 and headings:
+        return '\n'.join(f"## {line.strip()} ##" if line in headings else line for line in lines).strip()
+    return content
+
+def build_context_for_query(query, token_budget=CONTEXT_TOKEN_BUDGET, chunks=None):
+    """
+    Generate a context for the given query by combining relevant chunks and structure the information.
+
+    chunks are the query's retrieved chunks when they were already retrieved in a batch.
+    """
     # Increase result count to get more potentially relevant chunks
-    chunks = search_similar_chunks(query, k=5)
+    if chunks is None:
+        chunks = retrieve_chunks(query, k=5)
     
     # Check if document is not loaded at all (common in Vercel serverless environment)
-    if not document_chunks:
+    if not get_document_chunks():
+        if is_loading():
+            logger.warning("Document chunks are still loading, answering without guideline context")
+            return INDEX_LOADING_MESSAGE
         logger.warning("Document chunks not available - likely due to document loading issues in Vercel environment")
         # Return a more specific message for this case
         if os.environ.get('VERCEL') == '1' or 'VERCEL_URL' in os.environ:
@@ -126,82 +391,39 @@ def generate_context_for_query(query):
     if not chunks or len(''.join([chunk["content"] for chunk in chunks])) < 200:  # If content is too short
         # Enhanced fallback to section-based search 
         try:
-            sections = get_document_sections()
-            if not sections:
+            documents = get_corpus_documents()
+            if not documents:
                 logger.error("Document sections not available")
                 return "The guidelines document could not be accessed. This may be a limitation of the current deployment environment."
-                
-            relevant_sections = []
             
-            # Check for disease/treatment terms in chapter and section names
-            for chapter_name, chapter_data in sections.items():
-                # More sophisticated chapter name matching
-                chapter_match_score = 0
-                
-                # Check for whole query matches
-                if query.lower() in chapter_name.lower():
-                    chapter_match_score += 10
-                
-                # Check for disease name matches in chapter titles
-                for term in disease_mentions:
-                    if term.lower() in chapter_name.lower():
-                        chapter_match_score += 5
-                
-                # Check for individual word matches
-                for word in query.lower().split():
-                    if len(word) > 3 and word in chapter_name.lower():
-                        chapter_match_score += 1
-                
-                if chapter_match_score > 0:
-                    relevant_sections.append(("\n".join(chapter_data["content"]), chapter_match_score))
-                
-                # Search section names similarly
-                for section_name, section_content in chapter_data["sections"].items():
-                    section_match_score = 0
-                    
-                    if query.lower() in section_name.lower():
-                        section_match_score += 10
-                    
-                    for term in disease_mentions:
-                        if term.lower() in section_name.lower():
-                            section_match_score += 5
-                    
-                    for word in query.lower().split():
-                        if len(word) > 3 and word in section_name.lower():
-                            section_match_score += 1
-                    
-                    if section_match_score > 0:
-                        relevant_sections.append(("\n".join(section_content), section_match_score))
+            # Check for the whole query, disease terms and query words in chapter
+            # and section names through the title index of every document
+            relevant_sections = []
+            for document in documents.values():
+                title_index = document.title_index
+                sections = document.sections
+                for entry_id, match_score in title_index.score_titles(query, disease_mentions):
+                    chapter_name, section_name, _ = title_index.entries[entry_id]
+                    if section_name is None:
+                        section_content = sections[chapter_name]["content"]
+                    else:
+                        section_content = sections[chapter_name]["sections"][section_name]
+                    relevant_sections.append(("\n".join(section_content), match_score))
             
             if relevant_sections:
                 # Sort by relevance score
                 relevant_sections.sort(key=lambda x: x[1], reverse=True)
                 # Take top 3 most relevant sections
                 top_sections = [section[0] for section in relevant_sections[:3]]
-                return "\n\n".join(top_sections)
+                return pack_context(top_sections, query, token_budget)
         except Exception as e:
             logger.error(f"Error in fallback section search: {e}")
         
         return "The guidelines do not appear to contain specific information about this query."
     
     # Structure the context with any section/chapter headings when available
-    structured_context = []
-    
-    for chunk in chunks:
-        content = chunk["content"]
-        # Try to identify if this chunk has a heading/title line
-        lines = content.split('\n')
-        
-        if len(lines) > 1 and len(lines[0]) < 100 and any(char.isupper() for char in lines[0]):
-            # Likely a heading - format it more prominently
-            heading = lines[0].strip()
-            content_body = '\n'.join(lines[1:]).strip()
-            
-            structured_chunk = f"## {heading} ##\n{content_body}"
-            structured_context.append(structured_chunk)
-        else:
-            structured_context.append(content)
+    structured_context = [format_chunk_headings(chunk) for chunk in chunks]
     
-    # Combine chunks into a well-structured context
-    context = "\n\n".join(structured_context)
+    # Combine chunks into a well-structured context that fits the token budget
+    context = pack_context(structured_context, query, token_budget)
     return context
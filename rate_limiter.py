@@ -0,0 +1,263 @@
+"""
+Rate Limiter
+
+This module keeps the calls of every worker on the machine within the Mistral
+account's rate limit. A token bucket in a SQLite file that all workers share
+refills at MISTRAL_RATE_LIMIT requests per second, up to MISTRAL_RATE_BURST,
+and each API request takes one token first. Callers that find the bucket empty
+wait for a token up to their deadline instead of failing, and interactive
+callers (chat, simulations) waiting for a token go ahead of background work
+(flashcards, daily challenges). A 429 from the API pauses the bucket for every
+worker until the API's Retry-After has passed. The limiter is off unless
+MISTRAL_RATE_LIMIT is set to the account's rate.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import (
+    MISTRAL_RATE_LIMIT, MISTRAL_RATE_BURST, MISTRAL_RATE_LIMIT_PATH,
+    RATE_LIMIT_INTERACTIVE_WAIT, RATE_LIMIT_BACKGROUND_WAIT
+)
+
+logger = logging.getLogger(__name__)
+
+# Priorities of LLM calls, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Seconds a caller waits by default for a token, by priority
+DEFAULT_WAITS = {
+    PRIORITY_INTERACTIVE: RATE_LIMIT_INTERACTIVE_WAIT,
+    PRIORITY_BACKGROUND: RATE_LIMIT_BACKGROUND_WAIT,
+}
+
+# Longest sleep between two looks at the bucket, so a waiter notices when the
+# callers ahead of it are gone
+MAX_POLL_INTERVAL = 0.25
+
+class RateLimitTimeout(Exception):
+    """No token became available before the caller's deadline."""
+
+class RateLimiter:
+    """Token bucket with a priority queue of waiters, shared by the workers through a SQLite file."""
+
+    def __init__(self, path=MISTRAL_RATE_LIMIT_PATH, rate=MISTRAL_RATE_LIMIT, burst=MISTRAL_RATE_BURST):
+        self.path = path
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.timeouts = 0
+        self._local = threading.local()
+        self._enabled = bool(path) and rate > 0
+        if self._enabled:
+            try:
+                self._create_tables()
+            except Exception as e:
+                logger.warning(f"Rate limiter at {path} is not available, calls are not limited: {e}")
+                self._enabled = False
+
+    def _connection(self):
+        """Get this thread's connection to the SQLite file, opening a new one in a forked process."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # Autocommit mode, so each step can take the write lock with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_tables(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS bucket ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), tokens REAL NOT NULL, updated_at REAL NOT NULL, "
+            "blocked_until REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS waiters ("
+            "id TEXT PRIMARY KEY, priority INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO bucket (id, tokens, updated_at, blocked_until) VALUES (0, ?, ?, 0)",
+            (self.burst, time.time())
+        )
+
+    def _refill(self, tokens, updated_at, blocked_until, now):
+        # Nothing accrues while the bucket is paused after a 429
+        return min(self.burst, tokens + max(0.0, now - max(updated_at, blocked_until)) * self.rate)
+
+    def try_acquire(self, waiter_id, priority, expires_at):
+        """
+        Take a token if one is free and no caller of a higher priority is waiting.
+
+        A caller that gets no token is recorded as waiting until expires_at,
+        which holds back callers of lower priority in every worker.
+
+        Returns:
+            tuple: (True if a token was taken, seconds until it is worth trying again)
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            # Waiters of a worker that died or gave up leave with their deadline
+            connection.execute("DELETE FROM waiters WHERE expires_at <= ?", (now,))
+            tokens, updated_at, blocked_until = connection.execute(
+                "SELECT tokens, updated_at, blocked_until FROM bucket WHERE id = 0"
+            ).fetchone()
+            tokens = self._refill(tokens, updated_at, blocked_until, now)
+            ahead = connection.execute(
+                "SELECT COUNT(*) FROM waiters WHERE priority < ? AND id != ?", (priority, waiter_id)
+            ).fetchone()[0]
+
+            granted = False
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif ahead:
+                wait = MAX_POLL_INTERVAL
+            elif tokens >= 1:
+                tokens -= 1
+                granted = True
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+
+            connection.execute("UPDATE bucket SET tokens = ?, updated_at = ? WHERE id = 0", (tokens, now))
+            if granted:
+                connection.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO waiters (id, priority, expires_at) VALUES (?, ?, ?)",
+                    (waiter_id, priority, expires_at)
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return granted, min(wait, MAX_POLL_INTERVAL)
+
+    def _leave_queue(self, waiter_id):
+        try:
+            self._connection().execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+        except Exception as e:
+            logger.warning(f"Error leaving the rate limiter queue: {e}")
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """
+        Wait for a token.
+
+        Args:
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+            max_wait (float): seconds to wait at most; defaults by priority
+
+        Returns:
+            bool: True if a token was taken, False if max_wait ran out first
+        """
+        if not self._enabled:
+            return True
+        if max_wait is None:
+            max_wait = DEFAULT_WAITS.get(priority, RATE_LIMIT_INTERACTIVE_WAIT)
+        waiter_id = uuid.uuid4().hex
+        deadline = time.time() + max_wait
+        granted = False
+        try:
+            while True:
+                granted, wait = self.try_acquire(waiter_id, priority, deadline)
+                if granted:
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    return False
+                time.sleep(min(wait, remaining))
+        except Exception as e:
+            # Never let the limiter take the API down with it
+            logger.warning(f"Error reading the rate limiter, sending the call unlimited: {e}")
+            return True
+        finally:
+            if not granted:
+                self._leave_queue(waiter_id)
+
+    async def acquire_async(self, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """Wait for a token without blocking the event loop; see acquire."""
+        if not self._enabled:
+            return True
+        if max_wait is None:
+            max_wait = DEFAULT_WAITS.get(priority, RATE_LIMIT_INTERACTIVE_WAIT)
+        waiter_id = uuid.uuid4().hex
+        deadline = time.time() + max_wait
+        granted = False
+        try:
+            while True:
+                granted, wait = await asyncio.to_thread(self.try_acquire, waiter_id, priority, deadline)
+                if granted:
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    return False
+                await asyncio.sleep(min(wait, remaining))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Error reading the rate limiter, sending the call unlimited: {e}")
+            return True
+        finally:
+            # Also runs when a fan-out deadline cancels the call; the SQLite
+            # write goes to a thread like every other one, off the event loop
+            if not granted:
+                await asyncio.to_thread(self._leave_queue, waiter_id)
+
+    def throttle(self, seconds):
+        """Hand out no tokens to any worker for the next seconds, after the API answered 429."""
+        if not self._enabled or seconds <= 0:
+            return
+        try:
+            connection = self._connection()
+            now = time.time()
+            connection.execute(
+                "UPDATE bucket SET tokens = MIN(tokens, 0), updated_at = MAX(updated_at, ?), "
+                "blocked_until = MAX(blocked_until, ?) WHERE id = 0",
+                (now, now + seconds)
+            )
+        except Exception as e:
+            logger.warning(f"Error throttling the rate limiter: {e}")
+
+    def stats(self):
+        """Get this worker's counters and the shared bucket state."""
+        stats = {"enabled": self._enabled, "rate": self.rate, "burst": self.burst, "timeouts": self.timeouts}
+        if self._enabled:
+            try:
+                connection = self._connection()
+                now = time.time()
+                tokens, updated_at, blocked_until = connection.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM bucket WHERE id = 0"
+                ).fetchone()
+                stats["tokens"] = round(self._refill(tokens, updated_at, blocked_until, now), 3)
+                stats["blocked_seconds"] = round(max(0.0, blocked_until - now), 3)
+                stats["waiting"] = dict(connection.execute(
+                    "SELECT priority, COUNT(*) FROM waiters WHERE expires_at > ? GROUP BY priority", (now,)
+                ).fetchall())
+            except Exception as e:
+                logger.warning(f"Error reading the rate limiter: {e}")
+        return stats
+
+rate_limiter = None
+rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Get the shared rate limiter of this process."""
+    global rate_limiter
+    if rate_limiter is None:
+        with rate_limiter_lock:
+            if rate_limiter is None:
+                rate_limiter = RateLimiter()
+    return rate_limiter
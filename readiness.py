@@ -0,0 +1,110 @@
+"""
+Readiness
+
+This module tracks the startup state of the guideline corpus in this worker
+process: "pending" until loading starts, "loading" while the documents are
+read and indexed, then "ready" or "failed". The /readyz endpoint reports it so
+load balancers can hold traffic until a worker has finished loading, and retrieval callers
+can wait a bounded time for a load in progress instead of answering from an
+empty index.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_PENDING = "pending"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# States each state may move to; a failed load may be retried
+ALLOWED_TRANSITIONS = {
+    STATE_PENDING: {STATE_LOADING, STATE_READY, STATE_FAILED},
+    STATE_LOADING: {STATE_READY, STATE_FAILED},
+    STATE_READY: set(),
+    STATE_FAILED: {STATE_LOADING, STATE_READY},
+}
+
+state_condition = threading.Condition()
+current_state = STATE_PENDING
+state_detail = None
+state_changed_at = time.time()
+started_at = time.time()
+
+def set_state(state, detail=None):
+    """
+    Move to a new startup state and wake up every caller waiting for readiness.
+
+    Returns:
+        bool: True if the state changed, False if the transition is not allowed
+    """
+    global current_state, state_detail, state_changed_at
+    with state_condition:
+        if state not in ALLOWED_TRANSITIONS[current_state]:
+            if state != current_state:
+                logger.warning(f"Ignoring readiness transition from {current_state} to {state}")
+            return False
+        logger.info(f"Readiness: {current_state} -> {state}" + (f" ({detail})" if detail else ""))
+        current_state = state
+        state_detail = detail
+        state_changed_at = time.time()
+        state_condition.notify_all()
+        return True
+
+def mark_loading():
+    """Record that the corpus has started loading."""
+    return set_state(STATE_LOADING)
+
+def mark_ready():
+    """Record that the corpus is loaded and retrieval is served from it."""
+    return set_state(STATE_READY)
+
+def mark_failed(error):
+    """Record that loading the corpus failed, with a short description of why."""
+    return set_state(STATE_FAILED, str(error))
+
+def get_state():
+    """Get the current startup state."""
+    return current_state
+
+def is_ready():
+    """Check whether the corpus is loaded."""
+    return current_state == STATE_READY
+
+def is_loading():
+    """Check whether the corpus is being loaded right now."""
+    return current_state == STATE_LOADING
+
+def get_status():
+    """
+    Get the startup state for the health endpoints.
+
+    Returns:
+        dict: "state", "detail", "seconds_in_state" and "uptime_seconds"
+    """
+    with state_condition:
+        now = time.time()
+        return {
+            "state": current_state,
+            "detail": state_detail,
+            "seconds_in_state": round(now - state_changed_at, 3),
+            "uptime_seconds": round(now - started_at, 3)
+        }
+
+def wait_until_ready(timeout_ms):
+    """
+    Wait up to timeout_ms milliseconds for a corpus load in progress to finish.
+
+    Only a load that is running is waited for: when loading has not started
+    or has failed there is nothing to wait for, so this returns at once.
+
+    Returns:
+        bool: True if the corpus is ready
+    """
+    with state_condition:
+        if current_state == STATE_LOADING and timeout_ms and timeout_ms > 0:
+            state_condition.wait_for(lambda: current_state != STATE_LOADING, timeout_ms / 1000)
+        return current_state == STATE_READY
@@ -0,0 +1,371 @@
+"""
+Section Index
+
+This module indexes the parsed document by chapter and section. The title
+index makes title matching in the retrieval fallback a few dictionary lookups,
+and the text index precomputes the lowercase text of every chapter and section
+so that document search only scans the sections that can contain the query.
+The text index also records where each token starts, so search hits can be
+located, highlighted and cut into snippets without rescanning the sections.
+"""
+
+import heapq
+import html
+import logging
+import re
+from bisect import bisect_right
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Upper bound on the number of cached title-token lookups
+MAX_CACHED_LOOKUPS = 4096
+
+# Target length of a search snippet in characters
+SNIPPET_CHARS = 200
+
+def section_entry_text(lines):
+    """Get the lowercase searchable text of a chapter introduction or section."""
+    return " ".join(lines).lower()
+
+class SubstringIndex:
+    """
+    Token index answering "which entries contain this lowercase text" queries.
+
+    Any run of word characters in the searched text must lie inside a single
+    token of a matching entry, so the entries that have a token containing
+    every such run are the only candidates that need a substring check.
+    Subclasses fill self.entry_texts and call _index_entry for each entry, or
+    fill self.token_entries themselves.
+    """
+
+    def __init__(self):
+        self.entry_texts = []
+        self.token_entries = {}
+        self._vocabulary = None
+        self._vocabulary_offsets = None
+        self._lookup_cache = {}
+
+    def _index_entry(self, entry_id, text_lower):
+        for token in TOKEN_PATTERN.findall(text_lower):
+            self.token_entries.setdefault(token, set()).add(entry_id)
+
+    def entries_containing(self, text):
+        """Find the ids of entries whose lowercase text contains the lowercase text."""
+        parts = TOKEN_PATTERN.findall(text)
+        if not parts:
+            return [entry_id for entry_id, entry_text in enumerate(self.entry_texts) if text in entry_text]
+
+        # Intersecting the candidates of each part leaves only a few entries to check
+        candidates = None
+        for part in sorted(set(parts), key=len, reverse=True):
+            part_entries = self._entries_with_token_containing(part)
+            candidates = part_entries if candidates is None else candidates & part_entries
+            if not candidates:
+                return []
+        return [entry_id for entry_id in sorted(candidates) if text in self.entry_texts[entry_id]]
+
+    def _entries_with_token_containing(self, part):
+        """Find the ids of entries that have a token containing the word part."""
+        return self._lookup_tokens(part)[1]
+
+    def _token_ids_containing(self, part):
+        """Find the ids of the tokens containing the word part, in token_entries order."""
+        return self._lookup_tokens(part)[0]
+
+    def _lookup_tokens(self, part):
+        cached = self._lookup_cache.get(part)
+        if cached is not None:
+            return cached
+
+        if self._vocabulary is None:
+            # All tokens in one newline-separated string, so a single find loop
+            # locates every token containing the part
+            tokens = list(self.token_entries)
+            self._vocabulary = (tokens, "\n".join(tokens))
+            offsets = []
+            position = 0
+            for token in tokens:
+                offsets.append(position)
+                position += len(token) + 1
+            self._vocabulary_offsets = offsets
+        tokens, vocabulary_text = self._vocabulary
+
+        token_ids = []
+        entry_ids = set()
+        position = vocabulary_text.find(part)
+        while position != -1:
+            token_id = bisect_right(self._vocabulary_offsets, position) - 1
+            token_ids.append(token_id)
+            entry_ids.update(self.token_entries[tokens[token_id]])
+            # Continue after the end of this token
+            next_token = self._vocabulary_offsets[token_id] + len(tokens[token_id]) + 1
+            position = vocabulary_text.find(part, next_token)
+
+        if len(self._lookup_cache) >= MAX_CACHED_LOOKUPS:
+            self._lookup_cache.clear()
+        self._lookup_cache[part] = (token_ids, entry_ids)
+        return token_ids, entry_ids
+
+class SectionTitleIndex(SubstringIndex):
+    """Token and full-title index over the chapter and section titles of the document."""
+
+    def __init__(self, sections):
+        super().__init__()
+        # Entries in document order: (chapter name, section name or None, lowercase title)
+        self.entries = []
+        self.titles = {}
+
+        for chapter_name, chapter_data in sections.items():
+            self._add_entry(chapter_name, None, chapter_name)
+            for section_name in chapter_data["sections"]:
+                self._add_entry(chapter_name, section_name, section_name)
+
+        logger.info(f"Indexed {len(self.entries)} chapter and section titles")
+
+    def _add_entry(self, chapter_name, section_name, title):
+        entry_id = len(self.entries)
+        title_lower = title.lower()
+        self.entries.append((chapter_name, section_name, title_lower))
+        self.entry_texts.append(title_lower)
+        self.titles.setdefault(" ".join(title_lower.split()), []).append(entry_id)
+        self._index_entry(entry_id, title_lower)
+
+    def lookup_title(self, title):
+        """
+        Find chapters and sections by their full title, ignoring case and spacing.
+
+        Returns:
+            list: (chapter name, section name or None) tuples
+        """
+        entry_ids = self.titles.get(" ".join(title.lower().split()), [])
+        return [self.entries[entry_id][:2] for entry_id in entry_ids]
+
+    def score_titles(self, query, disease_terms):
+        """
+        Score chapter and section titles against a query.
+
+        A title scores 10 if it contains the whole query, 5 for each disease term
+        it contains and 1 for each query word longer than three characters.
+
+        Returns:
+            list: (entry id, score) pairs with a positive score, in document order
+        """
+        query_lower = query.lower()
+        scores = {}
+
+        # Check for whole query matches
+        for entry_id in self.entries_containing(query_lower):
+            scores[entry_id] = scores.get(entry_id, 0) + 10
+
+        # Check for disease name matches in titles
+        for term in disease_terms:
+            for entry_id in self.entries_containing(term.lower()):
+                scores[entry_id] = scores.get(entry_id, 0) + 5
+
+        # Check for individual word matches
+        for word in query_lower.split():
+            if len(word) > 3:
+                for entry_id in self.entries_containing(word):
+                    scores[entry_id] = scores.get(entry_id, 0) + 1
+
+        return sorted(scores.items())
+
+class SectionTextIndex(SubstringIndex):
+    """Lowercase text store and token index over the chapter and section bodies of the document."""
+
+    def __init__(self, sections, entry_texts=None):
+        """
+        entry_texts optionally holds the precomputed lowercase text of every
+        entry, in entry order, as stored in an index snapshot.
+        """
+        super().__init__()
+        # Entries in document order: (chapter name, section name or None); a chapter's
+        # entry holds its introduction text, as search_document has always searched it
+        self.sections = sections
+        self.entries = []
+
+        for chapter_name, chapter_data in sections.items():
+            self.entries.append((chapter_name, None))
+            self.entries.extend((chapter_name, section_name) for section_name in chapter_data["sections"])
+        self.entry_ids = {entry: entry_id for entry_id, entry in enumerate(self.entries)}
+
+        if entry_texts is None:
+            entry_texts = []
+            for chapter_data in sections.values():
+                entry_texts.append(section_entry_text(chapter_data["content"]))
+                entry_texts.extend(section_entry_text(lines) for lines in chapter_data["sections"].values())
+        if len(entry_texts) != len(self.entries):
+            raise ValueError("Section text entries do not match the sections")
+
+        self.entry_texts = entry_texts
+        self._index_positions(entry_texts)
+
+        logger.info(f"Indexed the text of {len(self.entries)} chapters and sections")
+
+    def _index_positions(self, entry_texts):
+        """
+        Index the tokens of every entry with their positions.
+
+        token_ids and token_starts hold, entry after entry, the id of each token
+        (its position in token_entries) and its character offset in the entry
+        text; entry i owns the range token_indptr[i]:token_indptr[i + 1].
+        """
+        vocabulary = {}
+        token_ids = []
+        token_starts = []
+        token_indptr = [0]
+        for entry_id, text_lower in enumerate(entry_texts):
+            for match in TOKEN_PATTERN.finditer(text_lower):
+                token = match.group()
+                token_id = vocabulary.get(token)
+                if token_id is None:
+                    token_id = vocabulary[token] = len(vocabulary)
+                    self.token_entries[token] = set()
+                self.token_entries[token].add(entry_id)
+                token_ids.append(token_id)
+                token_starts.append(match.start())
+            token_indptr.append(len(token_ids))
+
+        self.token_ids = np.array(token_ids, dtype=np.int32)
+        self.token_starts = np.array(token_starts, dtype=np.int32)
+        self.token_indptr = np.array(token_indptr, dtype=np.int64)
+
+    def display_text(self, entry_id):
+        """
+        Get the text of an entry with its original capitalisation.
+
+        Falls back to the lowercase text when lowercasing changed its length,
+        so offsets into the lowercase text always apply to the returned text.
+        """
+        chapter_name, section_name = self.entries[entry_id]
+        chapter_data = self.sections[chapter_name]
+        lines = chapter_data["content"] if section_name is None else chapter_data["sections"][section_name]
+        text = " ".join(lines)
+        text_lower = self.entry_texts[entry_id]
+        return text if len(text) == len(text_lower) else text_lower
+
+    def match_offsets(self, entry_id, query_lower):
+        """
+        Locate the occurrences of a lowercase query in the text of an entry.
+
+        The first run of word characters in the query lies inside one token of
+        every occurrence, so the occurrences are found from the positions of
+        the tokens containing that run, and only those places of the text are
+        compared with the query.
+
+        Returns:
+            list: (start, end) character offsets of the non-overlapping
+                occurrences in the entry text, as str.count counts them
+        """
+        text = self.entry_texts[entry_id]
+        parts = TOKEN_PATTERN.findall(query_lower)
+        if not parts:
+            offsets = []
+            position = text.find(query_lower) if query_lower else -1
+            while position != -1:
+                offsets.append((position, position + len(query_lower)))
+                position = text.find(query_lower, position + len(query_lower))
+            return offsets
+
+        first_part = parts[0]
+        lead = query_lower.find(first_part)
+        candidate_ids = self._token_ids_containing(first_part)
+        tokens = self._vocabulary[0]
+
+        start, end = self.token_indptr[entry_id], self.token_indptr[entry_id + 1]
+        entry_token_ids = self.token_ids[start:end]
+        positions = np.flatnonzero(np.isin(entry_token_ids, candidate_ids))
+
+        offsets = []
+        next_free = 0
+        for position in positions.tolist():
+            token = tokens[entry_token_ids[position]]
+            token_start = int(self.token_starts[start + position])
+            inner = token.find(first_part)
+            while inner != -1:
+                match_start = token_start + inner - lead
+                if match_start >= next_free and text.startswith(query_lower, match_start):
+                    offsets.append((match_start, match_start + len(query_lower)))
+                    next_free = match_start + len(query_lower)
+                inner = token.find(first_part, inner + 1)
+        return offsets
+
+    def snippet_bounds(self, entry_id, match_start, match_end, width=SNIPPET_CHARS):
+        """
+        Choose a snippet of about width characters around an occurrence.
+
+        The snippet starts and ends on token boundaries taken from the
+        position index.
+
+        Returns:
+            tuple: (start, end) character offsets of the snippet in the entry text
+        """
+        text_length = len(self.entry_texts[entry_id])
+        entry_starts = self.token_starts[self.token_indptr[entry_id]:self.token_indptr[entry_id + 1]]
+
+        window_start = max(0, match_start - max(width - (match_end - match_start), 0) // 2)
+        window_end = min(text_length, window_start + max(width, match_end - match_start))
+        window_start = max(0, min(window_start, window_end - width))
+
+        # Start at the first token that begins inside the window, and stop
+        # before the last token that would run past its end
+        first = int(np.searchsorted(entry_starts, window_start))
+        start = min(int(entry_starts[first]), match_start) if first < len(entry_starts) and window_start > 0 else window_start
+        if window_end < text_length:
+            last = int(np.searchsorted(entry_starts, window_end, side='right')) - 1
+            end = max(int(entry_starts[last]), match_end) if last >= 0 else window_end
+        else:
+            end = text_length
+        return start, end
+
+    def search(self, query, offset=0, limit=5):
+        """
+        Find the chapters and sections whose text contains the query, ignoring case.
+
+        Matches are ranked by the number of occurrences of the query, ties in
+        document order, and only the requested page is sorted.
+
+        Returns:
+            tuple: (results, total) where results is the page of
+                (chapter name, section name or None, occurrence count) tuples
+                and total is the number of matching entries
+        """
+        query_lower = query.lower()
+        matches = [
+            (self.entry_texts[entry_id].count(query_lower), entry_id)
+            for entry_id in self.entries_containing(query_lower)
+        ]
+        page = heapq.nsmallest(offset + limit, matches, key=lambda match: (-match[0], match[1]))[offset:]
+        results = [self.entries[entry_id] + (count,) for count, entry_id in page]
+        return results, len(matches)
+
+def highlight_snippet(text, snippet_start, snippet_end, offsets):
+    """
+    Cut a snippet out of a text and mark the occurrences inside it.
+
+    Returns:
+        tuple: (snippet text, offset of the snippet in the text, (start, end)
+            highlight offsets relative to the snippet, HTML-escaped snippet with
+            <mark> around each highlight)
+    """
+    raw_snippet = text[snippet_start:snippet_end]
+    snippet = raw_snippet.strip()
+    snippet_start += len(raw_snippet) - len(raw_snippet.lstrip())
+
+    highlights = []
+    html_parts = []
+    position = 0
+    for match_start, match_end in offsets:
+        start = match_start - snippet_start
+        end = min(match_end - snippet_start, len(snippet))
+        if start < position or end <= start:
+            continue
+        highlights.append((start, end))
+        html_parts.append(html.escape(snippet[position:start]))
+        html_parts.append(f"<mark>{html.escape(snippet[start:end])}</mark>")
+        position = end
+    html_parts.append(html.escape(snippet[position:]))
+    return snippet, snippet_start, highlights, "".join(html_parts)
@@ -29,27 +29,34 @@ document.addEventListener('DOMContentLoaded', () => {
       const response = await fetch(API_ENDPOINTS.CHAT, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream'
         },
-        body: JSON.stringify({ query: message })
+        body: JSON.stringify({ query: message, stream: true })
       });
       
-      const data = await response.json();
-      
-      // Remove typing indicator
-      chatMessages.removeChild(typingIndicator);
-      
-      if (data.response) {
-        // Add bot response to chat
-        addBotMessage(data.response);
+      const contentType = response.headers.get('Content-Type') || '';
+      if (contentType.includes('text/event-stream') && response.body) {
+        // Show the answer as it is generated
+        await readChatStream(response, typingIndicator);
       } else {
-        addBotMessage("I'm sorry, I couldn't process your request. Please try again.");
+        const data = await response.json();
+        
+        // Remove typing indicator
+        removeTypingIndicator(typingIndicator);
+        
+        if (data.response) {
+          // Add bot response to chat
+          addBotMessage(data.response);
+        } else {
+          addBotMessage("I'm sorry, I couldn't process your request. Please try again.");
+        }
       }
     } catch (error) {
       console.error('Chat error:', error);
       
       // Remove typing indicator
-      chatMessages.removeChild(typingIndicator);
+      removeTypingIndicator(typingIndicator);
       
       // Show error message
       addBotMessage("I'm sorry, there was an error processing your request. Please try again later.");
@@ -96,6 +103,86 @@ function addBotMessage(message) {
   
   // Scroll to bottom
   scrollToBottom();
+  
+  return messageElement;
+}
+
+async function readChatStream(response, typingIndicator) {
+  // Read server-sent events: "token" events carry pieces of the answer,
+  // "done" the full answer and "error" a failure
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+  let messageElement = null;
+  
+  const handleEvent = (event, data) => {
+    if (event === 'token') {
+      text += data.text;
+      if (!messageElement) {
+        removeTypingIndicator(typingIndicator);
+        messageElement = addBotMessage(text);
+      } else {
+        messageElement.innerHTML = formatMarkdown(text);
+        scrollToBottom();
+      }
+    } else if (event === 'done') {
+      if (!messageElement) {
+        removeTypingIndicator(typingIndicator);
+        messageElement = addBotMessage(data.response || "I'm sorry, I couldn't process your request. Please try again.");
+      }
+    } else if (event === 'error') {
+      removeTypingIndicator(typingIndicator);
+      const errorMessage = data.error || "I'm sorry, there was an error processing your request. Please try again later.";
+      if (messageElement) {
+        // Keep the partial answer, marked as cut short
+        const notice = document.createElement('div');
+        notice.className = 'message-incomplete';
+        notice.textContent = `This answer is incomplete. ${errorMessage}`;
+        messageElement.appendChild(notice);
+        scrollToBottom();
+      } else {
+        messageElement = addBotMessage(errorMessage);
+      }
+    }
+  };
+  
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let event = 'message';
+      let data = '';
+      frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data += line.slice(5).trim();
+        }
+      });
+      if (data) {
+        handleEvent(event, JSON.parse(data));
+      }
+    }
+  }
+  
+  // The stream ended without any answer
+  if (!messageElement) {
+    removeTypingIndicator(typingIndicator);
+    addBotMessage("I'm sorry, I couldn't process your request. Please try again.");
+  }
+}
+
+function removeTypingIndicator(typingIndicator) {
+  if (typingIndicator && typingIndicator.parentNode) {
+    typingIndicator.parentNode.removeChild(typingIndicator);
+  }
 }
 
 function addTypingIndicator() {
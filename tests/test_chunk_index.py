@@ -0,0 +1,82 @@
+import random
+import re
+import pytest
+from benchmarks.corpus import load_guide_content
+from corpus_registry import build_document_index
+from rag_engine import score_keyword_chunks
+from config import CASE_TOPICS
+
+def legacy_score_chunks(chunks, query):
+    """The substring scorer search_similar_chunks used before the chunk index, as the reference."""
+    query_lower = query.lower()
+    treatment_phrases = ['treatment for', 'treatment of', 'how to treat', 'medicine for', 'drug for', 'therapy for', 'exact treatment']
+    diagnosis_phrases = ['diagnosis of', 'symptoms of', 'signs of', 'diagnosing', 'diagnostic criteria', 'what is', 'what diagnosis']
+    is_treatment_query = any(phrase in query_lower for phrase in treatment_phrases)
+    is_diagnosis_query = any(phrase in query_lower for phrase in diagnosis_phrases)
+    keywords = re.findall(r'\b\w+\b', query_lower)
+    phrases = re.findall(r'\b\w+(?:\s+\w+){1,3}\b', query_lower)
+
+    chunk_scores = []
+    for chunk_id, chunk in enumerate(chunks):
+        chunk_lower = chunk.lower()
+        score = 0
+        for keyword in keywords:
+            if keyword in chunk_lower:
+                if len(keyword) <= 3 or keyword in ['and', 'the', 'for', 'with', 'what', 'this', 'that']:
+                    continue
+                if re.search(r'\b' + re.escape(keyword) + r'\b', chunk_lower):
+                    score += 2
+                else:
+                    score += 1
+        for phrase in phrases:
+            if phrase in chunk_lower:
+                score += 3 * len(phrase.split())
+        if is_treatment_query and any(word in chunk_lower for word in ['treatment', 'therapy', 'drug', 'medication', 'dose', 'regimen', 'management']):
+            score *= 1.5
+        if is_diagnosis_query and any(word in chunk_lower for word in ['symptom', 'diagnosis', 'sign', 'diagnostic', 'indication', 'criterion', 'criteria']):
+            score *= 1.5
+        if score > 2:
+            chunk_scores.append((chunk_id, score))
+    # Stable sort, so ties stay in chunk order like the index scorer
+    return sorted(chunk_scores, key=lambda item: item[1], reverse=True)
+
+@pytest.fixture(scope="module")
+def guide():
+    """The pharmacy guide when it is available, otherwise the seed corpus."""
+    content, _ = load_guide_content()
+    index = build_document_index("guide", content)
+    return content, index
+
+def parity_queries(content, count=150):
+    rng = random.Random(7)
+    words = " ".join(content).split()
+    queries = []
+    for topic in CASE_TOPICS:
+        queries += [
+            topic,
+            f"What are the symptoms, diagnosis criteria, and treatment for {topic}?",
+            f"What is the exact treatment for {topic}?",
+            f"treatment for {topic.lower()} includes",
+        ]
+    queries += ["patient with fever and abdominal pain", "what is the dose of paracetamol for children", "mg orally 8"]
+    # Runs of guide text, including ones cut inside a word
+    for _ in range(count):
+        start = rng.randrange(len(words) - 4)
+        text = " ".join(words[start:start + rng.randint(2, 4)])
+        cut = rng.randrange(len(text) // 2)
+        queries += [text, text[cut:]]
+    return queries
+
+def test_phrase_matches_agree_with_substring_search(guide):
+    content, index = guide
+    chunks_lower = [chunk.lower() for chunk in index.chunks]
+    for query in parity_queries(content, count=60):
+        for phrase in re.findall(r'\b\w+(?:\s+\w+){1,3}\b', query.lower()):
+            expected = [chunk_id for chunk_id, chunk in enumerate(chunks_lower) if phrase in chunk]
+            assert sorted(index.phrase_matches(phrase).tolist()) == expected, phrase
+
+def test_keyword_scores_match_legacy_scorer(guide):
+    content, index = guide
+    chunks = list(index.chunks)
+    for query in parity_queries(content):
+        assert score_keyword_chunks(index, query) == legacy_score_chunks(chunks, query), query
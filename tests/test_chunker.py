@@ -0,0 +1,36 @@
+from chunker import chunk_document
+from corpus_registry import build_document_index
+from index_store import encode_snapshot, decode_snapshot
+from rag_engine import chunk_result, format_chunk_headings
+
+CONTENT = [
+    "Chapter 1. Gastrointestinal Disorders",
+    "Constipation",
+    "Constipation is the infrequent passage of hard stools, often with straining and abdominal discomfort.",
+    "Peptic Ulcer Disease",
+    "Peptic ulcer disease causes burning epigastric pain that is relieved by food or antacids in most patients.",
+    "Omeprazole 20 mg orally daily for 4 weeks, with amoxicillin and clarithromycin when H. pylori is present.",
+]
+
+def test_packed_chunk_records_every_section():
+    chunks = chunk_document(CONTENT, chunk_size=1000, chunk_overlap=50)
+    packed = [chunk for chunk in chunks if "Peptic Ulcer Disease" in chunk["text"]]
+    assert len(packed) == 1
+    assert packed[0]["section"] is None
+    assert packed[0]["sections"] == ["Constipation", "Peptic Ulcer Disease"]
+    for chunk in chunks:
+        lines = chunk["text"].split("\n")
+        assert all(section in lines for section in chunk["sections"])
+
+def test_sections_survive_a_snapshot():
+    index = build_document_index("guide", CONTENT)
+    header, arrays = encode_snapshot("fingerprint", CONTENT, index, document_id="guide")
+    decoded = decode_snapshot(header, arrays)[2]
+    assert list(decoded.chunk_metadata) == list(index.chunk_metadata)
+    assert decoded.record(0).sections == ["Constipation", "Peptic Ulcer Disease"]
+
+def test_every_packed_section_gets_its_heading():
+    index = build_document_index("guide", CONTENT)
+    text = format_chunk_headings(chunk_result(index, 0, 1.0))
+    assert text.startswith("## Chapter 1. Gastrointestinal Disorders ##\n## Constipation ##\n")
+    assert "\n## Peptic Ulcer Disease ##\n" in text
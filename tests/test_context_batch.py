@@ -0,0 +1,34 @@
+import pytest
+import rag_engine
+from benchmarks.corpus import load_guide_content, install_corpus
+from config import CASE_TOPICS
+
+QUERIES = CASE_TOPICS[:10] + [
+    f"What is the exact treatment for {CASE_TOPICS[0]}?",
+    f"How do you differentiate {CASE_TOPICS[1]} from {CASE_TOPICS[2]}?",
+    CASE_TOPICS[0],
+]
+
+@pytest.fixture(scope="module", autouse=True)
+def guide():
+    """Serve the pharmacy guide when it is available, otherwise the seed corpus."""
+    content, _ = load_guide_content()
+    install_corpus(content)
+
+@pytest.mark.parametrize("mode", ["keyword", "tfidf", "hybrid"])
+def test_batched_contexts_match_single_queries(monkeypatch, mode):
+    monkeypatch.setattr(rag_engine, "RETRIEVAL_MODE", mode)
+    rag_engine.context_cache.clear()
+    expected = [rag_engine.build_context_for_query(query, 600) for query in QUERIES]
+    assert rag_engine.generate_contexts_for_queries(QUERIES, 600) == expected
+    # The batch filled the cache for the single-query path
+    assert [rag_engine.generate_context_for_query(query, 600) for query in QUERIES] == expected
+
+def test_tfidf_batch_is_scored_with_one_product(monkeypatch):
+    monkeypatch.setattr(rag_engine, "RETRIEVAL_MODE", "tfidf")
+    rag_engine.context_cache.clear()
+    batches = []
+    search_many = rag_engine.search_many
+    monkeypatch.setattr(rag_engine, "search_many", lambda queries, k=5: batches.append(list(queries)) or search_many(queries, k))
+    rag_engine.generate_contexts_for_queries(QUERIES, 600)
+    assert batches == [list(dict.fromkeys(QUERIES))]
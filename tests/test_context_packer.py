@@ -0,0 +1,27 @@
+from context_packer import estimate_tokens, pack_context, trim_to_matching_sentences, _truncate_to_tokens
+
+PASSAGES = [
+    "## Malaria ##\nUncomplicated malaria is treated with artemether-lumefantrine. Give the first dose at once.",
+    "a" * 40,
+    "word " * 100,
+    "## Fever ##\nFever in children is managed with paracetamol. Sponge the child with tepid water.",
+]
+
+def test_truncate_to_tokens_without_room_is_empty():
+    assert _truncate_to_tokens("word " * 10, 0) == ""
+    assert _truncate_to_tokens("word " * 10, -1) == ""
+
+def test_budget_used_up_exactly_stops_packing():
+    result = pack_context(["a" * 40, "word " * 100], "zzzz qqqq", 10)
+    assert result == "a" * 40
+    assert estimate_tokens(result) <= 10
+
+def test_packed_context_never_exceeds_budget():
+    for budget in range(0, 120):
+        for query in ("zzzz qqqq", "malaria treatment", "fever paracetamol"):
+            result = pack_context(PASSAGES, query, budget)
+            assert estimate_tokens(result) <= budget, (budget, query)
+
+def test_trimming_keeps_the_heading_of_a_later_section():
+    passage = "## Constipation ##\nConstipation is managed with fluids.\n## Peptic Ulcer Disease ##\nGive omeprazole daily."
+    assert trim_to_matching_sentences(passage, ["omeprazole"]) == "## Constipation ##\n## Peptic Ulcer Disease ##\nGive omeprazole daily."
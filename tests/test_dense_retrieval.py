@@ -0,0 +1,21 @@
+import pytest
+import rag_engine
+from benchmarks.corpus import load_guide_content, install_corpus
+from benchmarks.queries import MISSPELLED_QUERIES, PARAPHRASED_QUERIES
+
+@pytest.fixture(scope="module", autouse=True)
+def guide():
+    """Serve the pharmacy guide when it is available, otherwise the seed corpus."""
+    content, _ = load_guide_content()
+    install_corpus(content)
+
+@pytest.mark.parametrize("query, section", [(query, section) for query, section in MISSPELLED_QUERIES if section])
+def test_misspelled_query_finds_its_section(query, section):
+    results = rag_engine.search_dense_chunks(query, k=5)
+    assert results
+    assert results[0]["section"] == section
+
+@pytest.mark.parametrize("query", [query for query, _ in MISSPELLED_QUERIES] + PARAPHRASED_QUERIES)
+def test_fuzzy_queries_are_not_cut(query):
+    assert rag_engine.search_dense_chunks(query, k=5)
+    assert rag_engine.search_hybrid_chunks(query, k=5)
@@ -0,0 +1,14 @@
+import asyncio
+from rate_limiter import RateLimiter, PRIORITY_BACKGROUND
+
+def test_limiter_is_off_by_default(tmp_path):
+    limiter = RateLimiter(path=str(tmp_path / "rate_limit.sqlite3"))
+    assert not limiter.stats()["enabled"]
+    assert all(limiter.acquire() for _ in range(20))
+
+def test_async_waiter_leaves_the_queue_when_it_gives_up(tmp_path):
+    limiter = RateLimiter(path=str(tmp_path / "rate_limit.sqlite3"), rate=0.01, burst=1)
+    assert limiter.acquire()
+    assert not asyncio.run(limiter.acquire_async(PRIORITY_BACKGROUND, max_wait=0.3))
+    assert limiter.stats()["waiting"] == {}
+    assert limiter.timeouts == 1
@@ -0,0 +1,186 @@
+"""
+Treatment Index
+
+This module extracts the structured treatment information of a guideline
+document when it loads: the "1st line / 2nd line / 3rd line" treatment blocks
+and the dosing tables, grouped by the condition they belong to. Lookups by
+condition name are a single dictionary access, so case generation and grading
+can use the guideline's own treatment lines instead of asking the LLM.
+"""
+
+import logging
+import re
+from document_processor import classify_line
+
+logger = logging.getLogger(__name__)
+
+# "1st line", "First-line treatment:", "2nd line therapy - ..." and so on
+TREATMENT_LINE_PATTERN = re.compile(
+    r'^\s*(1st|first|2nd|second|3rd|third|4th|fourth)[\s-]*line\b([^:]*)(?::\s*(.*))?$',
+    re.IGNORECASE
+)
+TREATMENT_LINE_RANKS = {
+    "1st": 1, "first": 1, "2nd": 2, "second": 2, "3rd": 3, "third": 3, "4th": 4, "fourth": 4
+}
+
+# Headings inside a condition's text that do not name a new condition
+GENERIC_HEADING_PATTERN = re.compile(
+    r'^\s*(non[\s-]?)?(pharmacological|drug|medical|supportive|specific|general)?\s*'
+    r'(treatment|management|therapy|dosage|doses|referral|notes?|objectives?)\b',
+    re.IGNORECASE
+)
+
+# Cues that a short line is a drug or dosing line rather than a heading
+DOSING_LINE_PATTERN = re.compile(
+    r'\d|\b(mg|mcg|ml|g|iu|units?|tablets?|tabs?|capsules?|orally|oral|iv|im|daily|hourly|stat|'
+    r'weekly|days?|weeks?|dose|apply|cream|ointment)\b|^\s*(or|and|plus|with|\+|-|•)\b',
+    re.IGNORECASE
+)
+
+PARENTHESIS_PATTERN = re.compile(r'\s*\([^)]*\)')
+
+def normalize_condition(name):
+    """Normalize a condition name for lookups: lowercase, single spaces, no trailing punctuation."""
+    return " ".join(name.lower().split()).strip(" .:;-")
+
+def condition_keys(name):
+    """Get the lookup keys of a condition name, with and without its parenthesised parts."""
+    keys = [normalize_condition(name)]
+    without_parentheses = normalize_condition(PARENTHESIS_PATTERN.sub("", name))
+    if without_parentheses and without_parentheses not in keys:
+        keys.append(without_parentheses)
+    return keys
+
+def is_dosing_line(line):
+    """Check whether a line reads as part of a treatment (a drug, dose or continuation) rather than a heading."""
+    stripped = line.strip()
+    return bool(stripped) and (stripped[0].islower() or DOSING_LINE_PATTERN.search(stripped) is not None)
+
+def match_treatment_line(line):
+    """
+    Check whether a line starts a numbered treatment line block.
+
+    Returns:
+        tuple: (rank, label, inline text or None), or None for other lines
+    """
+    match = TREATMENT_LINE_PATTERN.match(line)
+    if not match:
+        return None
+    rank = TREATMENT_LINE_RANKS[match.group(1).lower()]
+    label = f"{match.group(1)} line{match.group(2)}".strip(" -")
+    inline_text = (match.group(3) or "").strip() or None
+    return rank, label, inline_text
+
+class TreatmentIndex:
+    """
+    Treatment lines and dosing tables of a document, by condition.
+
+    entries is a list of {"condition", "chapter", "section", "treatment_lines",
+    "tables"} dicts in document order, where treatment_lines is a list of
+    {"rank", "label", "lines"} dicts and tables a list of row lists of cell
+    texts. The entries are plain JSON data, so they can be stored in snapshots.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.keys = {}
+        for entry_id, entry in enumerate(entries):
+            for key in condition_keys(entry["condition"]):
+                # The first occurrence of a condition in the document wins
+                self.keys.setdefault(key, entry_id)
+
+    @classmethod
+    def build(cls, content, tables=()):
+        """
+        Extract the treatment lines and tables of a document.
+
+        The condition of a block is the closest chapter or section heading
+        before it, skipping generic headings such as "Treatment". Inside a
+        treatment line block, short lines count as part of the block as long
+        as they read like drug or dosing lines; anything else ends the block.
+
+        Args:
+            content (list): document lines
+            tables (list): (number of lines before the table, rows) pairs
+        """
+        entries = []
+        entries_by_heading = {}
+        tables_by_position = {}
+        for position, rows in tables:
+            tables_by_position.setdefault(position, []).append(rows)
+
+        chapter = None
+        section = None
+        current_block = None
+
+        def current_entry():
+            heading = (chapter, section)
+            if heading not in entries_by_heading:
+                entries_by_heading[heading] = {
+                    "condition": section or chapter,
+                    "chapter": chapter,
+                    "section": section,
+                    "treatment_lines": [],
+                    "tables": []
+                }
+                entries.append(entries_by_heading[heading])
+            return entries_by_heading[heading]
+
+        for line_id, line in enumerate(content):
+            for rows in tables_by_position.get(line_id, []):
+                if chapter:
+                    current_entry()["tables"].append(rows)
+
+            treatment_line = match_treatment_line(line) if chapter else None
+            if treatment_line:
+                rank, label, inline_text = treatment_line
+                current_block = {"rank": rank, "label": label, "lines": [inline_text] if inline_text else []}
+                current_entry()["treatment_lines"].append(current_block)
+                continue
+
+            kind, value = classify_line(line, bool(chapter))
+            if kind == "chapter":
+                chapter, section, current_block = value, None, None
+            elif kind == "section" and not (current_block is not None and is_dosing_line(line)):
+                current_block = None
+                # Short dosing lines and generic headings are not new conditions
+                if not is_dosing_line(line) and not GENERIC_HEADING_PATTERN.match(line):
+                    section = line
+            elif kind is not None and current_block is not None:
+                current_block["lines"].append(line)
+
+        for rows in tables_by_position.get(len(content), []):
+            if chapter:
+                current_entry()["tables"].append(rows)
+
+        entries = [entry for entry in entries if entry["treatment_lines"] or entry["tables"]]
+        logger.info(f"Indexed the treatment lines and tables of {len(entries)} conditions")
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, condition):
+        """Get the treatment entry of a condition by name, ignoring case and parenthesised parts, or None."""
+        for key in condition_keys(condition):
+            entry_id = self.keys.get(key)
+            if entry_id is not None:
+                return self.entries[entry_id]
+        return None
+
+def format_treatment(entry):
+    """
+    Render a treatment entry as text, one treatment line block after another.
+
+    Returns:
+        str: the treatment text, or None if the entry has nothing to show
+    """
+    blocks = []
+    for treatment_line in sorted(entry["treatment_lines"], key=lambda block: block["rank"]):
+        label = treatment_line["label"]
+        if label.lower().endswith("line"):
+            label += " treatment"
+        blocks.append("\n".join([f"{label}:"] + treatment_line["lines"]))
+    for rows in entry["tables"]:
+        blocks.append("\n".join(" | ".join(cells) for cells in rows))
+    return "\n\n".join(blocks) or None
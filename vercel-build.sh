@@ -43,7 +43,14 @@ echo "✓ Copied to /tmp/attached_assets/"
 echo "Installing Python requirements..."
 pip install -r requirements.txt
 
+# Parse, chunk and index the guideline documents once at build time, so cold
+# starts memory-map the artifact instead of loading the .docx
+echo "Building prebuilt guideline corpus..."
+python build_corpus.py --output attached_assets/guideline_corpus.corpus
+echo "✓ Built attached_assets/guideline_corpus.corpus"
+
 echo "===== Build process completed! ====="
 echo "Document placed in the following locations:"
 echo "- .vercel/output/static/attached_assets/pharmacy_guide.docx (for URL access)"
-echo "- /tmp/attached_assets/pharmacy_guide.docx (for direct filesystem access)"
\ No newline at end of file
+echo "- /tmp/attached_assets/pharmacy_guide.docx (for direct filesystem access)"
+echo "Prebuilt corpus loaded at startup: attached_assets/guideline_corpus.corpus"
\ No newline at end of file